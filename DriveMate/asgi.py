@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'DriveMate.settings')
 
 application = get_asgi_application()
+
+# build per-process matching structures before the first request
+from rides.matching import warm_up  # noqa: E402
+
+warm_up()
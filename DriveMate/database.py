@@ -0,0 +1,176 @@
+"""
+Database configuration: builds DATABASES entries from a DATABASE_URL (see the Database block
+in settings) and routes marked read-only views to the optional "replica" alias.
+"""
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+import dj_database_url
+
+
+logger = logging.getLogger(__name__)
+
+REPLICA_ALIAS = "replica"
+
+
+# Run on every new SQLite connection. WAL lets readers carry on while a writer commits,
+# NORMAL sync only fsyncs at checkpoints (durable across app crashes under WAL), busy_timeout
+# makes a writer queue for the lock instead of failing, mmap serves reads from the page cache.
+SQLITE_PRAGMAS = {
+    "journal_mode": "wal",
+    "synchronous": "normal",
+    "busy_timeout": 5000,  # ms
+    "mmap_size": 128 * 1024 * 1024,
+}
+
+
+def database_config(url, conn_max_age=600, pool_size=0, sqlite_pragmas=SQLITE_PRAGMAS):
+    """
+    A DATABASES entry for `url` (postgres://..., sqlite:///...). Connections are kept for
+    `conn_max_age` seconds and checked before reuse. For Postgres, `pool_size` > 0 switches
+    to Django's connection pool (psycopg 3 with psycopg_pool) instead of persistent connections.
+    """
+    config = dj_database_url.parse(url, conn_max_age=conn_max_age, conn_health_checks=conn_max_age > 0)
+    options = config.setdefault("OPTIONS", {})
+    if config["ENGINE"] == "django.db.backends.sqlite3":
+        options["init_command"] = ";".join(f"PRAGMA {name}={value}" for name, value in sqlite_pragmas.items())
+        # take the write lock at BEGIN: a transaction that reads before it writes would otherwise
+        # fail at once with "database is locked" when another writer got in first, busy_timeout or not
+        options["transaction_mode"] = "IMMEDIATE"
+    elif config["ENGINE"] == "django.db.backends.postgresql" and pool_size:
+        # pooled connections go back to the pool after each request, which rules out CONN_MAX_AGE
+        options["pool"] = {"min_size": min(2, pool_size), "max_size": pool_size, "timeout": 10}
+        config["CONN_MAX_AGE"] = 0
+    return config
+
+
+# --- read replica ---------------------------------------------------------
+
+_replica_reads = contextvars.ContextVar("drivemate_replica_reads", default=False)
+# set per request by ReplicaPinMiddleware; the router marks it when the request writes
+request_db_state = contextvars.ContextVar("drivemate_request_db_state", default=None)
+
+
+class RequestDBState:
+    def __init__(self, pinned=False):
+        self.pinned = pinned  # the user wrote recently: read from the primary
+        self.wrote = False
+
+
+@contextmanager
+def use_replica():
+    """Let reads inside the block go to the replica (when one is configured and fresh enough)."""
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def replica_reads(view_func):
+    """
+    View decorator: GET/HEAD requests read from the replica; anything else stays on the primary.
+    A TemplateResponse is rendered before leaving the block, since its querysets only run then.
+    """
+    @wraps(view_func)
+    def _wrapped(request, *args, **kwargs):
+        if request.method not in ("GET", "HEAD"):
+            return view_func(request, *args, **kwargs)
+        with use_replica():
+            response = view_func(request, *args, **kwargs)
+            if callable(getattr(response, "render", None)) and not response.is_rendered:
+                response.render()
+            return response
+    return _wrapped
+
+
+class ReplicaLagMonitor:
+    """
+    Decides whether the replica is fresh enough to read from: at most REPLICA_MAX_LAG seconds
+    behind. The lag is measured at most every REPLICA_LAG_CHECK_INTERVAL seconds per process;
+    a replica that cannot be reached counts as too far behind until the next check.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checked_at = float("-inf")
+        self._usable = False
+
+    def usable(self):
+        from django.conf import settings
+
+        if REPLICA_ALIAS not in settings.DATABASES:
+            return False
+        now = time.monotonic()
+        if now - self._checked_at < getattr(settings, "REPLICA_LAG_CHECK_INTERVAL", 5.0):
+            return self._usable
+        with self._lock:
+            if now - self._checked_at >= getattr(settings, "REPLICA_LAG_CHECK_INTERVAL", 5.0):
+                lag = self.lag()
+                self._usable = lag is not None and lag <= getattr(settings, "REPLICA_MAX_LAG", 10.0)
+                if not self._usable:
+                    logger.warning(
+                        "Reading from the primary: replica lag is %s", "unknown" if lag is None else f"{lag:.1f}s"
+                    )
+                self._checked_at = now
+        return self._usable
+
+    def lag(self):
+        """Seconds the replica is behind the primary, or None when it cannot be asked."""
+        from django.db import DatabaseError, connections
+
+        connection = connections[REPLICA_ALIAS]
+        if connection.vendor != "postgresql":
+            return 0.0  # no replication to measure (e.g. a mirror of the primary)
+        try:
+            with connection.cursor() as cursor:
+                # caught up (or not a standby at all) counts as 0; replay timestamps alone
+                # would grow while the primary is simply idle
+                cursor.execute(
+                    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+                )
+                return float(cursor.fetchone()[0])
+        except DatabaseError:
+            logger.exception("Replica lag check failed")
+            return None
+
+
+replica_monitor = ReplicaLagMonitor()
+
+
+class ReplicaRouter:
+    """
+    Sends reads to the replica only inside use_replica()/replica_reads, and only while the
+    replica is fresh, the request's user has no recent write pinned to the primary and no
+    transaction is open on the primary. Sessions and every write use "default".
+    """
+
+    def db_for_read(self, model, **hints):
+        from django.db import connections
+
+        # sessions are written on every login, so a replica may not have the one being read yet
+        if not _replica_reads.get() or model._meta.app_label == "sessions":
+            return None
+        state = request_db_state.get()
+        if state is not None and state.pinned:
+            return None
+        if connections["default"].in_atomic_block or not replica_monitor.usable():
+            return None
+        return REPLICA_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = request_db_state.get()
+        if state is not None:
+            state.wrote = True
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # the replica holds the same rows as the primary
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA_ALIAS
@@ -0,0 +1,85 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from .database import REPLICA_ALIAS, RequestDBState, request_db_state
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoiseMiddleware that also runs natively under ASGI.
+
+    WhiteNoise is sync-only, and one sync-only middleware makes Django run the chain of
+    every request on a single shared thread, which serialises the async views. Static
+    files are looked up in memory, so they can be answered straight from the event loop.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = self.find_file(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
+
+
+class ReplicaPinMiddleware:
+    """
+    Read-your-writes for the replica router: once a request writes to the primary, the browser
+    gets a short-lived cookie that keeps its reads on the primary for REPLICA_PIN_SECONDS, so
+    users see their own changes even while the replica catches up. Does nothing without a replica.
+    """
+
+    sync_capable = True
+    async_capable = True
+    cookie_name = "drivemate_primary"
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = REPLICA_ALIAS in settings.DATABASES
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+        state = RequestDBState(pinned=self.cookie_name in request.COOKIES)
+        token = request_db_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            request_db_state.reset(token)
+        return self._pin(state, response)
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+        state = RequestDBState(pinned=self.cookie_name in request.COOKIES)
+        token = request_db_state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            request_db_state.reset(token)
+        return self._pin(state, response)
+
+    def _pin(self, state, response):
+        if state.wrote:
+            max_age = getattr(settings, "REPLICA_PIN_SECONDS", 15)
+            response.set_cookie(self.cookie_name, "1", max_age=max_age, httponly=True, samesite="Lax")
+        return response
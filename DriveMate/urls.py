@@ -34,8 +34,10 @@ urlpatterns = [
     
     path('my-trips/', my_trips, name='my_trips'),
     path('trip/<int:ride_id>/', trip_detail, name='trip_detail'),
+    path('trip/<int:ride_id>/events/', trip_events, name='trip_events'),
     
     path("driver/requests/", driver_requests_list, name="driver_requests_list"),
+    path("driver/requests/events/", driver_request_events, name="driver_request_events"),
     path("driver/requests/<int:pk>/", driver_request_detail, name="driver_request_detail"),
     path("driver/requests/<int:pk>/accept/", accept_ride_request, name="accept_ride_request"),
     path("ride-request/<int:pk>/distance/", ride_request_distance, name="ride_request_distance"),
@@ -56,6 +58,8 @@ urlpatterns = [
     path('driver/payment-history/', driver_payment_history, name='driver_payment_history'),
     
     path("api/driver/toggle-availability/", api_toggle_driver_availability, name="api_toggle_availability"),
+    path("api/driver/location/", api_driver_location_ping, name="api_driver_location_ping"),
+    path("api/rides/<int:ride_id>/tracking/", api_ride_tracking, name="api_ride_tracking"),
     
     path('dashboard/', AdminDashboardView.as_view(), name='admin_dashboard'),
     path('revenue/', AdminRevenueView.as_view(), name='admin-revenue'),
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'DriveMate.settings')
 
 application = get_wsgi_application()
+
+# build per-process matching structures before the first request
+from rides.matching import warm_up  # noqa: E402
+
+warm_up()
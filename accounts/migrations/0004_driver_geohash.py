@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:32
+
+from django.db import migrations, models
+
+
+def backfill_geohash(apps, schema_editor):
+    from rides.utils import geohash_encode
+
+    Driver = apps.get_model("accounts", "Driver")
+    drivers = Driver.objects.filter(latitude__isnull=False, longitude__isnull=False)
+    for driver in drivers.only("id", "latitude", "longitude").iterator():
+        Driver.objects.filter(pk=driver.pk).update(
+            geohash=geohash_encode(driver.latitude, driver.longitude)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_auto_20250830_1045'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='driver',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=12),
+        ),
+        migrations.RunPython(backfill_geohash, migrations.RunPython.noop),
+    ]
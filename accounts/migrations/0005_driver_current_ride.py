@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-16 21:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_current_ride(apps, schema_editor):
+    Driver = apps.get_model("accounts", "Driver")
+    Ride = apps.get_model("rides", "Ride")
+    # accepted or ongoing rides that have not been ended; newest first, so a driver left
+    # with several by the old unguarded acceptance keeps their latest one
+    active = (
+        Ride.objects.filter(status__in=["accepted", "ongoing"], end_time__isnull=True, driver__isnull=False)
+        .order_by("-start_time", "-pk")
+        .values_list("driver_id", "pk")
+    )
+    assigned = {}
+    for driver_id, ride_id in active.iterator():
+        assigned.setdefault(driver_id, ride_id)
+    for driver_id, ride_id in assigned.items():
+        Driver.objects.filter(pk=driver_id).update(current_ride_id=ride_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_driver_geohash'),
+        ('rides', '0009_riderequest_status_requested_at_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='driver',
+            name='current_ride',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='rides.ride'),
+        ),
+        migrations.RunPython(backfill_current_ride, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='driver',
+            constraint=models.UniqueConstraint(condition=models.Q(('current_ride__isnull', False)), fields=('current_ride',), name='unique_driver_current_ride'),
+        ),
+    ]
@@ -48,12 +48,17 @@ class Driver(models.Model):
     verified = models.BooleanField(default=False)
     background_check_passed = models.BooleanField(default=False)
     rating = models.FloatField(default=0.0)
+    # running totals of received Rating scores, bumped with F() as ratings arrive; rating is their average
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
     is_available = models.BooleanField(default=True)
     profile_pic = models.FileField(upload_to='driver_profile/', null=True, blank=True)
     id_proof = models.FileField(upload_to='id_proofs/', null=True, blank=True)
     last_location = models.CharField(max_length=255,null=True, blank=True)
     latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    # geohash of (latitude, longitude); prefix ranges over it drive nearby-driver search
+    geohash = models.CharField(max_length=12, blank=True, default="", db_index=True, editable=False)
 
     day_fixed_charge = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal("0.00"),
                                            help_text="Fixed charge for daytime (6:00–18:00)")
@@ -63,8 +68,39 @@ class Driver(models.Model):
     night_start = models.TimeField(default=_time(hour=18, minute=0))
     night_end = models.TimeField(default=_time(hour=6, minute=0))
 
+    # the ride this driver is committed to, from acceptance until it ends or is cancelled/reopened
+    # (rides.acceptance keeps it in step); "is this driver busy?" reads this column, not the ride tables
+    current_ride = models.ForeignKey(
+        "rides.Ride", on_delete=models.SET_NULL, null=True, blank=True, related_name="+", editable=False
+    )
+
+    class Meta:
+        constraints = [
+            # a ride is never any other driver's current ride as well
+            models.UniqueConstraint(
+                fields=["current_ride"], condition=Q(current_ride__isnull=False), name="unique_driver_current_ride"
+            ),
+        ]
+
     def __str__(self):
         return f"Driver: {self.user.name} ({'Verified' if self.verified else 'Pending'})"
+
+    def save(self, *args, **kwargs):
+        from rides.utils import geohash_encode
+
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = geohash_encode(self.latitude, self.longitude)
+        else:
+            self.geohash = ""
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"latitude", "longitude"} & set(update_fields):
+            kwargs["update_fields"] = set(update_fields) | {"geohash"}
+        super().save(*args, **kwargs)
+
+    @property
+    def average_rating(self):
+        return self.rating_sum / self.rating_count if self.rating_count else None
+
     def set_availability(self, value: bool):
         self.is_available = bool(value)
         self.save(update_fields=["is_available"])
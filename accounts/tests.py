@@ -1,3 +1,72 @@
+import json
+from unittest import mock
+
+from django.db.models import F
 from django.test import TestCase
+from django.urls import reverse
+
+from .models import Driver, User
+
+
+class RideTrackingValidationTests(TestCase):
+    def setUp(self):
+        user = User.objects.create(
+            name="Driver", email="driver@example.com", phone="+919900000001", password="!", role="driver",
+        )
+        Driver.objects.create(user=user, license_number="LIC1")
+        session = self.client.session
+        session["user_id"] = user.id
+        session["user_role"] = user.role
+        session.save()
+
+    def post_point(self, body):
+        return self.client.post(
+            reverse("api_ride_tracking", args=[1]), body, content_type="application/json",
+        )
+
+    def point(self, **fields):
+        return {"latitude": 10.0, "longitude": 76.3, "timestamp": 1700000000.0, **fields}
+
+    def test_speed_and_heading_must_fit_their_columns(self):
+        for fields in ({"speed_kmph": 10000}, {"heading_deg": -99999.5}, {"speed_kmph": 9999.999}):
+            with self.subTest(**fields):
+                response = self.post_point(json.dumps({"points": [self.point(**fields)]}))
+                self.assertEqual(response.status_code, 400)
+
+    def test_non_finite_values_are_rejected(self):
+        for literal in ("NaN", "Infinity", "-Infinity"):
+            with self.subTest(literal):
+                body = '{"points": [{"latitude": 10.0, "longitude": 76.3, "timestamp": 1700000000.0, "speed_kmph": %s}]}'
+                self.assertEqual(self.post_point(body % literal).status_code, 400)
+
+    def test_valid_point_passes_validation(self):
+        # no ongoing ride with this id, so a valid batch gets as far as the ride lookup
+        response = self.post_point(json.dumps({"points": [self.point(speed_kmph=9999.99, heading_deg=359.5)]}))
+        self.assertEqual(response.status_code, 404)
+
+
+class DriverProfileEditTests(TestCase):
+    def test_edit_keeps_rating_totals_committed_meanwhile(self):
+        user = User.objects.create(
+            name="Driver", email="driver@example.com", phone="+919900000001", password="!", role="driver",
+        )
+        driver = Driver.objects.create(user=user, license_number="LIC1")
+        session = self.client.session
+        session["user_id"] = user.id
+        session["user_role"] = user.role
+        session.save()
+        real_save = Driver.save
+
+        def rated_then_save(instance, *args, **kwargs):
+            # a rating commits after the view loaded the driver, before it saves
+            Driver.objects.filter(pk=instance.pk).update(rating_sum=F("rating_sum") + 4, rating_count=F("rating_count") + 1)
+            return real_save(instance, *args, **kwargs)
+
+        with mock.patch.object(Driver, "save", rated_then_save):
+            self.client.post(reverse("driver_profile_edit"), {
+                "name": "Driver", "email": user.email, "phone": user.phone, "experience_years": "7",
+            })
 
-# Create your tests here.
+        driver.refresh_from_db()
+        self.assertEqual(driver.experience_years, 7)
+        self.assertEqual((driver.rating_sum, driver.rating_count), (4, 1))
@@ -1,12 +1,13 @@
-from datetime import datetime
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from datetime import datetime, timezone as dt_timezone
 import json
+import math
 from django.http import HttpResponseForbidden, JsonResponse,HttpResponseBadRequest
 from django.shortcuts import render, redirect
 from django.contrib import messages
 from django.utils import timezone
 from decimal import Decimal
 from django.views.decorators.http import require_GET,require_POST
-import requests
 from django.views.decorators.http import require_http_methods
 from rides.models import Ride, RideRequest
 from .models import User, Driver as DriverModel
@@ -14,9 +15,17 @@ from vehicles.models import Vehicle, VehicleImage
 from django.db import IntegrityError, transaction
 from django.core.files.storage import FileSystemStorage
 from django.contrib.auth.hashers import check_password,make_password
-from rides.utils import haversine_distance
+from rides.functions import rating_average
+from rides.utils import trace_metrics
+from rides.events import (
+    driver_channel, event_stream_response, publish_ride_position, publish_ride_status,
+)
+from rides.acceptance import AcceptConflict, accept_request, release_driver
+from rides.ingest import driver_locations, ride_tracking
+from rides.presence import forget_driver, record_heartbeat
+from routing import aroute
 from django.db.models import Q
-from django.db.models import Avg, Count, Prefetch
+from django.db.models import F, Prefetch
 
 def health_check(request):
     return JsonResponse({"status": "ok"})
@@ -46,15 +55,24 @@ def model(request):
 
 def login_required_role(allowed_roles=None):
     def decorator(view_func):
-        def _wrapped(request, *args, **kwargs):
-            uid = request.session.get('user_id')
-            role = request.session.get('user_role')
+        def denied(request, uid, role):
             if not uid:
                 return redirect('login')
             if allowed_roles and role not in allowed_roles:
                 messages.error(request, "You don't have permission to view that page.")
                 return redirect('login')
-            return view_func(request, *args, **kwargs)
+            return None
+
+        if iscoroutinefunction(view_func):
+            # async views must not touch the session synchronously
+            async def _wrapped(request, *args, **kwargs):
+                response = denied(request, await request.session.aget('user_id'), await request.session.aget('user_role'))
+                return response or await view_func(request, *args, **kwargs)
+            return _wrapped
+
+        def _wrapped(request, *args, **kwargs):
+            response = denied(request, request.session.get('user_id'), request.session.get('user_role'))
+            return response or view_func(request, *args, **kwargs)
         return _wrapped
     return decorator
 
@@ -149,11 +167,8 @@ def customer_dashboard(request):
     top_n = 6
     top_vehicles_qs = (
         Vehicle.objects.filter(active=True)
-        .annotate(
-            avg_score=Avg('ratings__score'),
-            ratings_count=Count('ratings')
-        )
-        .filter(ratings_count__gt=0)
+        .filter(rating_count__gt=0)
+        .annotate(avg_score=rating_average(), ratings_count=F('rating_count'))
         .order_by('-avg_score', '-ratings_count')
         .prefetch_related(
             Prefetch('images', queryset=VehicleImage.objects.all(), to_attr='all_images')
@@ -168,8 +183,8 @@ def customer_dashboard(request):
 
     top_drivers_qs = (
         Driver.objects
-        .annotate(avg_score=Avg('received_ratings__score'), ratings_count=Count('received_ratings'))
-        .filter(ratings_count__gt=0)                       # only drivers with >=1 rating
+        .filter(rating_count__gt=0)                        # only drivers with >=1 rating
+        .annotate(avg_score=rating_average(), ratings_count=F('rating_count'))
         .order_by('-avg_score', '-ratings_count')[:top_n]  # top N by avg then count
         .select_related('user')                            # so driver.user.name / user fields are cheap
         .prefetch_related(
@@ -204,19 +219,7 @@ def driver_dashboard(request):
         .order_by("-requested_at")
     )
 
-    # --- determine if driver currently has an active ride (best-effort) ---
-    has_active_ride = False
-    try:
-        # Prefer canonical enum if available (Ride.Status.ACTIVE)
-        if hasattr(Ride, "Status") and hasattr(Ride.Status, "ACTIVE"):
-            has_active_ride = Ride.objects.filter(driver=driver, status=Ride.Status.ACTIVE).exists()
-        else:
-            # fallback: check a few common status strings
-            has_active_ride = Ride.objects.filter(driver=driver, status__in=["active", "ongoing", "in_progress"]).exists()
-    except Exception:
-        # If Ride model differs in your app, fall back safely to False
-        has_active_ride = False
-
+    # current_ride rides along on the driver row, so "busy?" costs no query
     return render(
         request,
         "driver_home.html",
@@ -224,7 +227,7 @@ def driver_dashboard(request):
             "user": user,
             "driver": driver,
             "ride_requests": pending_requests,
-            "has_active_ride": has_active_ride,
+            "has_active_ride": driver.current_ride_id is not None,
         },
     )
 
@@ -442,7 +445,7 @@ def driver_register(request):
 
 from decimal import Decimal
 from datetime import datetime
-from django.shortcuts import render, redirect, get_object_or_404
+from django.shortcuts import aget_object_or_404, render, redirect, get_object_or_404
 from django.urls import reverse
 from django.contrib import messages
 from django.utils import timezone
@@ -635,7 +638,11 @@ def driver_profile_edit(request):
         if id_proof:
             driver.id_proof = id_proof
 
-        driver.save()
+        # only the edited columns: rating totals and current_ride change concurrently through F() updates
+        driver.save(update_fields=[
+            "license_number", "license_expiry", "experience_years", "day_fixed_charge", "night_fixed_charge",
+            "night_start", "night_end", "profile_pic", "id_proof",
+        ])
         messages.success(request, "Driver profile updated.")
         return redirect(reverse("driver_profile"))
 
@@ -653,20 +660,32 @@ def driver_requests_list(request):
         "ride", "ride__customer", "ride__purpose", "ride__vehicle"
     ).order_by("-requested_at")
 
-    # check if driver already has an active ride
-    has_active_ride = RideRequest.objects.filter(
-        driver=driver,
-        status=RideRequest.Status.ACCEPTED,
-        ride__status__in=[Ride.Status.REQUESTED, Ride.Status.ACCEPTED, Ride.Status.ONGOING],
-    ).exists()
-
     context = {
         "driver": driver,
         "ride_requests": requests_qs,
-        "has_active_ride": has_active_ride,
+        "has_active_ride": driver.current_ride_id is not None,
     }
     return render(request, "ride_requests_list.html", context)
 
+
+@login_required_role(allowed_roles=["driver"])
+async def driver_request_events(request):
+    """
+    Server-sent events for the driver's inbox (dashboard and requests list):
+      event: request_created    data: { "request_id", "ride_id", "ride_mode", "start_location", "end_location", "start_time" }
+      event: request_cancelled  data: { "request_id", "ride_id", "status", "status_display" }
+      event: resync             data: {}   # events were dropped; reload the list
+    """
+    driver_id = await request.session.aget("driver_id")
+    if driver_id is None:
+        driver_id = await DriverModel.objects.filter(
+            user_id=await request.session.aget("user_id")
+        ).values_list("id", flat=True).afirst()
+        if driver_id is None:
+            return JsonResponse({"error": "Driver profile not found"}, status=404)
+        await request.session.aset("driver_id", driver_id)
+    return event_stream_response(request, driver_channel(driver_id))
+
 from payments.models import Payment
 @login_required_role(allowed_roles=["driver"])
 def driver_request_detail(request, pk):
@@ -707,127 +726,72 @@ def accept_ride_request(request, pk):
     if ride_request.driver_id != driver.id:
         return HttpResponseForbidden("You are not allowed to accept this request.")
 
-    with transaction.atomic():
-        # lock the ride row
-        ride = Ride.objects.select_for_update().get(pk=ride_request.ride.pk)
-        # re-lock the ride_request row
-        ride_request = (
-            RideRequest.objects.select_for_update()
-            .select_related("driver", "ride")
-            .get(pk=pk)
-        )
+    # cheap pre-checks for a clear message; accept_request() re-checks them atomically
+    if driver.current_ride_id is not None:
+        messages.error(request, "You already have an active ride. Complete it before accepting another.")
+        return redirect("driver_requests_list")
 
-        # ✅ extra check: prevent driver from having multiple active rides
-        active_exists = RideRequest.objects.filter(
-            driver=driver,
-            status=RideRequest.Status.ACCEPTED,
-            ride__status__in=[Ride.Status.REQUESTED, Ride.Status.ACCEPTED, Ride.Status.ONGOING],
-        ).exclude(pk=ride_request.pk).exists()
-
-        if active_exists:
-            messages.error(request, "You already have an active ride. Complete it before accepting another.")
-            return redirect("driver_requests_list")
-
-        # check ride status
-        if ride.status != Ride.Status.REQUESTED:
-            messages.error(request, "This ride is no longer available (already accepted/cancelled).")
-            return redirect("driver_requests_list")
-
-        if ride_request.status != RideRequest.Status.PENDING:
-            messages.error(request, "This request is no longer pending.")
-            return redirect("driver_requests_list")
-
-        # --- VEHICLE handling for CAR_WITH_DRIVER mode ---
-        vehicle = None
-        if ride.ride_mode == Ride.Mode.CAR_WITH_DRIVER:
-            vehicle_id = request.POST.get("vehicle_id")
-            if vehicle_id:
-                # lock the vehicle row to avoid race conditions
-                try:
-                    vehicle = Vehicle.objects.select_for_update().get(pk=vehicle_id)
-                except Vehicle.DoesNotExist:
-                    messages.error(request, "Selected vehicle not found.")
-                    return redirect("driver_requests_list")
-
-                # ensure this vehicle is actually assigned to this driver
-                if vehicle.current_driver_id != driver.id:
-                    messages.error(request, "Selected vehicle is not assigned to you.")
-                    return redirect("driver_requests_list")
-
-                # optional checks: active/verified
-                if not vehicle.active:
-                    messages.error(request, "Selected vehicle is not active.")
-                    return redirect("driver_requests_list")
-                if not vehicle.verified:
-                    messages.error(request, "Selected vehicle is not verified.")
-                    return redirect("driver_requests_list")
-            else:
-                # try to auto-select the driver's currently assigned active & verified vehicle
-                vehicle = (
-                    Vehicle.objects.select_for_update()
-                    .filter(current_driver=driver, active=True, verified=True)
-                    .first()
-                )
-                if not vehicle:
-                    messages.error(
-                        request,
-                        "No active/verified vehicle assigned to you. Please select a vehicle to accept this ride."
-                    )
-                    return redirect("driver_requests_list")
+    ride = ride_request.ride
+    if ride.status != Ride.Status.REQUESTED:
+        messages.error(request, "This ride is no longer available (already accepted/cancelled).")
+        return redirect("driver_requests_list")
 
-        ride_request.status = RideRequest.Status.ACCEPTED
-        ride_request.responded_at = timezone.now()
-        ride_request.save()
+    if ride_request.status != RideRequest.Status.PENDING:
+        messages.error(request, "This request is no longer pending.")
+        return redirect("driver_requests_list")
 
-        # assign driver to ride (and vehicle if needed)
-        ride.driver = driver
-        if vehicle:
-            ride.vehicle = vehicle
+    # --- VEHICLE handling for CAR_WITH_DRIVER mode ---
+    vehicle = None
+    if ride.ride_mode == Ride.Mode.CAR_WITH_DRIVER:
+        vehicle_id = request.POST.get("vehicle_id")
+        if vehicle_id:
+            try:
+                vehicle = Vehicle.objects.get(pk=vehicle_id)
+            except Vehicle.DoesNotExist:
+                messages.error(request, "Selected vehicle not found.")
+                return redirect("driver_requests_list")
+
+            # ensure this vehicle is actually assigned to this driver
+            if vehicle.current_driver_id != driver.id:
+                messages.error(request, "Selected vehicle is not assigned to you.")
+                return redirect("driver_requests_list")
+
+            # optional checks: active/verified
+            if not vehicle.active:
+                messages.error(request, "Selected vehicle is not active.")
+                return redirect("driver_requests_list")
+            if not vehicle.verified:
+                messages.error(request, "Selected vehicle is not verified.")
+                return redirect("driver_requests_list")
         else:
-            # ensure we don't accidentally keep some old vehicle if this is DRIVER_ONLY
-            if ride.ride_mode == Ride.Mode.DRIVER_ONLY:
-                ride.vehicle = None
-        ride.status = Ride.Status.ACCEPTED
-        ride.save()
+            # try to auto-select the driver's currently assigned active & verified vehicle
+            vehicle = Vehicle.objects.filter(current_driver=driver, active=True, verified=True).first()
+            if not vehicle:
+                messages.error(
+                    request,
+                    "No active/verified vehicle assigned to you. Please select a vehicle to accept this ride."
+                )
+                return redirect("driver_requests_list")
 
-        # cancel other pending requests for same ride
-        now = timezone.now()
-        RideRequest.objects.filter(ride=ride).exclude(pk=ride_request.pk).filter(
-            status=RideRequest.Status.PENDING
-        ).update(status=RideRequest.Status.AUTO_CANCELLED, responded_at=now)
+    try:
+        # vehicle stays None for DRIVER_ONLY, clearing any old vehicle on the ride
+        accept_request(ride_request, driver, vehicle)
+    except AcceptConflict as e:
+        messages.error(request, str(e))
+        return redirect("driver_requests_list")
 
     messages.success(request, "Ride accepted. Other driver requests have been cancelled.")
     return redirect(reverse("driver_request_detail", args=[ride_request.pk]))
 
 
-def calculate_distance_osrm(lat1: float, lon1: float, lat2: float, lon2: float, timeout=5):
-    """
-    Query the OSRM demo server for driving distance & duration.
-    Returns (distance_km, duration_min, source) or (None, None, None) on failure.
-    """
-    try:
-        url = f"http://router.project-osrm.org/route/v1/driving/{lon1},{lat1};{lon2},{lat2}"
-        params = {"overview": "false", "alternatives": "false", "steps": "false"}
-        r = requests.get(url, params=params, timeout=timeout)
-        r.raise_for_status()
-        data = r.json()
-        if data.get("code") == "Ok" and data.get("routes"):
-            route = data["routes"][0]
-            distance_km = float(route["distance"]) / 1000.0
-            duration_min = float(route["duration"]) / 60.0  # seconds → minutes
-            return distance_km, duration_min, "osrm"
-        return None, None, None
-    except Exception:
-        return None, None, None
-
-
 @require_GET
 @login_required_role(allowed_roles=["driver"])
-def ride_request_distance(request, pk):
+async def ride_request_distance(request, pk):
     """
     JSON endpoint returning distance & duration for a RideRequest.
+    Async so a slow routing backend holds no worker thread while it answers.
     """
-    ride_request = get_object_or_404(RideRequest.objects.select_related("ride"), pk=pk)
+    ride_request = await aget_object_or_404(RideRequest.objects.select_related("ride"), pk=pk)
     ride = ride_request.ride
 
     lat1, lon1 = ride.start_latitude, ride.start_longitude
@@ -847,13 +811,9 @@ def ride_request_distance(request, pk):
             status=400,
         )
 
-    # Try OSRM
-    dist_km, duration_min, source = calculate_distance_osrm(lat1f, lon1f, lat2f, lon2f)
-    if dist_km is None:
-        # fallback: haversine for distance, no realistic duration (you could estimate avg speed)
-        dist_km = haversine_distance(lat1f, lon1f, lat2f, lon2f)
-        duration_min = dist_km / 40 * 60  # assume 40 km/h avg if no OSRM (very rough)
-        source = "haversine"
+    # Try the configured routing backend (settings.ROUTING); when it cannot answer
+    # (or its circuit is open) fall back to haversine at an assumed average speed
+    dist_km, duration_min, source = await aroute(lat1f, lon1f, lat2f, lon2f, fallback=True)
 
     return JsonResponse({
         "status": "ok",
@@ -907,6 +867,7 @@ def set_ride_request_ongoing(request, pk):
 
         ride_request.save()
         ride.save()
+        publish_ride_status(ride, request_status=(ride_request.pk, ride_request.status))
 
         return JsonResponse({
             'success': True,
@@ -924,17 +885,20 @@ def set_ride_request_ongoing(request, pk):
         return JsonResponse({'error': 'An unexpected error occurred.'}, status=500)
 
 @login_required_role(allowed_roles=["driver"])
-def end_ride_request(request, pk):
+async def end_ride_request(request, pk):
     if request.method != 'POST':
         return JsonResponse({'error': 'Invalid method'}, status=405)
 
     try:
-        uid = request.session.get("user_id")
+        uid = await request.session.aget("user_id")
         if not uid:
             return JsonResponse({'error': 'User not authenticated'}, status=401)
 
-        driver = get_object_or_404(DriverModel, user__pk=uid)
-        ride_request = get_object_or_404(RideRequest, pk=pk, driver=driver)
+        driver = await aget_object_or_404(DriverModel, user__pk=uid)
+        # calculate_fare() reads the ride's driver and vehicle, so load them up front
+        ride_request = await aget_object_or_404(
+            RideRequest.objects.select_related("ride__driver", "ride__vehicle"), pk=pk, driver=driver
+        )
 
         ride = ride_request.ride
         if not ride:
@@ -960,12 +924,24 @@ def end_ride_request(request, pk):
         if not (ride.start_latitude and ride.start_longitude and ride.end_latitude and ride.end_longitude):
             raise ValidationError("Start and end coordinates are required to calculate distance and duration.")
 
-        distance_km, duration_min, _ = calculate_distance_osrm(
-            float(ride.start_latitude), float(ride.start_longitude),
-            float(ride.end_latitude), float(ride.end_longitude)
-        )
-        if distance_km is None or duration_min is None:
-            raise ValidationError("Failed to calculate distance and duration using OSRM.")
+        # measure the path actually driven from the ride's GPS trace (flushing buffered points first);
+        # only a trace too sparse to trust falls back to routing start -> end. Points still buffered
+        # by other workers (at most RIDE_TRACKING_FLUSH_INTERVAL seconds' worth) are not in it yet.
+        await sync_to_async(ride_tracking.flush_ride)(ride.id)
+        trace = [
+            point async for point in
+            ride.tracking_points.order_by("timestamp").values_list("latitude", "longitude", "timestamp")
+        ]
+        metrics = trace_metrics(*zip(*trace)) if trace else None
+        if metrics is not None:
+            distance_km, duration_min = metrics
+        else:
+            distance_km, duration_min, _ = await aroute(
+                ride.start_latitude, ride.start_longitude,
+                ride.end_latitude, ride.end_longitude
+            )
+            if distance_km is None or duration_min is None:
+                raise ValidationError("Failed to calculate distance and duration using the routing backend.")
 
         ride.actual_distance_km = Decimal(str(distance_km)).quantize(Decimal('0.01'))
         ride.actual_duration_min = int(duration_min)
@@ -987,8 +963,10 @@ def end_ride_request(request, pk):
         ride.tax_amount = ride.base_fare * Decimal('0.05')
         ride.total_amount = ride.base_fare + ride.tax_amount - ride.discount_amount
 
-        ride.save()
-        ride_request.save()
+        await ride.asave()
+        await ride_request.asave()
+        await sync_to_async(release_driver)(ride.id)
+        await sync_to_async(publish_ride_status)(ride)
 
         return JsonResponse({
             'success': True,
@@ -1043,5 +1021,106 @@ def api_toggle_driver_availability(request):
     # update and save
     driver.is_available = new_state
     driver.save(update_fields=["is_available"])
+    # only location pings start the presence TTL: the web app sends none, so a heartbeat here
+    # would expire and take the driver offline. Going offline drops any earlier heartbeat.
+    if not new_state:
+        forget_driver(driver.id)
 
     return JsonResponse({"success": True, "is_available": driver.is_available})
+
+
+@login_required_role(allowed_roles=["driver"])
+@require_http_methods(["POST"])
+def api_driver_location_ping(request):
+    """
+    POST JSON body:
+      { "latitude": 10.01, "longitude": 76.3, "recorded_at": 1700000000.0 }   # recorded_at (epoch seconds) optional
+
+    Pings are coalesced in memory (latest per driver) and written in periodic bulk updates.
+    Response (202):
+      { "success": True }
+    """
+    try:
+        body = json.loads(request.body.decode("utf-8")) if request.body else {}
+        lat = float(body["latitude"])
+        lon = float(body["longitude"])
+        recorded_at = float(body["recorded_at"]) if body.get("recorded_at") is not None else None
+    except (json.JSONDecodeError, KeyError, TypeError, ValueError):
+        return JsonResponse({"error": "latitude and longitude are required numbers"}, status=400)
+
+    if not (-90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0):
+        return JsonResponse({"error": "Coordinates out of range"}, status=400)
+
+    # cache the driver id in the session so a ping costs no query beyond the session load
+    driver_id = request.session.get("driver_id")
+    if driver_id is None:
+        driver_id = DriverModel.objects.filter(user_id=request.session.get("user_id")).values_list("id", flat=True).first()
+        if driver_id is None:
+            return JsonResponse({"error": "Driver profile not found"}, status=404)
+        request.session["driver_id"] = driver_id
+
+    driver_locations.add(driver_id, lat, lon, recorded_at)
+    record_heartbeat(driver_id)
+    return JsonResponse({"success": True}, status=202)
+
+
+MAX_TRACKING_POINTS_PER_REQUEST = 500
+
+
+@login_required_role(allowed_roles=["driver"])
+@require_http_methods(["POST"])
+def api_ride_tracking(request, ride_id):
+    """
+    POST JSON body with a batch of GPS points for one of the driver's ongoing rides:
+      { "points": [ { "latitude": 10.01, "longitude": 76.3, "timestamp": 1700000000.0,
+                      "speed_kmph": 32.5, "heading_deg": 270 }, ... ] }   # speed/heading optional
+
+    Points are buffered and stored as RideTracking rows in bulk.
+    Response (202):
+      { "success": True, "accepted": <number of points> }
+    """
+    try:
+        body = json.loads(request.body.decode("utf-8")) if request.body else {}
+        raw_points = body["points"]
+        if not isinstance(raw_points, list) or not raw_points:
+            raise ValueError
+        points = []
+        for p in raw_points[:MAX_TRACKING_POINTS_PER_REQUEST]:
+            point = {
+                "latitude": float(p["latitude"]),
+                "longitude": float(p["longitude"]),
+                "timestamp": datetime.fromtimestamp(float(p["timestamp"]), tz=dt_timezone.utc),
+                "speed_kmph": _optional_decimal(p.get("speed_kmph")),
+                "heading_deg": _optional_decimal(p.get("heading_deg")),
+            }
+            if not (-90.0 <= point["latitude"] <= 90.0 and -180.0 <= point["longitude"] <= 180.0):
+                raise ValueError
+            points.append(point)
+    except (json.JSONDecodeError, KeyError, TypeError, ValueError, OverflowError, ArithmeticError):
+        return JsonResponse({"error": "points must be a non-empty list of valid GPS points"}, status=400)
+
+    driver = get_object_or_404(DriverModel, user__pk=request.session.get("user_id"))
+    if not Ride.objects.filter(pk=ride_id, driver=driver, status=Ride.Status.ONGOING).exists():
+        return JsonResponse({"error": "No ongoing ride with this id is assigned to you."}, status=404)
+
+    ride_tracking.add(ride_id, points)
+    # the freshest point doubles as a location ping for matching
+    latest = max(points, key=lambda p: p["timestamp"])
+    driver_locations.add(driver.id, latest["latitude"], latest["longitude"], latest["timestamp"].timestamp())
+    publish_ride_position(ride_id, latest["latitude"], latest["longitude"], latest["timestamp"])
+    record_heartbeat(driver.id)
+
+    return JsonResponse({"success": True, "accepted": len(points)}, status=202)
+
+
+def _optional_decimal(value):
+    # speed/heading are DecimalField(6, 2): reject what the buffered bulk insert could not store
+    if value is None:
+        return None
+    value = float(value)
+    if not math.isfinite(value):
+        raise ValueError
+    value = Decimal(str(value)).quantize(Decimal("0.01"))
+    if abs(value) >= 10000:
+        raise ValueError
+    return value
@@ -0,0 +1,39 @@
+import math
+
+from django.contrib.gis.db.models.functions import Distance
+
+from .models import point_or_none
+
+
+# Search radii tried around the pickup before giving up and returning everything.
+SEARCH_RADII_KM = (2, 5, 15, 50, 200)
+
+
+def _radius_degrees(radius_km, lat):
+    # geometry columns are in WGS84 degrees; widen for longitude shrinkage so dwithin never undershoots
+    return radius_km / (111.32 * max(math.cos(math.radians(float(lat))), 0.01))
+
+
+def gis_candidates(queryset, lat, lon, desired, driver_path=""):
+    """
+    Nearest objects of `queryset` filtered, annotated (`gis_distance`) and ordered by
+    distance inside the database, using the spatial index through `dwithin`.
+    Only the top `desired` rows of the first radius that yields enough are fetched.
+    """
+    pickup = point_or_none(lat, lon)
+    if pickup is None:
+        return list(queryset)
+
+    field = f"{driver_path}geometry__point"
+    for radius_km in SEARCH_RADII_KM:
+        nearby_qs = (
+            queryset
+            .filter(**{f"{field}__dwithin": (pickup, _radius_degrees(radius_km, lat))})
+            .annotate(gis_distance=Distance(field, pickup))
+            .order_by("gis_distance")[:desired]
+        )
+        candidates = list(nearby_qs)
+        if len(candidates) >= desired:
+            return candidates
+
+    return list(queryset)
@@ -0,0 +1,59 @@
+import django.contrib.gis.db.models.fields
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_geometry(apps, schema_editor):
+    from django.contrib.gis.geos import Point
+
+    Driver = apps.get_model("accounts", "Driver")
+    Ride = apps.get_model("rides", "Ride")
+    DriverGeometry = apps.get_model("geo", "DriverGeometry")
+    RideGeometry = apps.get_model("geo", "RideGeometry")
+
+    def point(lat, lon):
+        return None if lat is None or lon is None else Point(float(lon), float(lat), srid=4326)
+
+    drivers = Driver.objects.filter(latitude__isnull=False, longitude__isnull=False)
+    DriverGeometry.objects.bulk_create(
+        (DriverGeometry(driver_id=d.id, point=point(d.latitude, d.longitude))
+         for d in drivers.only("id", "latitude", "longitude").iterator()),
+        batch_size=500,
+    )
+    rides = Ride.objects.only("id", "start_latitude", "start_longitude", "end_latitude", "end_longitude")
+    RideGeometry.objects.bulk_create(
+        (RideGeometry(ride_id=r.id,
+                      start_point=point(r.start_latitude, r.start_longitude),
+                      end_point=point(r.end_latitude, r.end_longitude))
+         for r in rides.iterator()),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('accounts', '0004_driver_geohash'),
+        ('rides', '0006_alter_riderequest_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DriverGeometry',
+            fields=[
+                ('driver', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='geometry', serialize=False, to='accounts.driver')),
+                ('point', django.contrib.gis.db.models.fields.PointField(srid=4326)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RideGeometry',
+            fields=[
+                ('ride', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='geometry', serialize=False, to='rides.ride')),
+                ('start_point', django.contrib.gis.db.models.fields.PointField(blank=True, null=True, srid=4326)),
+                ('end_point', django.contrib.gis.db.models.fields.PointField(blank=True, null=True, srid=4326)),
+            ],
+        ),
+        migrations.RunPython(backfill_geometry, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+from django.contrib.gis.db import models
+
+
+# Geometry lives in side tables so the core apps keep working without GDAL/GEOS;
+# this app is only installed when settings.USE_GIS is on.
+
+class DriverGeometry(models.Model):
+    driver = models.OneToOneField(
+        "accounts.Driver", on_delete=models.CASCADE, primary_key=True, related_name="geometry"
+    )
+    point = models.PointField(srid=4326, spatial_index=True)
+
+    def __str__(self):
+        return f"Driver #{self.driver_id} @ {self.point.y:.6f},{self.point.x:.6f}"
+
+
+class RideGeometry(models.Model):
+    ride = models.OneToOneField(
+        "rides.Ride", on_delete=models.CASCADE, primary_key=True, related_name="geometry"
+    )
+    start_point = models.PointField(srid=4326, null=True, blank=True, spatial_index=True)
+    end_point = models.PointField(srid=4326, null=True, blank=True, spatial_index=True)
+
+    def __str__(self):
+        return f"Ride #{self.ride_id} geometry"
+
+
+def point_or_none(lat, lon):
+    from django.contrib.gis.geos import Point
+
+    if lat is None or lon is None:
+        return None
+    return Point(float(lon), float(lat), srid=4326)
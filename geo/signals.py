@@ -0,0 +1,36 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from accounts.models import Driver
+from rides.ingest import driver_locations_flushed
+from rides.models import Ride
+from .models import DriverGeometry, RideGeometry, point_or_none
+
+
+@receiver(post_save, sender=Driver)
+def sync_driver_geometry(sender, instance, **kwargs):
+    point = point_or_none(instance.latitude, instance.longitude)
+    if point is None:
+        DriverGeometry.objects.filter(driver=instance).delete()
+    else:
+        DriverGeometry.objects.update_or_create(driver=instance, defaults={"point": point})
+
+
+@receiver(driver_locations_flushed)
+def sync_flushed_driver_geometry(sender, locations, **kwargs):
+    # buffered location pings are written with a plain UPDATE, which sends no post_save
+    DriverGeometry.objects.bulk_create(
+        [DriverGeometry(driver_id=driver_id, point=point_or_none(lat, lon)) for driver_id, lat, lon in locations],
+        batch_size=500, update_conflicts=True, unique_fields=["driver"], update_fields=["point"],
+    )
+
+
+@receiver(post_save, sender=Ride)
+def sync_ride_geometry(sender, instance, **kwargs):
+    RideGeometry.objects.update_or_create(
+        ride=instance,
+        defaults={
+            "start_point": point_or_none(instance.start_latitude, instance.start_longitude),
+            "end_point": point_or_none(instance.end_latitude, instance.end_longitude),
+        },
+    )
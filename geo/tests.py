@@ -0,0 +1,50 @@
+from decimal import Decimal
+from unittest import skipUnless
+
+from django.apps import apps
+from django.db.models import Q
+from django.test import TestCase, override_settings
+
+from accounts.models import Driver, User
+from rides.ingest import DriverLocationBuffer
+from rides.matching import candidate_pool
+
+
+def make_driver(n, lat, lon=76.3):
+    user = User.objects.create(
+        name=f"Driver {n}", email=f"driver{n}@example.com", phone=f"+9199000{n:05d}", password="!", role="driver",
+    )
+    return Driver.objects.create(
+        user=user, license_number=f"LIC{n}", verified=True, background_check_passed=True,
+        latitude=Decimal(str(lat)), longitude=Decimal(str(lon)),
+    )
+
+
+# GeoDjango needs GDAL/GEOS and SpatiaLite (or PostGIS); run with DRIVEMATE_USE_GIS=1 where they exist.
+@skipUnless(apps.is_installed("geo"), "geo app not installed (DRIVEMATE_USE_GIS unset)")
+@override_settings(DRIVER_MATCHING_BACKEND="gis")
+class GisMatchingTests(TestCase):
+    def test_geometry_follows_saves_and_buffered_pings(self):
+        from .models import DriverGeometry
+
+        driver = make_driver(1, 10.0)
+        point = DriverGeometry.objects.get(driver=driver).point
+        self.assertEqual((point.y, point.x), (10.0, 76.3))
+
+        buffer = DriverLocationBuffer(flush_interval=3600)
+        buffer.add(driver.id, 10.2, 76.4)
+        buffer.flush()
+        point = DriverGeometry.objects.get(driver=driver).point
+        self.assertEqual((point.y, point.x), (10.2, 76.4))
+
+    def test_candidates_are_found_and_ordered_in_the_database(self):
+        from .matching import gis_candidates
+
+        far, near, mid = make_driver(1, 10.3), make_driver(2, 10.01), make_driver(3, 10.1)
+        candidates = gis_candidates(Driver.objects.all(), 10.0, 76.3, 2)
+        self.assertEqual(candidates, [near, mid])
+        self.assertLess(candidates[0].gis_distance.km, candidates[1].gis_distance.km)
+
+        pool = candidate_pool(Driver.objects.all(), Q(is_available=True), 10.0, 76.3, 2)
+        self.assertEqual(pool[:2], [near, mid])
+        self.assertAlmostEqual(pool[0].distance, 1.11, places=2)
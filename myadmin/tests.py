@@ -1,3 +1,38 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.test import TransactionTestCase
+from django.urls import reverse
+
+from DriveMate.database import REPLICA_ALIAS, ReplicaRouter
+from accounts.models import User
+from rides.models import Ride
+
+
+class ReplicaReadsTests(TransactionTestCase):
+    def setUp(self):
+        customer = User.objects.create(
+            name="Customer", email="customer@example.com", phone="+919800000001", password="!", role="customer",
+        )
+        Ride.objects.create(customer=customer, start_location="Kochi", end_location="Aluva")
+        session = self.client.session
+        session["user_role"] = "admin"
+        session.save()
+
+    def test_rides_list_page_reads_from_the_replica(self):
+        # record the alias each read is routed to while still running it on the primary
+        decided = []
+        route = ReplicaRouter.db_for_read
+
+        def spy(router, model, **hints):
+            decided.append((model, route(router, model, **hints)))
+            return None
+
+        with mock.patch("DriveMate.database.replica_monitor.usable", return_value=True), \
+                mock.patch.object(ReplicaRouter, "db_for_read", spy):
+            response = self.client.get(reverse("admin-rides-list"))
+
+        self.assertContains(response, "Kochi")
+        ride_reads = [alias for model, alias in decided if model is Ride]
+        # the COUNT and the page SELECT, which only runs when the template renders
+        self.assertGreaterEqual(len(ride_reads), 2)
+        self.assertEqual(set(ride_reads), {REPLICA_ALIAS})
@@ -6,7 +6,10 @@ from django.http import HttpResponseRedirect
 from django.utils import timezone
 from datetime import timedelta
 from decimal import Decimal
-from django.db.models import Q, Sum, Count, Avg
+from django.db.models import F, Q, Sum, Count, Avg
+from django.utils.decorators import method_decorator
+from DriveMate.database import replica_reads
+from rides.functions import rating_average
 
 from .permissions import IsAdmin  # Assuming you have a mixin or decorator for admin check
 from accounts.models import User, Driver
@@ -20,6 +23,7 @@ class AdminRequiredMixin:
             return HttpResponseRedirect('/')  # Or login URL
         return super().dispatch(request, *args, **kwargs)
 
+@method_decorator(replica_reads, name="dispatch")
 class AdminDashboardView(AdminRequiredMixin, TemplateView):
     template_name = 'dashboard.html'
 
@@ -37,7 +41,8 @@ class AdminDashboardView(AdminRequiredMixin, TemplateView):
         total_revenue = Ride.objects.filter(status=Ride.Status.COMPLETED).aggregate(
             total=Sum('total_amount')
         )['total'] or Decimal('0.00')
-        avg_rating = Rating.objects.aggregate(avg=Avg('score'))['avg'] or 0.0
+        rating_totals = Driver.objects.aggregate(total=Sum('rating_sum'), count=Sum('rating_count'))
+        avg_rating = rating_totals['total'] / rating_totals['count'] if rating_totals['count'] else 0.0
         pending_verifications_drivers = Driver.objects.filter(verified=False).count()
         pending_verifications_vehicles = Vehicle.objects.filter(verified=False).count()
         active_subscriptions = Subscription.objects.filter(active=True).count()
@@ -49,12 +54,12 @@ class AdminDashboardView(AdminRequiredMixin, TemplateView):
         # Advanced metrics
         top_drivers = Driver.objects.annotate(
             total_rides=Count('rides', filter=Q(rides__status=Ride.Status.COMPLETED)),
-            avg_rating=Avg('received_ratings__score')
+            avg_rating=rating_average()
         ).filter(total_rides__gt=0).order_by('-total_rides')[:5]
 
         top_vehicles = Vehicle.objects.annotate(
             total_rides=Count('rides', filter=Q(rides__status=Ride.Status.COMPLETED)),
-            avg_rating=Avg('ratings__score')
+            avg_rating=rating_average()
         ).filter(total_rides__gt=0).order_by('-total_rides')[:5]
 
         revenue_trend = [
@@ -92,6 +97,7 @@ class AdminDashboardView(AdminRequiredMixin, TemplateView):
         })
         return context
 
+@method_decorator(replica_reads, name="dispatch")
 class AdminRevenueView(AdminRequiredMixin, TemplateView):
     template_name = 'revenue.html'
 
@@ -116,6 +122,7 @@ class AdminRevenueView(AdminRequiredMixin, TemplateView):
         }
         return context
 
+@method_decorator(replica_reads, name="dispatch")
 class AdminRidesListView(AdminRequiredMixin, ListView):
     model = Ride
     template_name = 'rides_list.html'
@@ -151,6 +158,7 @@ class AdminRidesListView(AdminRequiredMixin, ListView):
         context['ride_status_choices'] = Ride.Status.choices
         return context
 
+@method_decorator(replica_reads, name="dispatch")
 class AdminUserManagementView(AdminRequiredMixin, ListView):
     model = User
     template_name = 'users_management.html'
@@ -159,8 +167,8 @@ class AdminUserManagementView(AdminRequiredMixin, ListView):
 
     def get_queryset(self):
         users = User.objects.annotate(
-            avg_rating=Avg('driver_profile__received_ratings__score'),
-            total_ratings=Count('driver_profile__received_ratings')
+            avg_rating=rating_average('driver_profile__'),
+            total_ratings=F('driver_profile__rating_count')
         ).select_related('driver_profile')
         role_filter = self.request.GET.get('role')
         if role_filter:
@@ -172,11 +180,9 @@ class AdminUserManagementView(AdminRequiredMixin, ListView):
         # Enhance with ratings data
         for user in context['users']:
             if hasattr(user, 'driver_profile') and user.driver_profile:
-                ratings = Rating.objects.filter(driver=user.driver_profile).aggregate(
-                    avg_score=Avg('score'), total=Count('id')
-                )
-                user.avg_rating = ratings['avg_score'] or 0
-                user.total_ratings = ratings['total'] or 0
+                # avg_rating / total_ratings come from the stored totals annotated in get_queryset
+                user.avg_rating = user.avg_rating or 0
+                user.total_ratings = user.total_ratings or 0
                 user.recent_feedback = [
                     {'score': r.score, 'feedback': r.feedback[:100] + '...' if r.feedback else None}
                     for r in Rating.objects.filter(driver=user.driver_profile).order_by('-created_at')[:3]
@@ -11,6 +11,8 @@ from django.utils import timezone
 from django.contrib import messages
 from django.db.models import Sum
 from .models import  Payment
+from DriveMate.database import replica_reads
+from rides.acceptance import release_driver
 from rides.models import Ride, RideRequest
 
 
@@ -96,6 +98,7 @@ def create_transaction(request):
 
     # Simulate provider-specific payloads:
     ride.save()
+    release_driver(ride.pk)
     upi_deeplink = f"upi://pay?pa=merchant@upi&pn=Ride+Payment&am={amount_dec}&cu=INR&tr={payment.id}"
     response = {
         'tx_id': payment.id,
@@ -134,6 +137,7 @@ def finalize_transaction(request):
 
 
 @login_required_role(allowed_roles=['customer'])
+@replica_reads
 def customer_payment_history(request):
     uid = request.session.get('user_id')  # get logged-in customer ID
     payments = Payment.objects.filter(customer_id=uid).order_by('-created_at')
@@ -146,6 +150,7 @@ def customer_payment_history(request):
 
 # View for Driver Payment History
 @login_required_role(allowed_roles=['driver'])
+@replica_reads
 def driver_payment_history(request):
     try:
         # Get the driver's profile
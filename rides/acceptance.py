@@ -0,0 +1,59 @@
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.models import Driver
+from .events import publish_requests_cancelled, publish_ride_status
+from .models import Ride, RideRequest
+
+
+class AcceptConflict(Exception):
+    """The ride or the request changed before this acceptance could claim it."""
+
+
+def accept_request(ride_request, driver, vehicle=None):
+    """
+    Accept `ride_request` for `driver` (with `vehicle` for car-with-driver rides) and
+    auto-cancel the ride's other pending requests. Returns the updated Ride.
+
+    Optimistic rather than locking: the ride is claimed with one
+    UPDATE ... WHERE status='requested', the driver with one
+    UPDATE ... WHERE current_ride IS NULL and the request with one
+    UPDATE ... WHERE status='pending'. Concurrent acceptances of the same ride queue on
+    the ride row only for the length of this short transaction; whoever commits first
+    matches one row, everyone after matches none and gets AcceptConflict.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        claimed = Ride.objects.filter(pk=ride_request.ride_id, status=Ride.Status.REQUESTED).update(
+            driver=driver, vehicle=vehicle, status=Ride.Status.ACCEPTED, updated_at=now
+        )
+        if not claimed:
+            raise AcceptConflict("This ride is no longer available (already accepted/cancelled).")
+        # raising rolls the earlier claims back with it
+        if not Driver.objects.filter(pk=driver.pk, current_ride__isnull=True).update(current_ride=ride_request.ride_id):
+            raise AcceptConflict("You already have an active ride. Complete it before accepting another.")
+        # the request can still have expired or been withdrawn since the driver opened it
+        accepted = RideRequest.objects.filter(
+            pk=ride_request.pk, driver=driver, status=RideRequest.Status.PENDING
+        ).update(status=RideRequest.Status.ACCEPTED, responded_at=now)
+        if not accepted:
+            raise AcceptConflict("This request is no longer pending.")
+        driver.current_ride_id = ride_request.ride_id
+
+        others = RideRequest.objects.filter(ride_id=ride_request.ride_id, status=RideRequest.Status.PENDING)
+        cancelled = list(others.values_list("pk", "ride_id", "driver_id"))
+        others.filter(pk__in=[pk for pk, _, _ in cancelled]).update(
+            status=RideRequest.Status.AUTO_CANCELLED, responded_at=now
+        )
+
+        ride = Ride.objects.select_related("driver__user", "vehicle").get(pk=ride_request.ride_id)
+        publish_ride_status(
+            ride, request_status=(ride_request.pk, RideRequest.Status.ACCEPTED), driver_name=driver.user.name
+        )
+        publish_requests_cancelled(cancelled, RideRequest.Status.AUTO_CANCELLED)
+    return ride
+
+
+def release_driver(ride_id):
+    """Free whichever driver has `ride_id` as their current ride (ended, cancelled or reopened)."""
+    return Driver.objects.filter(current_ride=ride_id).update(current_ride=None)
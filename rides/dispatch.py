@@ -0,0 +1,129 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Value
+from django.utils import timezone
+
+from accounts.models import Driver
+from vehicles.models import Vehicle
+from .events import publish_requests_created
+from .functions import Haversine
+from .models import Ride, RideRequest
+from .presence import online_filter
+
+
+logger = logging.getLogger(__name__)
+
+
+def eligible_drivers(ride, radius_km, limit):
+    """
+    Up to `limit` drivers within `radius_km` of the pickup, closest first, who could take
+    `ride` and have not been asked for it yet. Car-with-driver rides need a driver with an
+    active, verified vehicle assigned. Drivers already on a ride (current_ride) or whose
+    presence heartbeat expired are skipped.
+    """
+    drivers = Driver.objects.filter(
+        is_available=True,
+        current_ride__isnull=True,
+        verified=True,
+        background_check_passed=True,
+        latitude__isnull=False,
+        longitude__isnull=False,
+    ).exclude(
+        Exists(RideRequest.objects.filter(ride=ride, driver=OuterRef("pk")))
+    )
+    if ride.female_driver_preference:
+        drivers = drivers.filter(user__gender="female")
+    if ride.ride_mode == Ride.Mode.CAR_WITH_DRIVER:
+        drivers = drivers.filter(
+            Exists(Vehicle.objects.filter(current_driver=OuterRef("pk"), active=True, verified=True))
+        )
+    # over-fetch so drivers dropped by the presence check can be replaced
+    nearest = list(
+        drivers.annotate(
+            distance=Haversine(
+                Value(float(ride.start_latitude)), Value(float(ride.start_longitude)),
+                F("latitude"), F("longitude"),
+            )
+        ).filter(distance__lte=radius_km).order_by("distance", "pk")[:2 * limit]
+    )
+    online = online_filter(driver.pk for driver in nearest)
+    return [driver for driver in nearest if driver.pk in online][:limit]
+
+
+def dispatch_round(ride_id):
+    """
+    Run the next dispatch round of a ride: request the DISPATCH_BATCH_SIZE nearest eligible
+    drivers within that round's radius (DISPATCH_RADII_KM) in one bulk_create, and schedule
+    the following round DISPATCH_ROUND_SECONDS later. Rounds that find nobody new widen
+    straight away. Returns the number of requests created.
+    """
+    radii = getattr(settings, "DISPATCH_RADII_KM", (2, 5, 10, 25))
+    with transaction.atomic():
+        ride = Ride.objects.select_for_update().get(pk=ride_id)
+        if not ride.auto_dispatch or ride.status != Ride.Status.REQUESTED or ride.next_dispatch_at is None:
+            return 0
+        if ride.start_latitude is None or ride.start_longitude is None:
+            ride.next_dispatch_at = None
+            ride.save(update_fields=["next_dispatch_at"])
+            return 0
+
+        created = 0
+        while ride.dispatch_round < len(radii) and not created:
+            radius_km = radii[ride.dispatch_round]
+            drivers = eligible_drivers(ride, radius_km, getattr(settings, "DISPATCH_BATCH_SIZE", 5))
+            # unique_together (ride, driver) stays the guard against a concurrent manual request
+            requested_at = timezone.now()
+            RideRequest.objects.bulk_create(
+                [RideRequest(ride=ride, driver=driver, requested_at=requested_at) for driver in drivers],
+                ignore_conflicts=True,
+            )
+            # with ignore_conflicts bulk_create returns every object passed in, skipped ones included,
+            # and leaves pks unset: read back the rows this round actually inserted
+            inserted = list(RideRequest.objects.filter(
+                ride=ride, driver__in=drivers, requested_at=requested_at
+            ).values_list("pk", "driver_id"))
+            created = len(inserted)
+            if created:
+                publish_requests_created(ride, inserted)
+            ride.dispatch_round += 1
+            logger.info("Ride #%s dispatch round %s (%s km): %s requests", ride.pk, ride.dispatch_round, radius_km, created)
+
+        if created:
+            ride.next_dispatch_at = timezone.now() + timedelta(seconds=getattr(settings, "DISPATCH_ROUND_SECONDS", 30))
+        else:
+            ride.next_dispatch_at = None  # every radius tried; the customer can still pick drivers by hand
+            logger.info("Ride #%s dispatch exhausted after %s rounds", ride.pk, ride.dispatch_round)
+        ride.save(update_fields=["dispatch_round", "next_dispatch_at"])
+        return created
+
+
+def start_auto_dispatch(ride):
+    """Switch a requested ride to auto-dispatch and run its first round now."""
+    now = timezone.now()
+    updated = Ride.objects.filter(pk=ride.pk, status=Ride.Status.REQUESTED, auto_dispatch=False).update(
+        auto_dispatch=True, dispatch_round=0, dispatch_started_at=now, next_dispatch_at=now
+    )
+    if not updated:
+        return None
+    return dispatch_round(ride.pk)
+
+
+def run_due_dispatches(limit=100):
+    """Run the next round of every auto-dispatched ride whose acceptance window has passed."""
+    due = list(
+        Ride.objects.filter(
+            auto_dispatch=True,
+            status=Ride.Status.REQUESTED,
+            next_dispatch_at__lte=timezone.now(),
+        ).order_by("next_dispatch_at").values_list("pk", flat=True)[:limit]
+    )
+    created = 0
+    for ride_id in due:
+        try:
+            created += dispatch_round(ride_id)
+        except Exception:
+            logger.exception("Dispatch round failed for ride #%s", ride_id)
+    return len(due), created
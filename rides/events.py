@@ -0,0 +1,169 @@
+"""
+In-process event broker for server-sent events (SSE).
+
+Views publish small JSON events to a channel (e.g. "driver:42") after their transaction
+commits; every open event stream on that channel in the same process receives them.
+Streams need an ASGI server (uvicorn DriveMate.asgi:application). Events published by
+another process, such as the dispatch_rides or expire_ride_requests commands, only reach
+streams served by that process.
+"""
+import asyncio
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.http import HttpResponse, StreamingHttpResponse
+
+from .models import RideRequest
+
+
+logger = logging.getLogger(__name__)
+
+
+class EventBroker:
+    """
+    Fans published events out to per-subscriber asyncio queues. publish() is thread-safe and
+    may be called from sync views; each event is handed to its subscriber's event loop.
+    A subscriber that falls `max_queue` events behind is sent a single "resync" event instead.
+    """
+
+    def __init__(self, max_queue=100):
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._channels = {}  # channel -> {(loop, queue)}
+
+    def publish(self, channel, event, data):
+        with self._lock:
+            subscribers = list(self._channels.get(channel, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._offer, queue, (event, data))
+            except RuntimeError:
+                pass  # that subscriber's loop has closed; its stream is gone
+        return len(subscribers)
+
+    @staticmethod
+    def _offer(queue, message):
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(("resync", {}))
+
+    def subscriber_count(self, channel):
+        return len(self._channels.get(channel, ()))
+
+    async def listen(self, channel, keepalive=15.0):
+        """Yield (event, data) for `channel` as published, or None after `keepalive` idle seconds."""
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue(self.max_queue))
+        with self._lock:
+            self._channels.setdefault(channel, set()).add(subscriber)
+        try:
+            while True:
+                try:
+                    yield await asyncio.wait_for(subscriber[1].get(), keepalive)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            with self._lock:
+                subscribers = self._channels.get(channel)
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._channels[channel]
+
+
+broker = EventBroker()
+
+
+def driver_channel(driver_id):
+    return f"driver:{driver_id}"
+
+
+def ride_channel(ride_id):
+    return f"ride:{ride_id}"
+
+
+def publish_on_commit(channel, event, data):
+    """Publish once the current transaction commits (immediately in autocommit mode)."""
+    transaction.on_commit(lambda: broker.publish(channel, event, data))
+
+
+def publish_requests_created(ride, requests):
+    """Tell each driver about their new RideRequest; `requests` holds (request_id, driver_id) pairs."""
+    for request_id, driver_id in requests:
+        publish_on_commit(driver_channel(driver_id), "request_created", {
+            "request_id": request_id,
+            "ride_id": ride.pk,
+            "ride_mode": ride.ride_mode,
+            "start_location": ride.start_location,
+            "end_location": ride.end_location,
+            "start_time": ride.start_time,
+        })
+
+
+def publish_requests_cancelled(requests, status):
+    """
+    Tell each driver a RideRequest was withdrawn, and the ride's trip page that the request
+    changed; `requests` holds (request_id, ride_id, driver_id).
+    """
+    for request_id, ride_id, driver_id in requests:
+        data = _request_status(request_id, ride_id, status)
+        publish_on_commit(driver_channel(driver_id), "request_cancelled", data)
+        publish_on_commit(ride_channel(ride_id), "request_status", data)
+
+
+def publish_ride_status(ride, request_status=None, **extra):
+    """
+    Send the ride's current status (and fare once known) to its trip page. `request_status`
+    is the driver request that caused the transition, as (request_id, status).
+    """
+    data = {
+        "ride_id": ride.pk,
+        "status": ride.status,
+        "status_display": ride.get_status_display(),
+        "total_amount": ride.total_amount,
+        **extra,
+    }
+    publish_on_commit(ride_channel(ride.pk), "status", data)
+    if request_status is not None:
+        request_id, status = request_status
+        publish_on_commit(ride_channel(ride.pk), "request_status", _request_status(request_id, ride.pk, status))
+
+
+def _request_status(request_id, ride_id, status):
+    return {
+        "request_id": request_id,
+        "ride_id": ride_id,
+        "status": status,
+        "status_display": RideRequest.Status(status).label,
+    }
+
+
+def publish_ride_position(ride_id, lat, lon, at):
+    """Send the driver's latest position on an ongoing ride to its trip page."""
+    broker.publish(ride_channel(ride_id), "position", {"latitude": lat, "longitude": lon, "at": at})
+
+
+async def _encode_events(channel):
+    yield b"retry: 5000\n\n"
+    async for message in broker.listen(channel, getattr(settings, "EVENT_STREAM_KEEPALIVE", 15.0)):
+        if message is None:
+            yield b": keepalive\n\n"
+        else:
+            event, data = message
+            yield f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n".encode()
+
+
+def event_stream_response(request, channel):
+    """A text/event-stream response for `channel`; 204 (which tells EventSource to stop) under WSGI."""
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    response = StreamingHttpResponse(_encode_events(channel), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # stop nginx from buffering the stream
+    return response
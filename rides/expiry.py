@@ -0,0 +1,52 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .events import publish_requests_cancelled
+from .models import RideRequest
+
+
+logger = logging.getLogger(__name__)
+
+
+def expire_pending_requests(max_age=None, batch_size=500):
+    """
+    Auto-cancel RideRequests left PENDING for longer than `max_age` seconds
+    (RIDE_REQUEST_MAX_PENDING_SECONDS by default).
+
+    Works in batches of `batch_size`: each batch reads the oldest stale ids through the
+    (status, requested_at) index and cancels them with one UPDATE that re-checks the
+    status, so a request accepted in the meantime is left alone. Only the rows that UPDATE
+    changed (re-read by their new status and timestamp) get a cancel event. Returns the
+    number expired.
+    """
+    if max_age is None:
+        max_age = getattr(settings, "RIDE_REQUEST_MAX_PENDING_SECONDS", 15 * 60)
+    cutoff = timezone.now() - timedelta(seconds=max_age)
+    stale = RideRequest.objects.filter(status=RideRequest.Status.PENDING, requested_at__lt=cutoff)
+
+    expired = 0
+    while True:
+        batch = list(stale.order_by("requested_at").values_list("pk", "ride_id", "driver_id")[:batch_size])
+        if not batch:
+            break
+        ids = [pk for pk, _, _ in batch]
+        now = timezone.now()
+        with transaction.atomic():
+            updated = stale.filter(pk__in=ids).update(status=RideRequest.Status.AUTO_CANCELLED, responded_at=now)
+            if updated:
+                cancelled = set(RideRequest.objects.filter(
+                    pk__in=ids, status=RideRequest.Status.AUTO_CANCELLED, responded_at=now
+                ).values_list("pk", flat=True))
+                publish_requests_cancelled(
+                    [row for row in batch if row[0] in cancelled], RideRequest.Status.AUTO_CANCELLED
+                )
+            expired += updated
+        if len(batch) < batch_size:
+            break
+    if expired:
+        logger.info("Expired %d pending ride requests older than %ss", expired, max_age)
+    return expired
@@ -0,0 +1,62 @@
+import math
+
+from django.db.backends.signals import connection_created
+from django.db.models import F, FloatField, Func
+from django.db.models.functions import Cast, NullIf
+from django.dispatch import receiver
+
+from .utils import EARTH_RADIUS_KM
+
+
+SQLITE_HAVERSINE = "DRIVEMATE_HAVERSINE"
+
+
+class Haversine(Func):
+    """
+    Great-circle distance in km between (lat1, lon1) and (lat2, lon2), computed by the database.
+
+    SQLite calls a Python function registered on each new connection; other backends
+    (Postgres, MySQL) evaluate the formula with their native math functions.
+    NULL coordinates give NULL.
+    """
+
+    output_field = FloatField()
+    arity = 4
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, function=SQLITE_HAVERSINE, **extra_context)
+
+    def as_sql(self, compiler, connection, **extra_context):
+        (lat1, p_lat1), (lon1, p_lon1), (lat2, p_lat2), (lon2, p_lon2) = [
+            compiler.compile(expression) for expression in self.get_source_expressions()
+        ]
+        sql = (
+            f"(2 * {EARTH_RADIUS_KM} * ASIN(SQRT(LEAST(1.0, "
+            f"POWER(SIN((RADIANS({lat2}) - RADIANS({lat1})) / 2), 2) "
+            f"+ COS(RADIANS({lat1})) * COS(RADIANS({lat2})) "
+            f"* POWER(SIN((RADIANS({lon2}) - RADIANS({lon1})) / 2), 2)))))"
+        )
+        params = (*p_lat2, *p_lat1, *p_lat1, *p_lat2, *p_lon2, *p_lon1)
+        return sql, params
+
+
+def rating_average(prefix=""):
+    """
+    Average rating score read from the stored rating_sum / rating_count columns of a Driver or
+    Vehicle (reached through `prefix`, e.g. "driver_profile__"); NULL while there are no ratings.
+    """
+    return Cast(F(f"{prefix}rating_sum"), FloatField()) / NullIf(F(f"{prefix}rating_count"), 0)
+
+
+def _sqlite_haversine(lat1, lon1, lat2, lon2):
+    if lat1 is None or lon1 is None or lat2 is None or lon2 is None:
+        return None
+    lat1, lon1, lat2, lon2 = map(math.radians, map(float, (lat1, lon1, lat2, lon2)))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(1.0, a)))
+
+
+@receiver(connection_created)
+def register_sqlite_functions(sender, connection, **kwargs):
+    if connection.vendor == "sqlite":
+        connection.connection.create_function(SQLITE_HAVERSINE, 4, _sqlite_haversine, deterministic=True)
@@ -0,0 +1,241 @@
+import atexit
+import logging
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.dispatch import Signal
+
+from .location_index import driver_index
+from .utils import geohash_encode
+
+
+logger = logging.getLogger(__name__)
+
+COORD_QUANTUM = Decimal("0.000001")  # matches the 6 decimal places of the coordinate columns
+
+# sent after DriverLocationBuffer.flush() with locations=[(driver_id, lat, lon), ...]
+driver_locations_flushed = Signal()
+
+
+class _PeriodicFlush:
+    """Runs self.flush() from a daemon thread every `flush_interval` seconds, started on first use."""
+
+    flush_interval = 2.0
+    thread_name = "ingest-flusher"
+
+    def _start_flusher(self):
+        if self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+                self._flusher.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                # keep the thread alive; the failed batch is dropped and newer data follows shortly
+                logger.exception("%s flush failed", self.__class__.__name__)
+            finally:
+                close_old_connections()
+
+
+class DriverLocationBuffer(_PeriodicFlush):
+    """
+    Coalesces high-frequency driver location pings.
+
+    Only the latest ping per driver is kept in memory; a background thread writes the
+    pending positions to Driver rows in one batched UPDATE every `flush_interval` seconds
+    (or sooner once `max_pending` drivers are waiting) instead of a save() per ping.
+    That UPDATE sends no post_save: flush() moves drivers in the matching index itself
+    and sends driver_locations_flushed for anything else derived from Driver coordinates.
+    """
+
+    thread_name = "driver-location-flusher"
+
+    def __init__(self, flush_interval=None, max_pending=None, batch_size=500):
+        self.flush_interval = flush_interval or getattr(settings, "DRIVER_LOCATION_FLUSH_INTERVAL", 2.0)
+        self.max_pending = max_pending or getattr(settings, "DRIVER_LOCATION_MAX_PENDING", 10000)
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}  # driver_id -> (lat, lon, recorded_at)
+        self._flusher = None
+        self.pings_received = 0
+        self.rows_written = 0
+        self.flushes = 0
+
+    def add(self, driver_id, lat, lon, recorded_at=None):
+        recorded_at = recorded_at if recorded_at is not None else time.time()
+        with self._lock:
+            current = self._pending.get(driver_id)
+            # a late, out-of-order ping must not overwrite a newer position
+            if current is None or recorded_at >= current[2]:
+                self._pending[driver_id] = (lat, lon, recorded_at)
+            self.pings_received += 1
+            full = len(self._pending) >= self.max_pending
+        self._start_flusher()
+        if full:
+            self.flush()
+
+    def pending(self, driver_id):
+        """Latest buffered (lat, lon) for a driver, or None once it has been flushed."""
+        with self._lock:
+            current = self._pending.get(driver_id)
+        return current[:2] if current else None
+
+    def flush(self):
+        """Write every pending position to the database; returns the number of rows updated."""
+        from accounts.models import Driver
+
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+
+            rows = []
+            for driver_id, (lat, lon, _) in batch.items():
+                lat = Decimal(str(lat)).quantize(COORD_QUANTUM)
+                lon = Decimal(str(lon)).quantize(COORD_QUANTUM)
+                rows.append((lat, lon, geohash_encode(lat, lon), driver_id))
+
+            # one prepared UPDATE executed for every row in a single transaction; bulk_update's
+            # CASE/WHEN statements grow with the batch and are slower per row than this
+            opts = Driver._meta
+            sql = "UPDATE {} SET {} = %s, {} = %s, {} = %s WHERE {} = %s".format(
+                *(connection.ops.quote_name(name) for name in (
+                    opts.db_table,
+                    opts.get_field("latitude").column,
+                    opts.get_field("longitude").column,
+                    opts.get_field("geohash").column,
+                    opts.pk.column,
+                ))
+            )
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    for start in range(0, len(rows), self.batch_size):
+                        cursor.executemany(sql, rows[start:start + self.batch_size])
+
+            # these writes skip post_save, so move the drivers in the matching index here
+            if driver_index.loaded:
+                for lat, lon, _, driver_id in rows:
+                    driver_index.move(driver_id, lat, lon)
+            driver_locations_flushed.send(
+                sender=self.__class__, locations=[(driver_id, lat, lon) for lat, lon, _, driver_id in rows]
+            )
+
+            with self._lock:
+                self.rows_written += len(rows)
+                self.flushes += 1
+            return len(rows)
+
+
+class RideTrackingBuffer(_PeriodicFlush):
+    """
+    Buffers GPS points of ongoing rides and persists them as RideTracking rows.
+
+    Points are grouped per ride and written with bulk_create in fixed-size batches:
+    a ride is written as soon as it has `batch_size` points, everything pending is
+    written every `flush_interval` seconds, and once `max_points` are held in memory
+    the whole buffer is flushed at once so memory stays bounded. flush_ride() writes
+    one ride synchronously (used when the ride ends).
+
+    Buffers are per process: flush_ride() only writes the points this worker holds.
+    With several workers, points another worker received during the last
+    flush_interval reach the database on its next flush, after the ride-end metrics
+    were computed, so run ride tracking on a single worker when exact fares matter.
+    """
+
+    thread_name = "ride-tracking-flusher"
+
+    def __init__(self, flush_interval=None, batch_size=None, max_points=None):
+        self.flush_interval = flush_interval or getattr(settings, "RIDE_TRACKING_FLUSH_INTERVAL", 5.0)
+        self.batch_size = batch_size or getattr(settings, "RIDE_TRACKING_BATCH_SIZE", 200)
+        self.max_points = max_points or getattr(settings, "RIDE_TRACKING_MAX_BUFFERED", 50000)
+        self._lock = threading.Lock()
+        self._pending = {}  # ride_id -> [RideTracking, ...]
+        self._size = 0
+        self._flusher = None
+        self.points_received = 0
+        self.rows_written = 0
+
+    def add(self, ride_id, points):
+        """Buffer `points`, an iterable of dicts with latitude, longitude, speed_kmph, heading_deg, timestamp."""
+        from .models import RideTracking
+
+        rows = [
+            RideTracking(
+                ride_id=ride_id,
+                latitude=Decimal(str(p["latitude"])).quantize(COORD_QUANTUM),
+                longitude=Decimal(str(p["longitude"])).quantize(COORD_QUANTUM),
+                speed_kmph=p.get("speed_kmph"),
+                heading_deg=p.get("heading_deg"),
+                timestamp=p["timestamp"],
+            )
+            for p in points
+        ]
+        with self._lock:
+            self._pending.setdefault(ride_id, []).extend(rows)
+            self._size += len(rows)
+            self.points_received += len(rows)
+            ride_full = len(self._pending[ride_id]) >= self.batch_size
+            buffer_full = self._size >= self.max_points
+        self._start_flusher()
+        if buffer_full:
+            self.flush()
+        elif ride_full:
+            self._write(ride_id, full_batches_only=True)
+
+    def buffered(self, ride_id):
+        with self._lock:
+            return len(self._pending.get(ride_id, ()))
+
+    def flush_ride(self, ride_id):
+        """Write every buffered point of one ride; returns the number of rows written."""
+        return self._write(ride_id)
+
+    def flush(self):
+        with self._lock:
+            ride_ids = list(self._pending)
+        return sum(self._write(ride_id) for ride_id in ride_ids)
+
+    def _write(self, ride_id, full_batches_only=False):
+        from .models import RideTracking
+
+        with self._lock:
+            rows = self._pending.get(ride_id, [])
+            take = len(rows) - len(rows) % self.batch_size if full_batches_only else len(rows)
+            if not take:
+                return 0
+            batch, rest = rows[:take], rows[take:]
+            if rest:
+                self._pending[ride_id] = rest
+            else:
+                del self._pending[ride_id]
+            self._size -= len(batch)
+
+        RideTracking.objects.bulk_create(batch, batch_size=self.batch_size)
+        with self._lock:
+            self.rows_written += len(batch)
+        return len(batch)
+
+
+driver_locations = DriverLocationBuffer()
+ride_tracking = RideTrackingBuffer()
+
+
+@atexit.register
+def _flush_on_exit():
+    for buffer in (driver_locations, ride_tracking):
+        try:
+            buffer.flush()
+        except Exception:
+            logger.exception("%s flush at exit failed", buffer.__class__.__name__)
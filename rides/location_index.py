@@ -0,0 +1,216 @@
+import heapq
+import math
+import threading
+import time
+
+from django.conf import settings
+
+from .utils import EARTH_RADIUS_KM
+
+
+def _to_xyz(lat, lon):
+    """Unit vector for a lat/lon; chord length between vectors is monotonic in great-circle distance."""
+    lat, lon = math.radians(float(lat)), math.radians(float(lon))
+    cos_lat = math.cos(lat)
+    return (cos_lat * math.cos(lon), cos_lat * math.sin(lon), math.sin(lat))
+
+
+def _chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+
+def _km_to_chord(km):
+    return 2 * math.sin(min(math.pi, km / EARTH_RADIUS_KM) / 2)
+
+
+class _Node:
+    __slots__ = ("xyz", "driver_id", "axis", "left", "right")
+
+    def __init__(self, xyz, driver_id, axis):
+        self.xyz = xyz
+        self.driver_id = driver_id
+        self.axis = axis
+        self.left = None
+        self.right = None
+
+
+class DriverLocationIndex:
+    """
+    Per-process KD-tree over the positions of available drivers, keyed by driver id.
+
+    Points are stored as 3-D unit vectors so nearest/radius queries are exact for
+    great-circle distance and do not break at the antimeridian. Updates are
+    incremental: inserts go to a leaf, removals leave a tombstone, and the tree is
+    rebuilt balanced once tombstones and leaf inserts outnumber the live points.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._points = {}  # driver_id -> xyz of its live node
+        self._root = None
+        self._churn = 0  # tombstones plus inserts since the last balanced build
+        self._built_at = None
+
+    def __len__(self):
+        return len(self._points)
+
+    @property
+    def loaded(self):
+        return self._built_at is not None
+
+    # --- building -------------------------------------------------------
+
+    def rebuild(self, locations):
+        """Replace the contents with `locations`, an iterable of (driver_id, lat, lon)."""
+        points = {driver_id: _to_xyz(lat, lon) for driver_id, lat, lon in locations}
+        with self._lock:
+            self._points = points
+            self._root = self._build(list(points.items()), 0)
+            self._churn = 0
+            self._built_at = time.monotonic()
+
+    def _build(self, items, depth):
+        if not items:
+            return None
+        axis = depth % 3
+        items.sort(key=lambda item: item[1][axis])
+        mid = len(items) // 2
+        driver_id, xyz = items[mid]
+        node = _Node(xyz, driver_id, axis)
+        node.left = self._build(items[:mid], depth + 1)
+        node.right = self._build(items[mid + 1:], depth + 1)
+        return node
+
+    def load_from_db(self):
+        from accounts.models import Driver
+
+        rows = Driver.objects.filter(
+            is_available=True,
+            verified=True,
+            background_check_passed=True,
+            latitude__isnull=False,
+            longitude__isnull=False,
+        ).values_list("id", "latitude", "longitude")
+        self.rebuild(rows.iterator())
+
+    def ensure_loaded(self):
+        """Build from the Driver table on first use, and again once older than DRIVER_INDEX_MAX_AGE seconds."""
+        max_age = getattr(settings, "DRIVER_INDEX_MAX_AGE", 300)
+        built_at = self._built_at
+        if built_at is None or (max_age and time.monotonic() - built_at > max_age):
+            self.load_from_db()
+
+    # --- incremental updates ---------------------------------------------
+
+    def upsert(self, driver_id, lat, lon):
+        xyz = _to_xyz(lat, lon)
+        with self._lock:
+            if self._points.get(driver_id) == xyz:
+                return
+            self._churn += 2 if driver_id in self._points else 1
+            self._points[driver_id] = xyz
+            self._insert(_Node(xyz, driver_id, 0))
+            self._maybe_rebalance()
+
+    def remove(self, driver_id):
+        with self._lock:
+            if self._points.pop(driver_id, None) is not None:
+                self._churn += 1
+                self._maybe_rebalance()
+
+    def move(self, driver_id, lat, lon):
+        """Update the position of a driver already in the index; others are left out."""
+        with self._lock:
+            if driver_id in self._points:
+                self.upsert(driver_id, lat, lon)
+
+    def sync_driver(self, driver):
+        """Insert, move or drop a driver according to its current availability and position."""
+        if (
+            driver.is_available and driver.verified and driver.background_check_passed
+            and driver.latitude is not None and driver.longitude is not None
+        ):
+            self.upsert(driver.pk, driver.latitude, driver.longitude)
+        else:
+            self.remove(driver.pk)
+
+    def _insert(self, node):
+        if self._root is None:
+            self._root = node
+            return
+        parent = self._root
+        while True:
+            axis = parent.axis
+            side = "left" if node.xyz[axis] < parent.xyz[axis] else "right"
+            child = getattr(parent, side)
+            if child is None:
+                node.axis = (axis + 1) % 3
+                setattr(parent, side, node)
+                return
+            parent = child
+
+    def _maybe_rebalance(self):
+        if self._churn > max(32, len(self._points)):
+            self._root = self._build(list(self._points.items()), 0)
+            self._churn = 0
+
+    def _is_live(self, node):
+        return self._points.get(node.driver_id) is node.xyz
+
+    # --- queries ----------------------------------------------------------
+
+    def nearest(self, lat, lon, k):
+        """The k closest drivers as a list of (driver_id, distance_km), closest first."""
+        if k <= 0:
+            return []
+        target = _to_xyz(lat, lon)
+        best = []  # max-heap of (-chord_sq, driver_id)
+        with self._lock:
+            stack = [self._root] if self._root else []
+            while stack:
+                node = stack.pop()
+                d_sq = _dist_sq(target, node.xyz)
+                if self._is_live(node):
+                    if len(best) < k:
+                        heapq.heappush(best, (-d_sq, node.driver_id))
+                    elif d_sq < -best[0][0]:
+                        heapq.heapreplace(best, (-d_sq, node.driver_id))
+                gap = target[node.axis] - node.xyz[node.axis]
+                near, far = (node.left, node.right) if gap < 0 else (node.right, node.left)
+                # the far side can only help if the splitting plane is closer than the k-th best
+                if far is not None and (len(best) < k or gap * gap < -best[0][0]):
+                    stack.append(far)
+                if near is not None:
+                    stack.append(near)
+        return [
+            (driver_id, _chord_to_km(math.sqrt(-neg_d_sq)))
+            for neg_d_sq, driver_id in sorted(best, reverse=True)
+        ]
+
+    def within(self, lat, lon, radius_km):
+        """All drivers within radius_km as (driver_id, distance_km), closest first."""
+        target = _to_xyz(lat, lon)
+        limit = _km_to_chord(radius_km)
+        limit_sq = limit * limit
+        found = []
+        with self._lock:
+            stack = [self._root] if self._root else []
+            while stack:
+                node = stack.pop()
+                d_sq = _dist_sq(target, node.xyz)
+                if d_sq <= limit_sq and self._is_live(node):
+                    found.append((d_sq, node.driver_id))
+                gap = target[node.axis] - node.xyz[node.axis]
+                if node.left is not None and gap - limit < 0:
+                    stack.append(node.left)
+                if node.right is not None and gap + limit >= 0:
+                    stack.append(node.right)
+        found.sort()
+        return [(driver_id, _chord_to_km(math.sqrt(d_sq))) for d_sq, driver_id in found]
+
+
+def _dist_sq(a, b):
+    return (a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2 + (a[2] - b[2]) ** 2
+
+
+driver_index = DriverLocationIndex()
@@ -0,0 +1,52 @@
+"""Shared helpers for the bench_* management commands (not a command itself)."""
+import random
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+
+@contextmanager
+def scratch_database(keep=False):
+    """Run the block against freshly migrated test databases so benchmarks never touch real data."""
+    from django.test.runner import DiscoverRunner
+
+    setup_test_environment()
+    runner = DiscoverRunner(verbosity=0, keepdb=keep)
+    old_config = runner.setup_databases()
+    try:
+        yield
+    finally:
+        runner.teardown_databases(old_config)
+        teardown_test_environment()
+
+
+def seed_drivers(count, center=(9.9312, 76.2673), spread_deg=0.3, seed=7):
+    """Create `count` verified, available drivers scattered around `center`; returns their ids."""
+    from accounts.models import Driver, User
+
+    rnd = random.Random(seed)
+    users = User.objects.bulk_create(
+        User(name=f"Bench Driver {i}", email=f"bench{i}@example.com", phone=f"+91{i:010d}",
+             password="!", role="driver", gender=rnd.choice(["male", "female"]))
+        for i in range(count)
+    )
+    drivers = []
+    for i, user in enumerate(users):
+        lat = Decimal(str(round(center[0] + rnd.uniform(-spread_deg, spread_deg), 6)))
+        lon = Decimal(str(round(center[1] + rnd.uniform(-spread_deg, spread_deg), 6)))
+        drivers.append(Driver(user=user, license_number=f"BENCH{i:06d}", verified=True,
+                              background_check_passed=True, is_available=True,
+                              rating=round(rnd.uniform(3, 5), 2), latitude=lat, longitude=lon))
+    Driver.objects.bulk_create(drivers)
+    return [d.id for d in drivers]
+
+
+class Timer:
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.started
@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, FloatField, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Cast, Coalesce
+
+from accounts.models import Driver
+from rides.matching import bump_availability_version
+from rides.models import Rating
+from vehicles.models import Vehicle
+
+
+def _rating_totals(rating_model, field):
+    """Subqueries for the score sum and count of the Ratings whose `field` is the outer row."""
+    ratings = rating_model.objects.filter(**{field: OuterRef("pk")}).order_by().values(field)
+    total = Subquery(ratings.annotate(total=Sum("score")).values("total"), output_field=IntegerField())
+    count = Subquery(ratings.annotate(count=Count("pk")).values("count"), output_field=IntegerField())
+    return Coalesce(total, 0), Coalesce(count, 0)
+
+
+def backfill_rating_totals(driver_model, vehicle_model, rating_model, chunk_size=500):
+    """
+    Recompute rating_sum / rating_count of every driver and vehicle (and the driver's rating)
+    from their Ratings; returns (drivers, vehicles) updated. Takes the models so migrations
+    can pass their historical versions.
+    """
+    driver_sum, driver_count = _rating_totals(rating_model, "driver")
+    drivers = _backfill(driver_model, chunk_size, {
+        "rating_sum": driver_sum,
+        "rating_count": driver_count,
+    }, then={
+        # rating follows from the new totals; unrated drivers keep whatever they had
+        "rating": Cast(F("rating_sum"), FloatField()) / F("rating_count"),
+    })
+    vehicle_sum, vehicle_count = _rating_totals(rating_model, "vehicle")
+    vehicles = _backfill(vehicle_model, chunk_size, {
+        "rating_sum": vehicle_sum,
+        "rating_count": vehicle_count,
+    })
+    return drivers, vehicles
+
+
+def _backfill(model, chunk_size, values, then=None):
+    # each row is recomputed from its Ratings in the UPDATE itself, so no stale Python-side totals
+    # are written back; only a rating committed while its row's chunk is updating can be missed
+    updated, last_pk = 0, 0
+    while True:
+        chunk = list(model.objects.filter(pk__gt=last_pk).order_by("pk").values_list("pk", flat=True)[:chunk_size])
+        if not chunk:
+            return updated
+        with transaction.atomic():
+            updated += model.objects.filter(pk__in=chunk).update(**values)
+            if then:
+                model.objects.filter(pk__in=chunk, rating_count__gt=0).update(**then)
+        last_pk = chunk[-1]
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the stored rating_sum / rating_count of every Driver and Vehicle (and Driver.rating) "
+        "from their Ratings, one chunk of rows per UPDATE. Migration rides 0010 runs this once; re-run it "
+        "if the stored totals ever drift."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=500, help="drivers or vehicles per UPDATE")
+
+    def handle(self, *args, **options):
+        drivers, vehicles = backfill_rating_totals(Driver, Vehicle, Rating, options["chunk_size"])
+        transaction.on_commit(bump_availability_version)
+        self.stdout.write(f"Backfilled rating totals for {drivers} drivers and {vehicles} vehicles")
@@ -0,0 +1,130 @@
+import os
+import tempfile
+import threading
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, transaction
+from django.utils import timezone
+
+from accounts.models import Driver, User
+from rides.acceptance import AcceptConflict, accept_request, release_driver
+from rides.models import Ride, RideRequest
+from ._bench import Timer, scratch_database, seed_drivers
+
+
+class Command(BaseCommand):
+    help = (
+        "Race --drivers threads to accept the same ride, --rides times over, and count winners per ride: "
+        "the guarded-UPDATE accept_request() against the previous select_for_update read-check-save."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rides", type=int, default=50)
+        parser.add_argument("--drivers", type=int, default=16, help="competing driver threads per ride")
+
+    def handle(self, *args, **options):
+        # threads need their own connections to a real file: the default in-memory test DB
+        # shares one cache and fails lock waits instantly instead of queueing them
+        path = os.path.join(tempfile.mkdtemp(), "bench_accept.sqlite3")
+        connection.settings_dict.setdefault("TEST", {})["NAME"] = path
+        with scratch_database():
+            driver_ids = seed_drivers(options["drivers"])
+            customer = User.objects.create(
+                name="Bench Customer", email="bench-customer@example.com", phone="+919900000000",
+                password="!", role="customer",
+            )
+            results = [
+                ("guarded UPDATE", self._race(customer, driver_ids, options["rides"], self._accept_guarded)),
+                ("select_for_update", self._race(customer, driver_ids, options["rides"], self._accept_locked)),
+            ]
+
+        self.stdout.write(f"{options['rides']} rides, {options['drivers']} drivers racing for each")
+        for label, (timer, winners, outcomes, latencies) in results:
+            latencies.sort()
+            p50, p99 = latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+            self.stdout.write(
+                f"{label}: {timer.elapsed:.2f}s, accept p50 {p50 * 1000:.1f} ms / p99 {p99 * 1000:.1f} ms; "
+                f"rides with exactly one winner {winners[1]}/{options['rides']}, "
+                f"with several {sum(n for count, n in winners.items() if count > 1)}, "
+                f"with none {winners[0]}; outcomes {dict(outcomes)}"
+            )
+
+    def _race(self, customer, driver_ids, ride_count, accept):
+        rides = Ride.objects.bulk_create(
+            Ride(customer=customer, start_location="A", end_location="B") for _ in range(ride_count)
+        )
+        RideRequest.objects.bulk_create(
+            RideRequest(ride=ride, driver_id=driver_id) for ride in rides for driver_id in driver_ids
+        )
+        requests = {
+            (ride_id, driver_id): pk
+            for pk, ride_id, driver_id in RideRequest.objects.filter(ride__in=rides).values_list(
+                "pk", "ride_id", "driver_id"
+            )
+        }
+
+        barrier = threading.Barrier(len(driver_ids))
+        lock = threading.Lock()
+        outcomes, latencies = Counter(), []
+
+        def compete(driver_id):
+            driver = Driver.objects.select_related("user").get(pk=driver_id)
+            try:
+                for ride in rides:
+                    ride_request = RideRequest.objects.get(pk=requests[ride.pk, driver_id])
+                    barrier.wait()  # everyone fires at the same ride together
+                    with Timer() as timer:
+                        try:
+                            outcome = accept(ride_request, driver)
+                        except OperationalError:
+                            outcome = "db locked"
+                    with lock:
+                        outcomes[outcome] += 1
+                        latencies.append(timer.elapsed)
+                    if outcome == "accepted":
+                        release_driver(ride.pk)  # free the winner to compete for the next ride
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=compete, args=(driver_id,)) for driver_id in driver_ids]
+        with Timer() as timer:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        accepted = Counter(
+            RideRequest.objects.filter(ride__in=rides, status=RideRequest.Status.ACCEPTED).values_list(
+                "ride_id", flat=True
+            )
+        )
+        winners = Counter(accepted.get(ride.pk, 0) for ride in rides)
+        return timer, winners, outcomes, latencies
+
+    @staticmethod
+    def _accept_guarded(ride_request, driver):
+        try:
+            accept_request(ride_request, driver)
+        except AcceptConflict:
+            return "conflict"
+        return "accepted"
+
+    @staticmethod
+    def _accept_locked(ride_request, driver):
+        # the acceptance path accept_request() replaced: lock, read, check in Python, save
+        with transaction.atomic():
+            ride = Ride.objects.select_for_update().get(pk=ride_request.ride_id)
+            ride_request = RideRequest.objects.select_for_update().get(pk=ride_request.pk)
+            if ride.status != Ride.Status.REQUESTED or ride_request.status != RideRequest.Status.PENDING:
+                return "conflict"
+            ride_request.status = RideRequest.Status.ACCEPTED
+            ride_request.responded_at = timezone.now()
+            ride_request.save()
+            ride.driver = driver
+            ride.status = Ride.Status.ACCEPTED
+            ride.save()
+            RideRequest.objects.filter(ride=ride, status=RideRequest.Status.PENDING).exclude(
+                pk=ride_request.pk
+            ).update(status=RideRequest.Status.AUTO_CANCELLED, responded_at=timezone.now())
+        return "accepted"
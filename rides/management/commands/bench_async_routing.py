@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+
+import routing
+from accounts.models import Driver, User
+from rides.models import Ride, RideRequest
+from routing.cache import route_cache
+from routing.management.commands.osrm_standin import StandInOSRM
+from ._bench import Timer, scratch_database, seed_drivers
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure ride_request_distance throughput against a slow OSRM stand-in: WSGI-style "
+        "(one blocked worker thread per request) vs ASGI (async view on one event loop), on a scratch DB."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--delay", type=float, default=0.2, help="stand-in routing latency in seconds")
+        parser.add_argument("--workers", type=int, default=8, help="WSGI worker threads")
+        parser.add_argument("--concurrency", type=int, default=100, help="requests in flight on the ASGI side")
+        parser.add_argument("--port", type=int, default=5015)
+
+    def handle(self, *args, **options):
+        # concurrent cache writes to the shared in-memory scratch DB hit table locks; the
+        # cache logs and skips those writes, which is noise here
+        logging.getLogger("routing.cache").setLevel(logging.CRITICAL)
+        server = StandInOSRM(("127.0.0.1", options["port"]), delay=options["delay"])
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        routing_config = {
+            "BACKEND": "routing.backends.osrm.OSRMRouter",
+            "OPTIONS": {"BASE_URL": f"http://127.0.0.1:{options['port']}", "POOL_SIZE": options["workers"]},
+        }
+        try:
+            with scratch_database(), override_settings(ROUTING=routing_config, ALLOWED_HOSTS=["*"]):
+                routing._router = None
+                driver = Driver.objects.get(pk=seed_drivers(1)[0])
+                cookies = self._login(driver.user)
+                # two batches of distinct trips, so every request misses the route cache
+                wsgi_urls = self._requests(driver, options["requests"], seed=1)
+                asgi_urls = self._requests(driver, options["requests"], seed=2)
+
+                route_cache.clear()
+                wsgi = self._run_wsgi(wsgi_urls, cookies, options["workers"])
+                route_cache.clear()
+                asgi = asyncio.run(self._run_asgi(asgi_urls, cookies, options["concurrency"]))
+        finally:
+            routing._router = None
+            server.shutdown()
+            server.server_close()
+
+        self.stdout.write(f"{options['requests']} distance requests, routing latency {options['delay'] * 1000:.0f} ms")
+        for label, (timer, results) in (
+            (f"WSGI, {options['workers']} worker threads", wsgi),
+            (f"ASGI, {options['concurrency']} in flight", asgi),
+        ):
+            ok = sum(status == 200 for status, _ in results)
+            routed = sum(source == "osrm" for _, source in results)
+            self.stdout.write(
+                f"{label}: {ok / timer.elapsed:,.1f} req/s ({timer.elapsed:.2f}s, {ok}/{len(results)} ok, "
+                f"{routed} routed, {ok - routed} haversine fallbacks)"
+            )
+
+    def _login(self, user):
+        client = Client()
+        session = client.session
+        session["user_id"] = user.id
+        session["user_role"] = user.role
+        session.save()
+        return client.cookies
+
+    def _requests(self, driver, count, seed):
+        rnd = random.Random(seed)
+        customer = User.objects.create(
+            name="Bench Customer", email=f"bench-customer-{seed}@example.com", phone=f"+9100000{seed}",
+            password="!", role="customer",
+        )
+
+        def point():
+            return (Decimal(str(round(9.93 + rnd.uniform(-0.2, 0.2), 6))),
+                    Decimal(str(round(76.27 + rnd.uniform(-0.2, 0.2), 6))))
+
+        rides = []
+        for _ in range(count):
+            (start_lat, start_lon), (end_lat, end_lon) = point(), point()
+            rides.append(Ride(customer=customer, start_location="A", end_location="B",
+                              start_latitude=start_lat, start_longitude=start_lon,
+                              end_latitude=end_lat, end_longitude=end_lon))
+        Ride.objects.bulk_create(rides)
+        requests = RideRequest.objects.bulk_create(RideRequest(ride=ride, driver=driver) for ride in rides)
+        return [reverse("ride_request_distance", args=[rr.pk]) for rr in requests]
+
+    def _run_wsgi(self, urls, cookies, workers):
+        local = threading.local()
+
+        def fetch(url):
+            if not hasattr(local, "client"):
+                local.client = Client()
+                local.client.cookies = cookies
+            response = local.client.get(url)
+            return response.status_code, response.json().get("source")
+
+        with ThreadPoolExecutor(workers) as pool, Timer() as timer:
+            results = list(pool.map(fetch, urls))
+        return timer, results
+
+    async def _run_asgi(self, urls, cookies, concurrency):
+        client = AsyncClient()
+        client.cookies = cookies
+        limit = asyncio.Semaphore(concurrency)
+
+        async def fetch(url):
+            async with limit:
+                response = await client.get(url)
+                return response.status_code, response.json().get("source")
+
+        with Timer() as timer:
+            results = await asyncio.gather(*(fetch(url) for url in urls))
+        return timer, results
@@ -0,0 +1,119 @@
+import os
+import tempfile
+import threading
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, transaction
+from django.utils import timezone
+
+from accounts.models import User
+from rides.models import Ride, RideTracking
+from ._bench import Timer, scratch_database
+
+
+class Command(BaseCommand):
+    help = (
+        "Concurrent write throughput of short read-then-write transactions while readers query, on a "
+        "scratch copy of the configured database. SQLite runs twice: Django's stock connection and the "
+        "tuned one from DriveMate/database.py (WAL, busy_timeout, synchronous=NORMAL, mmap, IMMEDIATE)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--writers", type=int, default=8)
+        parser.add_argument("--readers", type=int, default=4)
+        parser.add_argument("--transactions", type=int, default=200, help="per writer")
+
+    def handle(self, *args, **options):
+        settings_dict = connection.settings_dict
+        if connection.vendor == "sqlite":
+            tuned = dict(settings_dict["OPTIONS"])
+            profiles = [("stock sqlite", {}), ("tuned sqlite", tuned)]
+        else:
+            profiles = [(f"configured {connection.vendor}", settings_dict["OPTIONS"])]
+
+        original_options, original_test = settings_dict["OPTIONS"], settings_dict.get("TEST", {})
+        results = []
+        try:
+            for label, db_options in profiles:
+                connection.close()
+                settings_dict["OPTIONS"] = db_options
+                if connection.vendor == "sqlite":
+                    # a file, so every thread has its own connection and real locking
+                    settings_dict["TEST"] = {**original_test, "NAME": os.path.join(tempfile.mkdtemp(), "bench.sqlite3")}
+                with scratch_database():
+                    results.append((label, self._run(options)))
+                connection.close()
+        finally:
+            settings_dict["OPTIONS"], settings_dict["TEST"] = original_options, original_test
+
+        self.stdout.write(
+            f"{options['writers']} writers x {options['transactions']} transactions, {options['readers']} readers"
+        )
+        for label, (timer, written, failed, reads, latencies) in results:
+            latencies.sort()
+            p99 = latencies[int(len(latencies) * 0.99)] if latencies else 0.0
+            self.stdout.write(
+                f"{label}: {written / timer.elapsed:,.0f} writes/s ({written} ok, {failed} failed), "
+                f"write p99 {p99 * 1000:.1f} ms, {reads / timer.elapsed:,.0f} reads/s alongside"
+            )
+
+    def _run(self, options):
+        customer = User.objects.create(
+            name="Bench Customer", email="bench-customer@example.com", phone="+919900000000",
+            password="!", role="customer",
+        )
+        rides = Ride.objects.bulk_create(
+            Ride(customer=customer, start_location="A", end_location="B") for _ in range(options["writers"])
+        )
+
+        lock = threading.Lock()
+        done = threading.Event()
+        counts = {"written": 0, "failed": 0, "reads": 0}
+        latencies = []
+
+        def write(ride):
+            try:
+                for i in range(options["transactions"]):
+                    with Timer() as timer:
+                        try:
+                            # the shape of a typical view: read, decide, then write two rows
+                            with transaction.atomic():
+                                status = Ride.objects.filter(pk=ride.pk).values_list("status", flat=True).get()
+                                Ride.objects.filter(pk=ride.pk, status=status).update(updated_at=timezone.now())
+                                RideTracking.objects.create(
+                                    ride=ride, latitude=Decimal("9.93"), longitude=Decimal("76.27") + i
+                                )
+                            outcome = "written"
+                        except OperationalError:
+                            outcome = "failed"
+                    with lock:
+                        counts[outcome] += 1
+                        latencies.append(timer.elapsed)
+            finally:
+                connection.close()
+
+        def read():
+            try:
+                while not done.is_set():
+                    list(RideTracking.objects.filter(ride__in=rides).order_by("-timestamp")[:50])
+                    with lock:
+                        counts["reads"] += 1
+            except OperationalError:
+                pass
+            finally:
+                connection.close()
+
+        readers = [threading.Thread(target=read) for _ in range(options["readers"])]
+        writers = [threading.Thread(target=write, args=(ride,)) for ride in rides]
+        for thread in readers:
+            thread.start()
+        with Timer() as timer:
+            for thread in writers:
+                thread.start()
+            for thread in writers:
+                thread.join()
+        done.set()
+        for thread in readers:
+            thread.join()
+        return timer, counts["written"], counts["failed"], counts["reads"], latencies
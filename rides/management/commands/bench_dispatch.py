@@ -0,0 +1,137 @@
+import random
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from accounts.models import User
+from rides.dispatch import dispatch_round, start_auto_dispatch
+from rides.models import Ride, RideRequest
+from .dispatch_latency_report import percentile
+from ._bench import Timer, scratch_database, seed_drivers
+
+
+class VirtualClock:
+    def __init__(self):
+        self.current = timezone.now()
+
+    def now(self):
+        return self.current
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure dispatch-to-accept latency on a scratch DB: real auto-dispatch rounds on a virtual clock, "
+        "with drivers answering after random delays, against requesting one driver at a time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--drivers", type=int, default=2000)
+        parser.add_argument("--rides", type=int, default=300)
+        parser.add_argument("--answer-rate", type=float, default=0.8, help="share of requests drivers answer")
+        parser.add_argument("--accept-rate", type=float, default=0.3, help="share of answers that accept")
+        parser.add_argument("--mean-response", type=float, default=10.0, help="mean seconds before a driver answers")
+        parser.add_argument("--click-delay", type=float, default=5.0,
+                            help="seconds a customer takes to request the next driver by hand")
+
+    def handle(self, *args, **options):
+        rnd = random.Random(3)
+        window = getattr(settings, "DISPATCH_ROUND_SECONDS", 30)
+
+        def answer():
+            # (seconds until the driver answers, accepted), or None when the request is ignored
+            if rnd.random() >= options["answer_rate"]:
+                return None
+            return rnd.expovariate(1 / options["mean_response"]), rnd.random() < options["accept_rate"]
+
+        auto, manual, accepted_rounds, round_timings = [], [], Counter(), []
+        with scratch_database():
+            seed_drivers(options["drivers"])
+            customer = User.objects.create(
+                name="Bench Customer", email="bench-customer@example.com", phone="+919900000000",
+                password="!", role="customer",
+            )
+            clock = VirtualClock()
+            with mock.patch("rides.dispatch.timezone.now", clock.now):
+                for _ in range(options["rides"]):
+                    ride = Ride.objects.create(
+                        customer=customer, start_location="A", end_location="B",
+                        start_latitude=Decimal(str(round(9.9312 + rnd.uniform(-0.25, 0.25), 6))),
+                        start_longitude=Decimal(str(round(76.2673 + rnd.uniform(-0.25, 0.25), 6))),
+                    )
+                    latency, round_ = self._auto_dispatch(ride, clock, answer, round_timings)
+                    auto.append(latency)
+                    if latency is not None:
+                        accepted_rounds[round_] += 1
+                    manual.append(self._one_at_a_time(answer, window, options["click_delay"]))
+                    clock.current += timedelta(hours=1)
+
+        round_timings.sort()
+        self.stdout.write(
+            f"{options['rides']} rides, {options['drivers']} drivers; drivers answer {options['answer_rate']:.0%} "
+            f"of requests after ~{options['mean_response']:.0f}s and accept {options['accept_rate']:.0%} of those"
+        )
+        self.stdout.write(
+            f"dispatch_round (query + bulk_create): p50 {percentile(round_timings, 0.5) * 1000:.1f} ms, "
+            f"p99 {percentile(round_timings, 0.99) * 1000:.1f} ms over {len(round_timings)} rounds"
+        )
+        for label, latencies in (("auto-dispatch", auto), ("one driver at a time", manual)):
+            self._report(label, latencies)
+        self.stdout.write("auto-dispatch accepted by round: " + ", ".join(
+            f"{round_}: {count}" for round_, count in sorted(accepted_rounds.items())
+        ))
+
+    def _auto_dispatch(self, ride, clock, answer, round_timings):
+        """Run the ride's rounds until a driver accepts; returns (seconds to accept, round) or (None, None)."""
+        started = clock.now()
+        with Timer() as timer:
+            start_auto_dispatch(ride)
+        round_timings.append(timer.elapsed)
+        seen, acceptances = set(), []  # acceptances: (accepted at, round of the request)
+        while True:
+            ride.refresh_from_db(fields=["dispatch_round", "next_dispatch_at"])
+            for pk, requested_at in RideRequest.objects.filter(ride=ride).exclude(pk__in=seen).values_list(
+                "pk", "requested_at"
+            ):
+                seen.add(pk)
+                response = answer()
+                if response is not None and response[1]:
+                    acceptances.append((requested_at + timedelta(seconds=response[0]), ride.dispatch_round))
+            first = min(acceptances, default=None)
+            if first is not None and (ride.next_dispatch_at is None or first[0] <= ride.next_dispatch_at):
+                return (first[0] - started).total_seconds(), first[1]
+            if ride.next_dispatch_at is None:
+                return None, None
+            clock.current = ride.next_dispatch_at
+            with Timer() as timer:
+                dispatch_round(ride.pk)
+            round_timings.append(timer.elapsed)
+
+    @staticmethod
+    def _one_at_a_time(answer, window, click_delay):
+        """The customer requests the nearest drivers one by one, waiting up to `window` for each answer."""
+        radii = getattr(settings, "DISPATCH_RADII_KM", (2, 5, 10, 25))
+        elapsed = 0.0
+        for _ in range(getattr(settings, "DISPATCH_BATCH_SIZE", 5) * len(radii)):
+            response = answer()
+            if response is not None and response[0] < window:
+                if response[1]:
+                    return elapsed + response[0]
+                elapsed += response[0] + click_delay
+            else:
+                elapsed += window + click_delay
+        return None
+
+    def _report(self, label, latencies):
+        accepted = sorted(latency for latency in latencies if latency is not None)
+        line = f"{label}: {len(accepted)}/{len(latencies)} accepted"
+        if accepted:
+            line += (
+                f", dispatch-to-accept p50 {percentile(accepted, 0.5):.1f}s, p90 {percentile(accepted, 0.9):.1f}s, "
+                f"p99 {percentile(accepted, 0.99):.1f}s"
+            )
+        self.stdout.write(line)
@@ -0,0 +1,50 @@
+import random
+
+from django.core.management.base import BaseCommand
+
+from accounts.models import Driver
+from rides.ingest import DriverLocationBuffer
+from ._bench import Timer, scratch_database, seed_drivers
+
+
+class Command(BaseCommand):
+    help = "Measure driver location ping ingestion: buffered bulk writes vs one save() per ping (scratch DB)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--drivers", type=int, default=2000)
+        parser.add_argument("--pings-per-driver", type=int, default=10)
+        parser.add_argument("--baseline-pings", type=int, default=2000,
+                            help="pings written with per-ping save() for comparison")
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            driver_ids = seed_drivers(options["drivers"])
+            rnd = random.Random(1)
+            pings = [
+                (driver_id, 9.93 + rnd.uniform(-0.3, 0.3), 76.27 + rnd.uniform(-0.3, 0.3))
+                for _ in range(options["pings_per_driver"])
+                for driver_id in driver_ids
+            ]
+
+            # flush only when asked, so ingest and write costs are measured separately
+            buffer = DriverLocationBuffer(flush_interval=3600, max_pending=len(pings) + 1)
+            with Timer() as ingest:
+                for driver_id, lat, lon in pings:
+                    buffer.add(driver_id, lat, lon)
+            with Timer() as flush:
+                rows = buffer.flush()
+
+            baseline = pings[:options["baseline_pings"]]
+            drivers = {d.id: d for d in Driver.objects.filter(id__in={p[0] for p in baseline})}
+            with Timer() as per_ping:
+                for driver_id, lat, lon in baseline:
+                    driver = drivers[driver_id]
+                    driver.latitude, driver.longitude = round(lat, 6), round(lon, 6)
+                    driver.save(update_fields=["latitude", "longitude"])
+
+        total = len(pings)
+        self.stdout.write(f"pings: {total} from {len(driver_ids)} drivers")
+        self.stdout.write(f"buffer ingest: {total / ingest.elapsed:,.0f} pings/s ({ingest.elapsed * 1e6 / total:.2f} us/ping)")
+        self.stdout.write(f"bulk flush: {rows} rows in {flush.elapsed * 1000:.1f} ms ({rows / flush.elapsed:,.0f} rows/s)")
+        self.stdout.write(f"end-to-end buffered: {total / (ingest.elapsed + flush.elapsed):,.0f} pings/s")
+        self.stdout.write(f"per-ping save(): {len(baseline) / per_ping.elapsed:,.0f} pings/s")
@@ -0,0 +1,124 @@
+from itertools import groupby
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from rides.models import Ride, RideTracking
+from rides.utils import douglas_peucker_mask, path_length_km
+
+
+SQL_PARAM_CHUNK = 500  # stays under SQLite's bound-parameter limit
+
+
+def tracking_rows_bytes(ids):
+    """Approximate stored size of the given RideTracking rows (Postgres: exact tuple size)."""
+    table = connection.ops.quote_name(RideTracking._meta.db_table)
+    total = 0
+    with connection.cursor() as cursor:
+        for start in range(0, len(ids), SQL_PARAM_CHUNK):
+            chunk = ids[start:start + SQL_PARAM_CHUNK]
+            if connection.vendor == "postgresql":
+                cursor.execute(
+                    f"SELECT COALESCE(SUM(pg_column_size(t.*)), 0) FROM {table} t WHERE t.id = ANY(%s)", [chunk]
+                )
+            else:
+                # value sizes plus a per-column header byte and the 8-byte rowid
+                columns = [f.column for f in RideTracking._meta.concrete_fields]
+                size = " + ".join(f"COALESCE(LENGTH({connection.ops.quote_name(c)}), 0)" for c in columns)
+                placeholders = ", ".join(["%s"] * len(chunk))
+                cursor.execute(
+                    f"SELECT COALESCE(SUM({size} + {len(columns) + 8}), 0) FROM {table} WHERE id IN ({placeholders})",
+                    chunk,
+                )
+            total += int(cursor.fetchone()[0] or 0)
+    return total
+
+
+class Command(BaseCommand):
+    help = (
+        "Simplify the RideTracking traces of completed rides with Douglas-Peucker, keeping only "
+        "shape-significant points, and report the rows and bytes reclaimed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tolerance-m", type=float,
+                            default=getattr(settings, "TRACKING_COMPACTION_TOLERANCE_M", 10.0),
+                            help="max distance (m) of a dropped point from the simplified path")
+        parser.add_argument("--max-length-error", type=float, default=1.0,
+                            help="max path-length loss (percent); tolerance is halved (twice) to meet it, else the ride is skipped")
+        parser.add_argument("--chunk-size", type=int, default=100, help="rides per transaction")
+        parser.add_argument("--limit", type=int, default=None, help="stop after this many rides")
+        parser.add_argument("--dry-run", action="store_true", help="report without deleting anything")
+
+    def handle(self, *args, **options):
+        tolerance = options["tolerance_m"]
+        max_error = options["max_length_error"] / 100.0
+        dry_run = options["dry_run"]
+
+        totals = {"rides": 0, "skipped": 0, "rows_before": 0, "rows_deleted": 0, "bytes": 0}
+        worst_error = 0.0
+        last_pk = 0
+        while options["limit"] is None or totals["rides"] < options["limit"]:
+            chunk_size = options["chunk_size"]
+            if options["limit"] is not None:
+                chunk_size = min(chunk_size, options["limit"] - totals["rides"])
+            ride_ids = list(
+                Ride.objects.filter(
+                    pk__gt=last_pk, status=Ride.Status.COMPLETED, tracking_compacted_at__isnull=True
+                ).order_by("pk").values_list("pk", flat=True)[:chunk_size]
+            )
+            if not ride_ids:
+                break
+            last_pk = ride_ids[-1]
+
+            points = (
+                RideTracking.objects.filter(ride_id__in=ride_ids)
+                .order_by("ride_id", "timestamp", "id")
+                .values_list("ride_id", "id", "latitude", "longitude")
+            )
+            drop_ids, compacted_ride_ids = [], []
+            traces = {ride_id: list(rows) for ride_id, rows in groupby(points.iterator(), key=lambda r: r[0])}
+            for ride_id in ride_ids:
+                trace = traces.get(ride_id, [])
+                totals["rides"] += 1
+                totals["rows_before"] += len(trace)
+                if len(trace) < 3:
+                    compacted_ride_ids.append(ride_id)
+                    continue
+
+                _, ids, lats, lons = zip(*trace)
+                original_km = path_length_km(lats, lons)
+                for attempt_tolerance in (tolerance, tolerance / 2, tolerance / 4):
+                    keep = douglas_peucker_mask(lats, lons, attempt_tolerance)
+                    simplified_km = path_length_km(
+                        [v for v, k in zip(lats, keep) if k], [v for v, k in zip(lons, keep) if k]
+                    )
+                    error = (original_km - simplified_km) / original_km if original_km else 0.0
+                    if error <= max_error:
+                        break
+                else:
+                    totals["skipped"] += 1
+                    self.stderr.write(f"Ride #{ride_id}: path-length error {error:.2%} over limit, left untouched")
+                    continue
+
+                worst_error = max(worst_error, error)
+                drop_ids.extend(i for i, k in zip(ids, keep) if not k)
+                compacted_ride_ids.append(ride_id)
+
+            totals["bytes"] += tracking_rows_bytes(drop_ids)
+            totals["rows_deleted"] += len(drop_ids)
+            if not dry_run:
+                with transaction.atomic():
+                    for start in range(0, len(drop_ids), SQL_PARAM_CHUNK):
+                        RideTracking.objects.filter(id__in=drop_ids[start:start + SQL_PARAM_CHUNK]).delete()
+                    Ride.objects.filter(pk__in=compacted_ride_ids).update(tracking_compacted_at=timezone.now())
+
+        kept = totals["rows_before"] - totals["rows_deleted"]
+        ratio = totals["rows_deleted"] / totals["rows_before"] if totals["rows_before"] else 0.0
+        self.stdout.write(
+            f"{'[dry run] ' if dry_run else ''}rides: {totals['rides']} (skipped {totals['skipped']}), "
+            f"rows: {totals['rows_before']} -> {kept} ({totals['rows_deleted']} deleted, {ratio:.1%}), "
+            f"~{totals['bytes']:,} bytes reclaimed, worst path-length error {worst_error:.3%}"
+        )
@@ -0,0 +1,50 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from rides.models import Ride, RideRequest
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Command(BaseCommand):
+    help = "Report dispatch-to-accept latency of auto-dispatched rides (start of dispatch -> driver accepts)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=7, help="only rides dispatched in the last N days")
+
+    def handle(self, *args, **options):
+        accepted_at = RideRequest.objects.filter(
+            ride=OuterRef("pk"), status__in=[RideRequest.Status.ACCEPTED, RideRequest.Status.COMPLETED]
+        ).order_by("responded_at").values("responded_at")[:1]
+        rides = list(
+            Ride.objects.filter(
+                auto_dispatch=True,
+                dispatch_started_at__gte=timezone.now() - timedelta(days=options["days"]),
+            ).annotate(accepted_at=Subquery(accepted_at))
+            .values_list("dispatch_started_at", "accepted_at", "dispatch_round", "status")
+        )
+        if not rides:
+            self.stdout.write("No auto-dispatched rides in the period.")
+            return
+
+        latencies = [(accepted - started).total_seconds() for started, accepted, _, _ in rides if accepted]
+        rounds = Counter(round_ for _, accepted, round_, _ in rides if accepted)
+        unaccepted = Counter(status for _, accepted, _, status in rides if not accepted)
+
+        self.stdout.write(f"{len(rides)} auto-dispatched rides, {len(latencies)} accepted")
+        if latencies:
+            self.stdout.write(
+                "dispatch-to-accept: "
+                f"p50 {percentile(latencies, 0.5):.1f}s, p90 {percentile(latencies, 0.9):.1f}s, "
+                f"p99 {percentile(latencies, 0.99):.1f}s, max {max(latencies):.1f}s"
+            )
+            self.stdout.write("accepted by round: " + ", ".join(f"{r}: {n}" for r, n in sorted(rounds.items())))
+        if unaccepted:
+            self.stdout.write("not accepted: " + ", ".join(f"{s}: {n}" for s, n in sorted(unaccepted.items())))
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from rides.dispatch import run_due_dispatches
+
+
+class Command(BaseCommand):
+    help = "Run auto-dispatch rounds for rides whose acceptance window has passed (loops until stopped)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, default=2.0, help="seconds between scans")
+        parser.add_argument("--batch", type=int, default=100, help="rides handled per scan")
+        parser.add_argument("--once", action="store_true", help="run a single scan and exit")
+
+    def handle(self, *args, **options):
+        while True:
+            rides, created = run_due_dispatches(limit=options["batch"])
+            if rides:
+                self.stdout.write(f"{rides} rides dispatched, {created} requests sent")
+            if options["once"]:
+                break
+            if rides < options["batch"]:
+                time.sleep(options["interval"])
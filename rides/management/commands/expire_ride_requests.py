@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from rides.expiry import expire_pending_requests
+
+
+class Command(BaseCommand):
+    help = "Auto-cancel ride requests drivers never answered; run once (cron) or with --loop as a worker."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--max-age", type=int, default=None,
+                            help="seconds a request may stay pending (default: RIDE_REQUEST_MAX_PENDING_SECONDS)")
+        parser.add_argument("--batch-size", type=int, default=500, help="requests cancelled per UPDATE")
+        parser.add_argument("--loop", action="store_true", help="keep sweeping every --interval seconds")
+        parser.add_argument("--interval", type=float, default=60.0)
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            expired = expire_pending_requests(options["max_age"], options["batch_size"])
+            self.stdout.write(f"Expired {expired} pending ride requests in {time.perf_counter() - started:.2f}s")
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
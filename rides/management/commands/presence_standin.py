@@ -0,0 +1,157 @@
+import bisect
+import socketserver
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class StandInRedis(socketserver.ThreadingTCPServer):
+    """
+    Minimal Redis look-alike for local testing of RedisPresenceStore: speaks RESP2 and
+    keeps sorted sets in memory. Supports PING, ZADD, ZREM, ZSCORE, ZMSCORE,
+    ZRANGEBYSCORE (with LIMIT), ZCARD and DEL; CLIENT/SELECT/ECHO are acknowledged.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        super().__init__(address, _Handler)
+        self.lock = threading.Lock()
+        self.zsets = {}  # key -> {member: score}
+
+    def execute(self, name, args):
+        handler = getattr(self, f"cmd_{name.lower()}", None)
+        if handler is None:
+            raise CommandError(f"unknown command '{name}'")
+        with self.lock:
+            return handler(*args)
+
+    def cmd_ping(self, *args):
+        return args[0] if args else _Simple("PONG")
+
+    def cmd_echo(self, message):
+        return message
+
+    def cmd_client(self, *args):
+        return _Simple("OK")
+
+    def cmd_select(self, db):
+        return _Simple("OK")
+
+    def cmd_zadd(self, key, *pairs):
+        zset = self.zsets.setdefault(key, {})
+        added = 0
+        for score, member in zip(pairs[::2], pairs[1::2]):
+            added += member not in zset
+            zset[member] = float(score)
+        return added
+
+    def cmd_zrem(self, key, *members):
+        zset = self.zsets.get(key, {})
+        return sum(zset.pop(member, None) is not None for member in members)
+
+    def cmd_zscore(self, key, member):
+        score = self.zsets.get(key, {}).get(member)
+        return None if score is None else repr(score).encode()
+
+    def cmd_zmscore(self, key, *members):
+        return [self.cmd_zscore(key, member) for member in members]
+
+    def cmd_zcard(self, key):
+        return len(self.zsets.get(key, {}))
+
+    def cmd_del(self, *keys):
+        return sum(self.zsets.pop(key, None) is not None for key in keys)
+
+    def cmd_zrangebyscore(self, key, low, high, *options):
+        zset = self.zsets.get(key, {})
+        ranked = sorted((score, member) for member, score in zset.items())
+        scores = [score for score, _ in ranked]
+        low, low_open = _bound(low)
+        high, high_open = _bound(high)
+        start = (bisect.bisect_right if low_open else bisect.bisect_left)(scores, low)
+        stop = (bisect.bisect_left if high_open else bisect.bisect_right)(scores, high)
+        members = [member for _, member in ranked[start:stop]]
+        options = [o.upper() if isinstance(o, bytes) else o for o in options]
+        if b"LIMIT" in options:
+            i = options.index(b"LIMIT")
+            offset, count = int(options[i + 1]), int(options[i + 2])
+            members = members[offset:] if count < 0 else members[offset:offset + count]
+        return members
+
+
+class _Simple(str):
+    """A RESP simple string (+OK) rather than a bulk string."""
+
+
+def _bound(value):
+    value = value.decode()
+    is_open = value.startswith("(")
+    return float(value.lstrip("(")), is_open  # float() also reads -inf / +inf
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        while True:
+            try:
+                command = self._read()
+            except (ConnectionError, ValueError):
+                return
+            if command is None:
+                return
+            try:
+                reply = self.server.execute(command[0].decode(), command[1:])
+            except (CommandError, TypeError, ValueError, IndexError) as e:
+                self.wfile.write(f"-ERR {e}\r\n".encode())
+            else:
+                self.wfile.write(_encode(reply))
+            self.wfile.flush()
+
+    def _read(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.split()  # inline command, e.g. from telnet
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+
+def _encode(value):
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, _Simple):
+        return f"+{value}\r\n".encode()
+    if isinstance(value, int):
+        return f":{value}\r\n".encode()
+    if isinstance(value, list):
+        return f"*{len(value)}\r\n".encode() + b"".join(_encode(item) for item in value)
+    if isinstance(value, str):
+        value = value.encode()
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+class Command(BaseCommand):
+    help = "Serve a Redis-protocol stand-in with the sorted-set commands used by the driver presence store."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--port", type=int, default=6380)
+
+    def handle(self, *args, **options):
+        server = StandInRedis(("127.0.0.1", options["port"]))
+        self.stdout.write(
+            f"Presence stand-in on redis://127.0.0.1:{options['port']}/0; point "
+            "DRIVER_PRESENCE OPTIONS URL at it with the rides.presence.RedisPresenceStore backend"
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,319 @@
+import logging
+import math
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import BooleanField, Case, F, FloatField, Q, Value, When
+
+from .functions import Haversine
+from .location_index import driver_index
+from .presence import online_filter
+from .utils import geohash_encode, geohash_neighbours, haversine_many
+
+
+logger = logging.getLogger(__name__)
+
+# Geohash lengths tried around the pickup, from ~1km cells out to ~600km cells.
+RING_PRECISIONS = (6, 5, 4, 3, 2)
+
+CANDIDATE_POOL_SIZE = 200  # candidates cached per ride, for select_driver filters to choose from
+CANDIDATE_POOL_MAX_SIZE = 3200  # largest pool refine_candidates widens to for narrow filters
+AVAILABILITY_VERSION_KEY = "driver_availability_version"
+
+
+def matching_backend():
+    """The configured DRIVER_MATCHING_BACKEND, "sql" when unset."""
+    return getattr(settings, "DRIVER_MATCHING_BACKEND", "sql")
+
+
+def warm_up():
+    """
+    Build the in-process driver index when the "index" backend is configured, so the
+    first select_driver request does not pay for it. Called as a server process starts
+    (DriveMate.wsgi/asgi); if the database is unreachable then, the first query builds it.
+    """
+    if matching_backend() != "index":
+        return
+    try:
+        driver_index.ensure_loaded()
+    except Exception:
+        logger.exception("Driver index warm-up failed")
+
+
+def geohash_cells_q(cells, field="geohash"):
+    """
+    Q matching rows whose geohash starts with any of `cells`.
+    Uses range lookups instead of startswith so the column index is used on every backend.
+    """
+    q = Q()
+    for cell in cells:
+        q |= Q(**{f"{field}__gte": cell, f"{field}__lt": cell + "~"})
+    return q
+
+
+def nearby_candidates(queryset, lat, lon, desired, field="geohash"):
+    """
+    Return objects of `queryset` located in the pickup cell and its 8 neighbours,
+    widening the ring until at least `desired` objects are found.
+    Falls back to the whole queryset when the pickup has no coordinates or even
+    the widest ring comes up short (drivers without a location are only reached there).
+    """
+    if lat is None or lon is None:
+        return list(queryset)
+
+    for precision in RING_PRECISIONS:
+        center = geohash_encode(lat, lon, precision)
+        cells = [center] + geohash_neighbours(center)
+        candidates = list(queryset.filter(geohash_cells_q(cells, field)))
+        if len(candidates) >= desired:
+            return candidates
+
+    return list(queryset)
+
+
+def indexed_candidates(queryset, lat, lon, desired, driver_field="id"):
+    """
+    Return objects of `queryset` for the drivers nearest the pickup according to the
+    in-memory driver index. The queryset still applies every filter, so a stale index
+    entry can only cost a slot, never admit an ineligible driver; k doubles until
+    `desired` objects survive or the index is exhausted.
+    """
+    if lat is None or lon is None:
+        return list(queryset)
+
+    driver_index.ensure_loaded()
+    k = desired
+    while True:
+        driver_ids = [driver_id for driver_id, _ in driver_index.nearest(lat, lon, k)]
+        candidates = list(queryset.filter(**{f"{driver_field}__in": driver_ids}))
+        if len(candidates) >= desired:
+            return candidates
+        if len(driver_ids) < k:
+            # every indexed driver was tried; drivers without a position are only reached here
+            return list(queryset)
+        k *= 2
+
+
+def strict_candidates(queryset, lat, lon, desired, driver_path=""):
+    """
+    Nearby candidates through the configured spatial DRIVER_MATCHING_BACKEND: "index"
+    (in-memory KD-tree, the fallback for any other value), "geohash" (ring search over the indexed Driver.geohash column)
+    or "gis" (spatial query in SpatiaLite/PostGIS, needs settings.USE_GIS).
+    `driver_path` is the lookup prefix from the queryset's model to Driver.
+    """
+    backend = matching_backend()
+    if backend == "gis":
+        from geo.matching import gis_candidates
+
+        return gis_candidates(queryset, lat, lon, desired, driver_path=driver_path)
+    if backend == "geohash":
+        return nearby_candidates(queryset, lat, lon, desired, field=f"{driver_path}geohash")
+    return indexed_candidates(queryset, lat, lon, desired, driver_field=f"{driver_path}id")
+
+
+def _driver_of(obj, driver_path):
+    for attr in driver_path.split("__")[:-1]:
+        obj = getattr(obj, attr) if obj is not None else None
+    return obj
+
+
+def ranked_candidates(queryset, strict_q, lat, lon, limit, driver_path=""):
+    """
+    One query returning up to `limit` objects of `queryset` in select_driver order: rows
+    matching `strict_q` first, closest to the pickup first (distance computed in SQL),
+    then the remaining rows by driver rating. Sets `.distance` (km, inf when unknown).
+    """
+    if lat is None or lon is None:
+        distance = Value(None, output_field=FloatField())
+    else:
+        distance = Haversine(
+            Value(float(lat)), Value(float(lon)), F(f"{driver_path}latitude"), F(f"{driver_path}longitude")
+        )
+    queryset = queryset.annotate(
+        is_strict=Case(When(strict_q, then=Value(True)), default=Value(False), output_field=BooleanField()),
+        sql_distance=distance,
+    ).annotate(
+        strict_distance=Case(When(is_strict=True, then=F("sql_distance")), default=None, output_field=FloatField()),
+    ).order_by(
+        F("is_strict").desc(),
+        F("strict_distance").asc(nulls_last=True),
+        F(f"{driver_path}rating").desc(),
+        "pk",
+    )
+    objects = list(queryset[:limit])
+    for obj in objects:
+        obj.distance = math.inf if obj.sql_distance is None else obj.sql_distance
+    return objects
+
+
+def candidate_pool(queryset, strict_q, lat, lon, size, driver_path=""):
+    """
+    select_driver's candidates in page order: the `size` closest rows matching `strict_q`,
+    then the other rows of `queryset` by driver rating, with `.distance` set on each.
+    DRIVER_MATCHING_BACKEND "sql" (default) does this in one ranked query; the spatial
+    backends pick the strict rows first and top up from a rating-ordered query.
+    """
+    if matching_backend() == "sql":
+        return ranked_candidates(queryset, strict_q, lat, lon, 2 * size, driver_path)
+
+    strict = strict_candidates(queryset.filter(strict_q), lat, lon, size, driver_path)
+    strict = rank_by_distance(strict, lat, lon, drivers=[_driver_of(o, driver_path) for o in strict])[:size]
+    strict_ids = {obj.pk for obj in strict}
+    extra = [
+        obj for obj in queryset.order_by(f"-{driver_path}rating")[:2 * size]
+        if obj.pk not in strict_ids
+    ][:size]
+    rank_by_distance(extra, lat, lon, drivers=[_driver_of(o, driver_path) for o in extra])  # sets .distance only
+    return strict + extra
+
+
+def rank_by_distance(objects, lat, lon, drivers=None):
+    """
+    Set `.distance` (km from the pickup) on each object and return them closest first.
+    `drivers` are the Driver rows whose position each object stands for (a vehicle's
+    current driver); by default the objects are drivers themselves. Objects without a
+    known position get inf and sort last.
+    """
+    drivers = objects if drivers is None else drivers
+    distances = haversine_many(
+        lat, lon,
+        [getattr(d, "latitude", None) for d in drivers],
+        [getattr(d, "longitude", None) for d in drivers],
+    )
+    for obj, distance in zip(objects, distances.tolist()):
+        obj.distance = distance
+    return [objects[i] for i in np.argsort(distances, kind="stable")]
+
+
+def _eta_cell(lat, lon):
+    return geohash_encode(lat, lon, getattr(settings, "ETA_CACHE_PRECISION", 7))
+
+
+def rank_by_eta(objects, lat, lon, drivers=None, top_n=None):
+    """
+    Re-order the first `top_n` (ETA_RANK_TOP_N) of `objects`, already ranked by
+    rank_by_distance, by driving time to the pickup, fetched for all of them in one
+    routing.table() call. Sets `.eta_min` on each object (None when unknown); objects
+    without an ETA keep their distance order after those with one.
+
+    ETAs are cached per pickup cell for ETA_CACHE_TTL seconds, keyed by driver and the
+    cell the driver was in, so re-filtering the page only routes drivers that moved.
+    The call runs inside the request, so it gets ETA_TABLE_BUDGET seconds rather than the
+    backend's default budget; if routing is unavailable or too slow the distance order is
+    returned unchanged.
+    """
+    from routing import get_router, table
+
+    drivers = objects if drivers is None else drivers
+    top_n = getattr(settings, "ETA_RANK_TOP_N", 10) if top_n is None else top_n
+    for obj in objects:
+        obj.eta_min = None
+    if lat is None or lon is None:
+        return objects
+
+    head = [
+        (obj, driver) for obj, driver in zip(objects[:top_n], drivers[:top_n])
+        if driver is not None and driver.latitude is not None and driver.longitude is not None
+    ]
+    key = f"eta:{get_router().name}:{_eta_cell(lat, lon)}"
+    cached = cache.get(key) or {}  # driver id -> (driver's cell, eta_min)
+    cells = {driver.pk: _eta_cell(driver.latitude, driver.longitude) for _, driver in head}
+    missing = [driver for _, driver in head if cached.get(driver.pk, (None, None))[0] != cells[driver.pk]]
+    if missing:
+        result = table(
+            [(d.latitude, d.longitude) for d in missing], [(lat, lon)],
+            budget=getattr(settings, "ETA_TABLE_BUDGET", 0.8),
+        )
+        if result is not None:
+            durations, _ = result
+            for driver, row in zip(missing, durations):
+                cached[driver.pk] = (cells[driver.pk], row[0])
+            cache.set(key, cached, getattr(settings, "ETA_CACHE_TTL", 60))
+
+    for obj, driver in head:
+        entry = cached.get(driver.pk)
+        if entry is not None and entry[0] == cells[driver.pk]:
+            obj.eta_min = entry[1]
+
+    ranked = objects[:top_n]
+    with_eta = sorted((obj for obj in ranked if obj.eta_min is not None), key=lambda obj: obj.eta_min)
+    return with_eta + [obj for obj in ranked if obj.eta_min is None] + list(objects[top_n:])
+
+
+def availability_version():
+    """Token that changes whenever a Driver or Vehicle row changes; part of every candidate pool key."""
+    version = cache.get(AVAILABILITY_VERSION_KEY)
+    if version is None:
+        version = time.time_ns()
+        cache.add(AVAILABILITY_VERSION_KEY, version, None)
+        version = cache.get(AVAILABILITY_VERSION_KEY, version)
+    return version
+
+
+def bump_availability_version():
+    # a fresh timestamp rather than incr(): never collides with a version evicted earlier
+    cache.set(AVAILABILITY_VERSION_KEY, time.time_ns(), None)
+
+
+def cached_candidate_pool(ride, build):
+    """
+    The candidate pool select_driver computed for `ride`, from `build()` on a miss.
+
+    Pools are cached for CANDIDATE_CACHE_TTL seconds and keyed by the ride's pickup,
+    mode and preferences plus availability_version(), so any driver or vehicle change
+    starts a new pool; driver movement is only picked up when the TTL runs out.
+    """
+    key = (
+        f"candidates:{ride.pk}:{ride.ride_mode}:{ride.female_driver_preference}:"
+        f"{ride.start_latitude}:{ride.start_longitude}:{availability_version()}"
+    )
+    pool = cache.get(key)
+    if pool is None:
+        pool = build()
+        cache.set(key, pool, getattr(settings, "CANDIDATE_CACHE_TTL", 30))
+    return pool
+
+
+def drop_offline(pool, driver_path=""):
+    """
+    Remove candidates whose driver is flagged available but whose presence heartbeat has
+    expired (see rides.presence). Checked per request, since presence changes faster than
+    the cached pool; PresenceSync clears the stale DB flags shortly after.
+    """
+    drivers = [_driver_of(obj, driver_path) for obj in pool]
+    flagged = {driver.pk for driver in drivers if driver is not None and driver.is_available}
+    if not flagged:
+        return pool
+    online = online_filter(flagged)
+    return [
+        obj for obj, driver in zip(pool, drivers)
+        if driver is None or not driver.is_available or driver.pk in online
+    ]
+
+
+def refine_candidates(ride, build, matches, desired, driver_path=""):
+    """
+    Apply the page's filters (`matches`) to `ride`'s candidate pool: the first `desired`
+    online, matching candidates in pool order (closest strict ones, then by rating),
+    returned closest first.
+
+    `build(size)` returns a candidate_pool of `size`; the CANDIDATE_POOL_SIZE one is
+    cached. When narrow filters leave fewer than `desired` candidates and the pool may
+    have been cut short, it is rebuilt (uncached) at twice the size until enough
+    candidates match, the rows run out or the size reaches CANDIDATE_POOL_MAX_SIZE.
+    """
+    size = CANDIDATE_POOL_SIZE
+    pool = cached_candidate_pool(ride, lambda: build(size))
+    while True:
+        chosen = [obj for obj in drop_offline(pool, driver_path) if matches(obj)][:desired]
+        # a pool smaller than `size` holds every row (see candidate_pool)
+        if len(chosen) >= desired or len(pool) < size or size >= CANDIDATE_POOL_MAX_SIZE:
+            break
+        size = min(2 * size, CANDIDATE_POOL_MAX_SIZE)
+        wider = build(size)
+        if len(wider) <= len(pool):
+            break
+        pool = wider
+    return sorted(chosen, key=lambda obj: obj.distance)
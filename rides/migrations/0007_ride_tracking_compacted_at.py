@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0006_alter_riderequest_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ride',
+            name='tracking_compacted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
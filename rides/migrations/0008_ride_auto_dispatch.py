@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0007_ride_tracking_compacted_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ride',
+            name='auto_dispatch',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='ride',
+            name='dispatch_round',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='ride',
+            name='dispatch_started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='ride',
+            name='next_dispatch_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_driver_geohash'),
+        ('rides', '0008_ride_auto_dispatch'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='riderequest',
+            index=models.Index(fields=['status', 'requested_at'], name='rides_rider_status_c80002_idx'),
+        ),
+    ]
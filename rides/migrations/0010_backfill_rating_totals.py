@@ -0,0 +1,20 @@
+from django.db import migrations
+
+
+def backfill_rating_totals(apps, schema_editor):
+    from rides.management.commands.backfill_rating_totals import backfill_rating_totals as backfill
+
+    backfill(apps.get_model("accounts", "Driver"), apps.get_model("vehicles", "Vehicle"), apps.get_model("rides", "Rating"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_rating_aggregates'),
+        ('vehicles', '0003_rating_aggregates'),
+        ('rides', '0009_riderequest_status_requested_at_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_rating_totals, migrations.RunPython.noop),
+    ]
@@ -59,6 +59,14 @@ class Ride(models.Model):
     notes = models.TextField(blank=True)
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
+    # set once compact_ride_tracking has simplified this ride's RideTracking trace
+    tracking_compacted_at = models.DateTimeField(null=True, blank=True)
+
+    # auto-dispatch (rides.dispatch): requests fan out to the nearest drivers in widening rounds
+    auto_dispatch = models.BooleanField(default=False)
+    dispatch_round = models.PositiveSmallIntegerField(default=0)
+    dispatch_started_at = models.DateTimeField(null=True, blank=True)
+    next_dispatch_at = models.DateTimeField(null=True, blank=True, db_index=True)
 
     class Meta:
         indexes = [models.Index(fields=["status", "start_time"])]
@@ -106,6 +114,7 @@ class RideRequest(models.Model):
 
     class Meta:
         unique_together = ("ride", "driver")  # prevent duplicate requests
+        indexes = [models.Index(fields=["status", "requested_at"])]  # expire_ride_requests sweep
 
     def __str__(self):
         return f"Ride #{self.ride_id} -> {self.driver.user.name} ({self.status})"
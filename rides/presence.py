@@ -0,0 +1,214 @@
+"""
+Driver presence: heartbeats with a TTL.
+
+Every location ping records a heartbeat. A driver whose last heartbeat is older than
+DRIVER_PRESENCE_TTL seconds counts as offline: matching skips them at once, and
+PresenceSync clears their Driver.is_available flag in batched UPDATEs a little later.
+Drivers that never sent a heartbeat (such as those who only toggle availability in the
+web app) are left to the DB flag alone unless DRIVER_PRESENCE_REQUIRED is set; going
+offline forgets the heartbeat, so they are back to that state when they return.
+
+settings.DRIVER_PRESENCE selects the store:
+
+    DRIVER_PRESENCE = {
+        "BACKEND": "rides.presence.RedisPresenceStore",
+        "OPTIONS": {"URL": "redis://localhost:6379/0"},
+    }
+
+MemoryPresenceStore (default) only sees heartbeats received by its own process, so
+multi-worker deployments should use Redis, or any server speaking its protocol
+(`manage.py presence_standin` serves the commands used here for local testing).
+Only a shared store clears Driver.is_available: with per-process memory, a driver
+silent to this worker may well be pinging another one, so expiry just skips them
+in this process's matching.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from .ingest import _PeriodicFlush
+
+
+logger = logging.getLogger(__name__)
+
+SQL_PARAM_CHUNK = 500  # stays under SQLite's bound-parameter limit
+
+
+class MemoryPresenceStore:
+    """Heartbeats in this process's memory: driver_id -> last beat (epoch seconds)."""
+
+    shared = False  # other workers' heartbeats are invisible here
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._seen = {}
+
+    def beat(self, driver_id, at):
+        with self._lock:
+            if at > self._seen.get(driver_id, 0.0):
+                self._seen[driver_id] = at
+
+    def forget(self, driver_id):
+        with self._lock:
+            self._seen.pop(driver_id, None)
+
+    def last_seen(self, driver_ids):
+        seen = self._seen
+        return {driver_id: seen[driver_id] for driver_id in driver_ids if driver_id in seen}
+
+    def pop_expired(self, now, limit=1000):
+        cutoff = now - self.ttl
+        with self._lock:
+            expired = [driver_id for driver_id, at in self._seen.items() if at < cutoff][:limit]
+            for driver_id in expired:
+                del self._seen[driver_id]
+        return expired
+
+
+class RedisPresenceStore:
+    """
+    Heartbeats in one Redis sorted set (member: driver id, score: last beat), shared by
+    every worker. Needs the optional `redis` package and Redis >= 6.2 (ZMSCORE).
+    """
+
+    shared = True
+
+    def __init__(self, ttl, url="redis://localhost:6379/0", key="drivemate:presence", timeout=0.5):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImproperlyConfigured("RedisPresenceStore needs the 'redis' package (pip install redis).") from e
+        self.ttl = ttl
+        self.key = key
+        # RESP2 keeps the handshake to plain commands, so RESP2-only servers (and the stand-in) work too
+        self.client = redis.Redis.from_url(
+            url, protocol=2, socket_timeout=timeout, socket_connect_timeout=timeout
+        )
+
+    def beat(self, driver_id, at):
+        self.client.zadd(self.key, {str(driver_id): at})
+
+    def forget(self, driver_id):
+        self.client.zrem(self.key, str(driver_id))
+
+    def last_seen(self, driver_ids):
+        driver_ids = list(driver_ids)
+        if not driver_ids:
+            return {}
+        scores = self.client.zmscore(self.key, [str(driver_id) for driver_id in driver_ids])
+        return {driver_id: score for driver_id, score in zip(driver_ids, scores) if score is not None}
+
+    def pop_expired(self, now, limit=1000):
+        members = self.client.zrangebyscore(self.key, "-inf", f"({now - self.ttl}", start=0, num=limit)
+        if not members:
+            return []
+        pipe = self.client.pipeline(transaction=False)
+        for member in members:
+            pipe.zrem(self.key, member)
+        # only the worker whose ZREM removed a member syncs it
+        return [int(member) for member, removed in zip(members, pipe.execute()) if removed]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_presence_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                config = getattr(settings, "DRIVER_PRESENCE", {"BACKEND": "rides.presence.MemoryPresenceStore"})
+                options = {k.lower(): v for k, v in config.get("OPTIONS", {}).items()}
+                options.setdefault("ttl", getattr(settings, "DRIVER_PRESENCE_TTL", 90))
+                _store = import_string(config["BACKEND"])(**options)
+    return _store
+
+
+def record_heartbeat(driver_id, at=None):
+    try:
+        get_presence_store().beat(driver_id, at if at is not None else time.time())
+    except Exception:
+        # presence is advisory; a store outage must not fail the ping
+        logger.exception("Presence heartbeat failed for driver %s", driver_id)
+        return
+    if get_presence_store().shared:
+        presence_sync.start()
+
+
+def forget_driver(driver_id):
+    try:
+        get_presence_store().forget(driver_id)
+    except Exception:
+        logger.exception("Presence forget failed for driver %s", driver_id)
+
+
+def online_filter(driver_ids):
+    """
+    The subset of `driver_ids` that may be matched: drivers with a fresh heartbeat, plus
+    (unless DRIVER_PRESENCE_REQUIRED) drivers the store has never heard from. Fails open
+    when the store is unreachable.
+    """
+    driver_ids = list(driver_ids)
+    try:
+        last_seen = get_presence_store().last_seen(driver_ids)
+    except Exception:
+        logger.exception("Presence lookup failed; not filtering")
+        return set(driver_ids)
+    cutoff = time.time() - getattr(settings, "DRIVER_PRESENCE_TTL", 90)
+    required = getattr(settings, "DRIVER_PRESENCE_REQUIRED", False)
+    return {
+        driver_id for driver_id in driver_ids
+        if (last_seen[driver_id] >= cutoff if driver_id in last_seen else not required)
+    }
+
+
+class PresenceSync(_PeriodicFlush):
+    """
+    Clears Driver.is_available for drivers whose heartbeat expired, in batched UPDATEs.
+    Does nothing unless the store is shared by every worker.
+    """
+
+    thread_name = "driver-presence-sync"
+
+    def __init__(self, flush_interval=None):
+        self.flush_interval = flush_interval or getattr(settings, "DRIVER_PRESENCE_SYNC_INTERVAL", 15.0)
+        self._lock = threading.Lock()
+        self._flusher = None
+        self.drivers_offlined = 0
+
+    def start(self):
+        self._start_flusher()
+
+    def flush(self):
+        from accounts.models import Driver
+        from .location_index import driver_index
+        from .matching import bump_availability_version
+
+        store = get_presence_store()
+        if not store.shared:
+            return 0
+        expired = store.pop_expired(time.time())
+        offlined = 0
+        for start in range(0, len(expired), SQL_PARAM_CHUNK):
+            chunk = expired[start:start + SQL_PARAM_CHUNK]
+            with transaction.atomic():
+                offlined += Driver.objects.filter(pk__in=chunk, is_available=True).update(is_available=False)
+            for driver_id in chunk:
+                driver_index.remove(driver_id)
+        if offlined:
+            # update() sends no post_save, so invalidate cached candidate pools here
+            bump_availability_version()
+            logger.info("Presence sync: %d drivers went offline", offlined)
+        with self._lock:
+            self.drivers_offlined += offlined
+        return offlined
+
+
+presence_sync = PresenceSync()
@@ -0,0 +1,51 @@
+from django.db import transaction
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from accounts.models import Driver
+from vehicles.models import Vehicle
+from .location_index import driver_index
+from .matching import bump_availability_version
+from .models import Rating
+
+
+@receiver(post_save, sender=Driver)
+def sync_driver_location_index(sender, instance, **kwargs):
+    # availability toggles, verification changes and location edits all save the Driver row
+    if driver_index.loaded:
+        transaction.on_commit(lambda: driver_index.sync_driver(instance))
+
+
+@receiver(post_delete, sender=Driver)
+def drop_driver_from_location_index(sender, instance, **kwargs):
+    if driver_index.loaded:
+        transaction.on_commit(lambda: driver_index.remove(instance.pk))
+
+
+@receiver(post_save, sender=Driver)
+@receiver(post_delete, sender=Driver)
+@receiver(post_save, sender=Vehicle)
+@receiver(post_delete, sender=Vehicle)
+def invalidate_candidate_pools(sender, **kwargs):
+    # cached select_driver pools hold availability, ratings and vehicle specs; start fresh after a change
+    transaction.on_commit(bump_availability_version)
+
+
+@receiver(post_delete, sender=Rating)
+def subtract_deleted_rating(sender, instance, **kwargs):
+    # undo rate_ride's F() increments; also runs for ratings deleted along with their ride
+    Driver.objects.filter(pk=instance.driver_id, rating_count__gt=0).update(
+        rating_sum=F("rating_sum") - instance.score,
+        rating_count=F("rating_count") - 1,
+        rating=Coalesce(
+            Cast(F("rating_sum") - instance.score, FloatField()) / NullIf(F("rating_count") - 1, 0), Value(0.0)
+        ),
+    )
+    if instance.vehicle_id:
+        Vehicle.objects.filter(pk=instance.vehicle_id, rating_count__gt=0).update(
+            rating_sum=F("rating_sum") - instance.score,
+            rating_count=F("rating_count") - 1,
+        )
+    transaction.on_commit(bump_availability_version)
@@ -1,3 +1,293 @@
-from django.test import TestCase
+import importlib
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone as django_timezone
+
+from accounts.models import Driver, User
+from routing.backends.osrm import OSRMRouter
+from routing.management.commands.osrm_standin import StandInOSRM
+from vehicles.models import Vehicle
+
+from .dispatch import eligible_drivers, start_auto_dispatch
+from .expiry import expire_pending_requests
+from .ingest import DriverLocationBuffer
+from .location_index import DriverLocationIndex
+from .matching import candidate_pool, rank_by_eta, refine_candidates, warm_up
+from .models import Rating, Ride, RideRequest
+from .presence import MemoryPresenceStore, presence_sync
+from .utils import geohash_encode, trace_metrics
+
+
+def make_driver(n, lat=10.0, lon=76.3, **fields):
+    user = User.objects.create(
+        name=f"Driver {n}", email=f"driver{n}@example.com", phone=f"+9199000{n:05d}", password="!", role="driver",
+    )
+    return Driver.objects.create(
+        user=user, license_number=f"LIC{n}", verified=True, background_check_passed=True,
+        latitude=Decimal(str(lat)), longitude=Decimal(str(lon)), **fields,
+    )
+
+
+def make_ride(n=0):
+    customer = User.objects.create(
+        name=f"Customer {n}", email=f"customer{n}@example.com", phone=f"+9198000{n:05d}", password="!", role="customer",
+    )
+    return Ride.objects.create(
+        customer=customer, start_location="Kochi", end_location="Aluva",
+        start_latitude=Decimal("10.0"), start_longitude=Decimal("76.3"),
+    )
+
+
+def straight_trace(points, step_m, start=(10.0, 76.3), interval_s=1.0, wobble_m=0.0):
+    """A northbound trace of `points` fixes `step_m` apart, optionally wobbling east-west."""
+    meters_per_deg = math.pi * 6371000.0 / 180.0
+    t0 = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    lats, lons, times = [], [], []
+    for i in range(points):
+        wobble = wobble_m * (1 if i % 2 else -1)
+        lats.append(start[0] + i * step_m / meters_per_deg)
+        lons.append(start[1] + wobble / (meters_per_deg * math.cos(math.radians(start[0]))))
+        times.append(t0 + timedelta(seconds=i * interval_s))
+    return lats, lons, times
+
+
+class TraceMetricsTests(SimpleTestCase):
+    def test_dense_low_speed_trace_keeps_its_distance(self):
+        # 1 Hz at ~22 km/h: every step (~6.1 m) is shorter than TRACE_JITTER_M
+        lats, lons, times = straight_trace(301, 22 / 3.6)
+        distance_km, duration_min = trace_metrics(lats, lons, times)
+        self.assertAlmostEqual(distance_km, 300 * 22 / 3.6 / 1000, delta=0.02)
+        self.assertAlmostEqual(duration_min, 5.0)
+
+    def test_stationary_jitter_adds_no_distance(self):
+        lats, lons, times = straight_trace(120, 0.0, wobble_m=3.0)
+        distance_km, _ = trace_metrics(lats, lons, times)
+        self.assertEqual(distance_km, 0.0)
+
+    def test_sparse_trace_is_rejected(self):
+        lats, lons, times = straight_trace(5, 50.0)
+        self.assertIsNone(trace_metrics(lats, lons, times))
+
+
+class SharedMemoryPresenceStore(MemoryPresenceStore):
+    shared = True  # stands in for Redis
+
+
+class PresenceSyncTests(TestCase):
+    def expire(self, store, driver):
+        store.beat(driver.id, time.time() - 91)
+        with mock.patch("rides.presence._store", store):
+            return presence_sync.flush()
+
+    def test_per_process_store_never_offlines_drivers(self):
+        driver = make_driver(1)
+        self.assertEqual(self.expire(MemoryPresenceStore(ttl=90), driver), 0)
+        driver.refresh_from_db()
+        self.assertTrue(driver.is_available)
+
+    def test_shared_store_offlines_silent_drivers(self):
+        driver = make_driver(1)
+        self.assertEqual(self.expire(SharedMemoryPresenceStore(ttl=90), driver), 1)
+        driver.refresh_from_db()
+        self.assertFalse(driver.is_available)
+
+
+class WarmUpTests(TestCase):
+    def test_index_backend_builds_the_driver_index_at_startup(self):
+        make_driver(1)
+        for backend, loaded in (("sql", False), ("index", True)):
+            with self.subTest(backend), override_settings(DRIVER_MATCHING_BACKEND=backend), \
+                    mock.patch("rides.matching.driver_index", DriverLocationIndex()) as index:
+                warm_up()
+                self.assertEqual((index.loaded, len(index)), (loaded, int(loaded)))
+
+
+class DriverLocationBufferTests(TestCase):
+    def test_flush_writes_only_the_latest_ping_per_driver(self):
+        first, second = make_driver(1), make_driver(2)
+        buffer = DriverLocationBuffer(flush_interval=3600)
+        buffer.add(first.id, 10.05, 76.35, recorded_at=2.0)
+        buffer.add(first.id, 10.01, 76.31, recorded_at=1.0)  # late and out of order
+        buffer.add(second.id, 9.98, 76.28, recorded_at=1.0)
+
+        self.assertEqual(buffer.flush(), 2)
+        first.refresh_from_db()
+        self.assertEqual((first.latitude, first.longitude), (Decimal("10.050000"), Decimal("76.350000")))
+        self.assertEqual(first.geohash, geohash_encode(first.latitude, first.longitude))
+        self.assertIsNone(buffer.pending(first.id))
+
+
+class ExpiryTests(TestCase):
+    def test_requests_accepted_meanwhile_get_no_cancel_event(self):
+        ride = make_ride()
+        stale_at = django_timezone.now() - timedelta(hours=1)
+        kept, accepted = (
+            RideRequest.objects.create(ride=ride, driver=make_driver(n), requested_at=stale_at) for n in (1, 2)
+        )
+        real_atomic = transaction.atomic
+
+        def accept_then_atomic(*args, **kwargs):
+            # the driver accepts after the batch was read, before the guarded UPDATE
+            RideRequest.objects.filter(pk=accepted.pk).update(status=RideRequest.Status.ACCEPTED)
+            return real_atomic(*args, **kwargs)
+
+        with mock.patch("rides.expiry.transaction.atomic", accept_then_atomic), \
+                mock.patch("rides.expiry.publish_requests_cancelled") as publish:
+            self.assertEqual(expire_pending_requests(max_age=60), 1)
+
+        publish.assert_called_once_with([(kept.pk, ride.pk, kept.driver_id)], RideRequest.Status.AUTO_CANCELLED)
+        accepted.refresh_from_db()
+        self.assertEqual(accepted.status, RideRequest.Status.ACCEPTED)
+
+
+class RatingTotalsTests(TestCase):
+    def test_deleting_ratings_subtracts_them_from_the_totals(self):
+        driver = make_driver(1)
+        vehicle = Vehicle.objects.create(
+            owner=driver.user, current_driver=driver, vehicle_type="sedan", make="Maruti", model="Dzire",
+            year=2022, registration_number="KL070001",
+        )
+        rides = [make_ride(n) for n in (1, 2)]
+        for ride, score in zip(rides, (5, 2)):
+            Rating.objects.create(ride=ride, customer=ride.customer, driver=driver, vehicle=vehicle, score=score)
+        Driver.objects.filter(pk=driver.pk).update(rating_sum=7, rating_count=2, rating=3.5)
+        Vehicle.objects.filter(pk=vehicle.pk).update(rating_sum=7, rating_count=2)
+
+        rides[1].delete()  # cascades to its rating
+        driver.refresh_from_db()
+        vehicle.refresh_from_db()
+        self.assertEqual((driver.rating_sum, driver.rating_count, driver.rating), (5, 1, 5.0))
+        self.assertEqual((vehicle.rating_sum, vehicle.rating_count), (5, 1))
+
+        Rating.objects.get(ride=rides[0]).delete()
+        driver.refresh_from_db()
+        self.assertEqual((driver.rating_sum, driver.rating_count, driver.rating), (0, 0, 0.0))
+
+    def test_migration_backfills_totals_of_existing_ratings(self):
+        driver = make_driver(1)
+        vehicle = Vehicle.objects.create(
+            owner=driver.user, current_driver=driver, vehicle_type="sedan", make="Maruti", model="Dzire",
+            year=2022, registration_number="KL070001",
+        )
+        for n, score in ((1, 5), (2, 2)):
+            ride = make_ride(n)
+            Rating.objects.create(ride=ride, customer=ride.customer, driver=driver, vehicle=vehicle, score=score)
+
+        migration = importlib.import_module("rides.migrations.0010_backfill_rating_totals")
+        migration.backfill_rating_totals(apps, None)
+        driver.refresh_from_db()
+        vehicle.refresh_from_db()
+        self.assertEqual((driver.rating_sum, driver.rating_count, driver.rating), (7, 2, 3.5))
+        self.assertEqual((vehicle.rating_sum, vehicle.rating_count), (7, 2))
+
+
+@override_settings(ETA_TABLE_BUDGET=0.2)
+class RankByEtaTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def router_for(self, **options):
+        server = StandInOSRM(("127.0.0.1", 0), **options)
+        threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        router = OSRMRouter(f"http://127.0.0.1:{server.server_address[1]}", backoff=0.0)
+        self.addCleanup(router.client.session.close)
+        return router
+
+    def test_reorders_by_eta_including_zero_minutes(self):
+        near, here = make_driver(1, lat=10.01), make_driver(2, lat=10.0)
+        with mock.patch("routing._router", self.router_for()):
+            ranked = rank_by_eta([near, here], 10.0, 76.3)
+        self.assertEqual(ranked, [here, near])
+        self.assertEqual(here.eta_min, 0.0)
+
+    def test_slow_router_keeps_distance_order_within_budget(self):
+        drivers = [make_driver(1, lat=10.01), make_driver(2, lat=10.0)]
+        started = time.monotonic()
+        with mock.patch("routing._router", self.router_for(delay=2.0)):
+            ranked = rank_by_eta(drivers, 10.0, 76.3)
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertEqual(ranked, drivers)
+        self.assertTrue(all(d.eta_min is None for d in drivers))
+
+
+class DispatchTests(TestCase):
+    def test_drivers_on_a_ride_are_not_eligible(self):
+        ride = make_ride(1)
+        make_driver(1, current_ride=make_ride(2))
+        free = make_driver(2, lat=10.01)
+        self.assertEqual(eligible_drivers(ride, 5, 5), [free])
+
+    def test_round_counts_only_the_requests_it_inserted(self):
+        ride = make_ride()
+        drivers = [make_driver(n) for n in (1, 2, 3)]
+        # a manual request for the first driver lands between the candidate query and bulk_create
+        manual = RideRequest.objects.create(ride=ride, driver=drivers[0])
+
+        with mock.patch("rides.dispatch.eligible_drivers", return_value=drivers), \
+                mock.patch("rides.dispatch.publish_requests_created") as publish:
+            self.assertEqual(start_auto_dispatch(ride), 2)
+
+        published = publish.call_args.args[1]
+        self.assertEqual(sorted(driver_id for _, driver_id in published), [drivers[1].pk, drivers[2].pk])
+        self.assertNotIn(manual.pk, [pk for pk, _ in published])
+
+    def test_round_sends_no_request_to_a_busy_driver(self):
+        ride = make_ride(1)
+        busy = make_driver(1, current_ride=make_ride(2))
+        free = make_driver(2, lat=10.01)
+
+        with mock.patch("rides.dispatch.publish_requests_created"):
+            self.assertEqual(start_auto_dispatch(ride), 1)
+
+        self.assertFalse(RideRequest.objects.filter(driver=busy).exists())
+        self.assertEqual(list(RideRequest.objects.filter(ride=ride).values_list("driver_id", flat=True)), [free.pk])
+
+
+class RefineCandidatesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_narrow_filter_pages_past_the_cached_pool(self):
+        ride = make_ride()
+        # the highly rated drivers are the farthest, beyond a pool of 2 x 4
+        for n in range(12):
+            make_driver(n, lat=10.0 + n / 1000, rating=4.9 if n >= 10 else 3.0)
+        sizes = []
+
+        def build(size):
+            sizes.append(size)
+            return candidate_pool(Driver.objects.all(), Q(is_available=True), 10.0, 76.3, size)
+
+        with mock.patch("rides.matching.CANDIDATE_POOL_SIZE", 4):
+            chosen = refine_candidates(ride, build, lambda d: d.rating >= 4.5, 2)
+            self.assertEqual([d.user.name for d in chosen], ["Driver 10", "Driver 11"])
+            self.assertEqual(sizes, [4, 8])
+
+            # enough matches in the cached pool: no further queries
+            self.assertEqual(len(refine_candidates(ride, build, lambda d: True, 5)), 5)
+            self.assertEqual(sizes, [4, 8])
+
+    def test_stops_when_the_rows_run_out(self):
+        ride = make_ride()
+        for n in range(3):
+            make_driver(n)
+        sizes = []
+
+        def build(size):
+            sizes.append(size)
+            return candidate_pool(Driver.objects.all(), Q(is_available=True), 10.0, 76.3, size)
+
+        self.assertEqual(refine_candidates(ride, build, lambda d: d.rating >= 4.5, 20), [])
+        self.assertEqual(len(sizes), 1)
@@ -1,5 +1,7 @@
 import math 
 
+import numpy as np
+
 
 def haversine_distance(lat1, lon1, lat2, lon2):
     """Calculate distance between two points using Haversine formula (in kilometers)."""
@@ -21,4 +23,252 @@ def haversine_distance(lat1, lon1, lat2, lon2):
     c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
     distance = R * c
     
-    return distance
\ No newline at end of file
+    return distance
+
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def coordinates_array(values):
+    """Float array from Decimal/float/None values; missing values become NaN."""
+    return np.array([np.nan if v is None else float(v) for v in values], dtype=float)
+
+
+def _haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    distances = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+    # any missing coordinate propagates NaN; callers rank those last
+    return np.where(np.isnan(distances), np.inf, distances)
+
+
+def haversine_many(lat, lon, lats, lons):
+    """
+    Distances (km) from one origin to N destinations as a 1-D array.
+    Destinations (or an origin) with missing coordinates get inf.
+    """
+    lats, lons = coordinates_array(lats), coordinates_array(lons)
+    if lat is None or lon is None:
+        return np.full(lats.shape, np.inf)
+    return _haversine_km(float(lat), float(lon), lats, lons)
+
+
+def haversine_matrix(lats1, lons1, lats2, lons2):
+    """N x M matrix of distances (km) between two point sets; missing coordinates give inf."""
+    lats1, lons1 = coordinates_array(lats1), coordinates_array(lons1)
+    lats2, lons2 = coordinates_array(lats2), coordinates_array(lons2)
+    return _haversine_km(lats1[:, None], lons1[:, None], lats2[None, :], lons2[None, :])
+
+
+# GPS trace cleaning for trip metrics
+TRACE_MIN_POINTS = 10  # fewer usable points than this and the trace is too sparse to trust
+TRACE_MAX_SPEED_KMPH = 180.0  # a point reached and left faster than this is a GPS spike
+TRACE_JITTER_M = 8.0  # displacement below this from the last kept point is noise around a stationary position
+TRACE_MAX_GAP_S = 120.0  # intervals longer than this count as missing coverage
+
+
+def _drop_spikes(lats, lons, times):
+    # a spike is a point both entered and left at an impossible speed; repeat for clustered spikes
+    for _ in range(3):
+        if len(lats) < 3:
+            break
+        step_km = _haversine_km(lats[:-1], lons[:-1], lats[1:], lons[1:])
+        step_h = np.maximum(np.diff(times), 1e-3) / 3600.0
+        too_fast = step_km / step_h > TRACE_MAX_SPEED_KMPH
+        spike = np.zeros(len(lats), dtype=bool)
+        spike[1:-1] = too_fast[:-1] & too_fast[1:]
+        if not spike.any():
+            break
+        keep = ~spike
+        lats, lons, times = lats[keep], lons[keep], times[keep]
+    return lats, lons, times
+
+
+def _jitter_mask(lats, lons):
+    # keep a point once it has moved TRACE_JITTER_M from the last kept one, so slow
+    # but steady movement accumulates while wobble around one spot does not.
+    # Each test depends on the previous decision, so this stays a sequential scan:
+    # cumulative displacement would also sum the wobble. Looping over plain floats
+    # with squared distances keeps it at ~2 ms for a 3-hour 1 Hz trace.
+    meters_per_deg = math.pi * EARTH_RADIUS_KM * 1000.0 / 180.0
+    ys = (lats * meters_per_deg).tolist()
+    xs = (lons * (meters_per_deg * math.cos(math.radians(lats.mean())))).tolist()
+    limit = TRACE_JITTER_M ** 2
+    kept = [0]
+    anchor_x, anchor_y = xs[0], ys[0]
+    for i in range(1, len(xs)):
+        dx, dy = xs[i] - anchor_x, ys[i] - anchor_y
+        if dx * dx + dy * dy >= limit:
+            kept.append(i)
+            anchor_x, anchor_y = xs[i], ys[i]
+    keep = np.zeros(len(xs), dtype=bool)
+    keep[kept] = True
+    return keep
+
+
+def _median3(values):
+    # rolling median over 3 samples, endpoints kept as recorded
+    if len(values) < 3:
+        return values
+    smoothed = values.copy()
+    smoothed[1:-1] = np.median(np.stack([values[:-2], values[1:-1], values[2:]]), axis=0)
+    return smoothed
+
+
+def trace_metrics(lats, lons, timestamps):
+    """
+    Distance (km) and duration (min) driven along a GPS trace, ordered by time.
+
+    Spikes are dropped, positions are median-smoothed and points within
+    TRACE_JITTER_M of the last kept point are skipped before the cumulative
+    haversine is summed.
+    Returns None when the trace is too sparse to trust (too few usable points,
+    or more than half of the time is covered by gaps over TRACE_MAX_GAP_S).
+    """
+    lats, lons = coordinates_array(lats), coordinates_array(lons)
+    times = np.array([t.timestamp() for t in timestamps], dtype=float)
+    valid = ~(np.isnan(lats) | np.isnan(lons))
+    lats, lons, times = _drop_spikes(lats[valid], lons[valid], times[valid])
+    if len(lats) < TRACE_MIN_POINTS:
+        return None
+
+    intervals = np.diff(times)
+    duration_s = times[-1] - times[0]
+    if duration_s <= 0 or intervals[intervals > TRACE_MAX_GAP_S].sum() > duration_s / 2:
+        return None
+
+    lats, lons = _median3(lats), _median3(lons)
+    moved = _jitter_mask(lats, lons)
+    lats, lons = lats[moved], lons[moved]
+    distance_km = float(_haversine_km(lats[:-1], lons[:-1], lats[1:], lons[1:]).sum())
+    return distance_km, float(duration_s) / 60.0
+
+
+def path_length_km(lats, lons):
+    """Cumulative haversine length of a polyline, in kilometers."""
+    lats, lons = coordinates_array(lats), coordinates_array(lons)
+    if len(lats) < 2:
+        return 0.0
+    return float(_haversine_km(lats[:-1], lons[:-1], lats[1:], lons[1:]).sum())
+
+
+def douglas_peucker_mask(lats, lons, tolerance_m):
+    """
+    Boolean mask of the points a Douglas-Peucker simplification keeps: every dropped
+    point lies within `tolerance_m` of the simplified path. Coordinates are projected
+    to local meters (equirectangular), which is exact enough at trip scale.
+    """
+    lats, lons = coordinates_array(lats), coordinates_array(lons)
+    n = len(lats)
+    keep = np.zeros(n, dtype=bool)
+    if n == 0:
+        return keep
+    keep[0] = keep[-1] = True
+
+    meters_per_deg = math.pi * EARTH_RADIUS_KM * 1000.0 / 180.0
+    y = (lats - lats.mean()) * meters_per_deg
+    x = (lons - lons.mean()) * meters_per_deg * math.cos(math.radians(lats.mean()))
+
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        px, py = x[start + 1:end], y[start + 1:end]
+        dx, dy = x[end] - x[start], y[end] - y[start]
+        seg_len_sq = dx * dx + dy * dy
+        if seg_len_sq == 0:
+            t = np.zeros_like(px)
+        else:
+            t = np.clip(((px - x[start]) * dx + (py - y[start]) * dy) / seg_len_sq, 0.0, 1.0)
+        offsets = np.hypot(px - (x[start] + t * dx), py - (y[start] + t * dy))
+        farthest = int(np.argmax(offsets))
+        if offsets[farthest] > tolerance_m:
+            split = start + 1 + farthest
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return keep
+
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 9  # ~5m cells, stored on Driver.geohash
+
+
+def geohash_encode(lat, lon, precision=GEOHASH_PRECISION):
+    """Encode a coordinate as a geohash string of the given length."""
+    lat, lon = float(lat), float(lon)
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+    chars = []
+    bits = 0
+    value = 0
+    even = True  # geohash interleaves bits starting with longitude
+    while len(chars) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            if lon >= mid:
+                value = (value << 1) | 1
+                lon_lo = mid
+            else:
+                value <<= 1
+                lon_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                value = (value << 1) | 1
+                lat_lo = mid
+            else:
+                value <<= 1
+                lat_hi = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits = 0
+            value = 0
+    return "".join(chars)
+
+
+def geohash_bounds(geohash):
+    """Return (lat_lo, lat_hi, lon_lo, lon_hi) of a geohash cell."""
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+    even = True
+    for char in geohash:
+        value = GEOHASH_ALPHABET.index(char)
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            if even:
+                mid = (lon_lo + lon_hi) / 2
+                if bit:
+                    lon_lo = mid
+                else:
+                    lon_hi = mid
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                if bit:
+                    lat_lo = mid
+                else:
+                    lat_hi = mid
+            even = not even
+    return lat_lo, lat_hi, lon_lo, lon_hi
+
+
+def geohash_neighbours(geohash):
+    """Return the (up to 8) distinct cells surrounding a geohash cell."""
+    lat_lo, lat_hi, lon_lo, lon_hi = geohash_bounds(geohash)
+    lat_c, lon_c = (lat_lo + lat_hi) / 2, (lon_lo + lon_hi) / 2
+    dlat, dlon = lat_hi - lat_lo, lon_hi - lon_lo
+    cells = set()
+    for i in (-1, 0, 1):
+        for j in (-1, 0, 1):
+            if i == 0 and j == 0:
+                continue
+            lat = lat_c + i * dlat
+            if lat <= -90.0 or lat >= 90.0:
+                continue
+            lon = (lon_c + j * dlon + 180.0) % 360.0 - 180.0  # wrap the antimeridian
+            cells.add(geohash_encode(lat, lon, len(geohash)))
+    cells.discard(geohash)
+    return sorted(cells)
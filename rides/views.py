@@ -12,14 +12,23 @@ from django.utils import timezone
 from decimal import Decimal
 import math
 import json
-from .utils import haversine_distance
+from .acceptance import release_driver
+from .dispatch import start_auto_dispatch
+from .events import (
+    event_stream_response, publish_requests_cancelled, publish_requests_created, publish_ride_status, ride_channel,
+)
+from .matching import (
+    bump_availability_version, candidate_pool, rank_by_eta, refine_candidates,
+)
 from django.db import transaction
 
 
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django import forms
-from django.db.models import Avg
+from django.db import IntegrityError
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast
 
 from django.utils import timezone
 import datetime as _time
@@ -93,6 +102,16 @@ def select_driver(request, ride_id):
         return redirect('home')
 
     if request.method == 'POST':
+        if request.POST.get('auto_dispatch'):
+            created = start_auto_dispatch(ride)
+            if created is None:
+                messages.warning(request, "Auto-dispatch is already running or the ride is no longer open.")
+            elif created:
+                messages.success(request, f"Auto-dispatch started: requests sent to the {created} nearest drivers.")
+            else:
+                messages.error(request, "No available drivers nearby right now. Please pick a driver below.")
+            return redirect('select_driver', ride_id=ride.id)
+
         driver_id = request.POST.get('driver_id')
         if driver_id:
             try:
@@ -105,11 +124,12 @@ def select_driver(request, ride_id):
                 if existing_request:
                     messages.warning(request, f"You already requested driver {driver.user.name}.")
                 else:
-                    RideRequest.objects.create(
+                    ride_request = RideRequest.objects.create(
                         ride=ride,
                         driver=driver,
                         status=RideRequest.Status.PENDING
                     )
+                    publish_requests_created(ride, [(ride_request.pk, driver.pk)])
                     messages.success(request, f"Request sent to driver {driver.user.name}")
 
             except Driver.DoesNotExist:
@@ -129,62 +149,34 @@ def select_driver(request, ride_id):
         RideRequest.objects.filter(ride=ride).values_list("driver_id", flat=True)
     )
 
-    def compute_distance_or_inf(src_lat, src_lon, dst_lat, dst_lon):
-        try:
-            if dst_lat is None or dst_lon is None:
-                return float('inf')
-            return haversine_distance(src_lat, src_lon, dst_lat, dst_lon)
-        except Exception:
-            return float('inf')
-
     if ride.ride_mode == Ride.Mode.DRIVER_ONLY:
 
+        try:
+            min_rating_value = float(min_rating)
+        except ValueError:
+            messages.error(request, "Invalid minimum rating value.")
+            return redirect('select_driver', ride_id=ride.id)
+
         base_qs = Driver.objects.select_related('user')
         if ride.female_driver_preference:
             base_qs = base_qs.filter(user__gender='female')
-        if min_rating:
-            try:
-                base_qs = base_qs.filter(rating__gte=float(min_rating))
-            except ValueError:
-                messages.error(request, "Invalid minimum rating value.")
-                return redirect('select_driver', ride_id=ride.id)
-
-        strict_qs = base_qs.filter(
-            is_available=True,
-            verified=True,
-            background_check_passed=True
-        )
 
-        driver_list = []
-        for driver in strict_qs:
-            distance = compute_distance_or_inf(
-                ride.start_latitude, ride.start_longitude,
-                driver.latitude, driver.longitude
+        def build_pool(size):
+            # Strict: available drivers closest to the pickup; fallback: other verified drivers by rating
+            return candidate_pool(
+                base_qs.filter(verified=True, background_check_passed=True),
+                Q(is_available=True),
+                ride.start_latitude, ride.start_longitude, size
             )
-            driver.distance = distance
-            driver.already_requested = driver.id in requested_driver_ids
-            driver_list.append(driver)
-
-        if len(driver_list) < DESIRED_RESULTS:
-            existing_ids = [d.id for d in driver_list]
-            needed = DESIRED_RESULTS - len(driver_list)
-
-            extra_qs = base_qs.exclude(id__in=existing_ids)\
-                .filter(verified=True, background_check_passed=True)\
-                .order_by('-rating')[:needed]
 
+        # The unfiltered pool is cached per ride; presence and the page's filters are applied over it in memory
+        driver_list = refine_candidates(ride, build_pool, lambda d: d.rating >= min_rating_value, DESIRED_RESULTS)
 
-            for driver in extra_qs:
-                distance = compute_distance_or_inf(
-                    ride.start_latitude, ride.start_longitude,
-                    driver.latitude, driver.longitude
-                )
-                driver.distance = distance
-                driver.already_requested = driver.id in requested_driver_ids
-                driver_list.append(driver)
+        for driver in driver_list:
+            driver.already_requested = driver.id in requested_driver_ids
 
-        # Final sort by distance (closest first)
-        sorted_drivers = sorted(driver_list, key=lambda x: x.distance)
+        # Closest first (refine_candidates), then the closest few re-ordered by driving ETA to the pickup
+        sorted_drivers = rank_by_eta(driver_list, ride.start_latitude, ride.start_longitude)
 
         # Normalize ride_mode to a lowercase string so template checks work
         try:
@@ -203,66 +195,50 @@ def select_driver(request, ride_id):
         }
 
     else:  # CAR_WITH_DRIVER
-        
-        base_qs = Vehicle.objects.select_related('current_driver__user')
+
+        try:
+            min_rating_value = float(min_rating)
+        except ValueError:
+            messages.error(request, "Invalid minimum rating value.")
+            return redirect('select_driver', ride_id=ride.id)
+
+        # images are prefetched so the cached pool renders without a query per card
+        base_qs = Vehicle.objects.select_related('current_driver__user').prefetch_related('images')
         if ride.female_driver_preference:
             base_qs = base_qs.filter(current_driver__user__gender='female')
-        if vehicle_type:
-            base_qs = base_qs.filter(vehicle_type=vehicle_type)
-        if transmission:
-            base_qs = base_qs.filter(transmission=transmission)
-        if fuel_type:
-            base_qs = base_qs.filter(fuel_type=fuel_type)
-        if min_rating:
-            try:
-                base_qs = base_qs.filter(current_driver__rating__gte=float(min_rating))
-            except ValueError:
-                messages.error(request, "Invalid minimum rating value.")
-                return redirect('select_driver', ride_id=ride.id)
-
-        # Strict: add hard constraints
-        strict_qs = base_qs.filter(
-            current_driver__is_available=True,
-            current_driver__verified=True,
-            current_driver__background_check_passed=True,
-            active=True,
-            verified=True
-        )
 
-        vehicle_list = []
-        for vehicle in strict_qs:
-            driver = vehicle.current_driver
-            distance = compute_distance_or_inf(
-                ride.start_latitude, ride.start_longitude,
-                getattr(driver, 'latitude', None), getattr(driver, 'longitude', None)
+        def build_pool(size):
+            # Strict: add hard constraints; fallback: other active vehicles with a verified driver, by rating
+            return candidate_pool(
+                base_qs.filter(
+                    active=True,
+                    current_driver__verified=True,
+                    current_driver__background_check_passed=True
+                ),
+                Q(current_driver__is_available=True, verified=True),
+                ride.start_latitude, ride.start_longitude, size,
+                driver_path='current_driver__'
+            )
+
+        def matches(vehicle):
+            return (
+                (not vehicle_type or vehicle.vehicle_type == vehicle_type)
+                and (not transmission or vehicle.transmission == transmission)
+                and (not fuel_type or vehicle.fuel_type == fuel_type)
+                and vehicle.current_driver.rating >= min_rating_value
             )
-            vehicle.distance = distance
-            vehicle.already_requested = driver.id in requested_driver_ids
+
+        vehicle_list = refine_candidates(ride, build_pool, matches, DESIRED_RESULTS, driver_path='current_driver__')
+
+        for vehicle in vehicle_list:
+            driver = vehicle.current_driver
+            vehicle.already_requested = (driver.id in requested_driver_ids) if driver else False
             vehicle.driver = driver
-            vehicle_list.append(vehicle)
-
-        if len(vehicle_list) < DESIRED_RESULTS:
-            existing_vehicle_ids = [v.id for v in vehicle_list]
-            needed = DESIRED_RESULTS - len(vehicle_list)
-
-            extra_qs = base_qs.filter(
-                active=True,
-                current_driver__verified=True,
-                current_driver__background_check_passed=True
-            ).exclude(id__in=existing_vehicle_ids).order_by('-current_driver__rating')[:needed]
-
-            for vehicle in extra_qs:
-                driver = vehicle.current_driver
-                distance = compute_distance_or_inf(
-                    ride.start_latitude, ride.start_longitude,
-                    getattr(driver, 'latitude', None), getattr(driver, 'longitude', None)
-                )
-                vehicle.distance = distance
-                vehicle.already_requested = (driver.id in requested_driver_ids) if driver else False
-                vehicle.driver = driver
-                vehicle_list.append(vehicle)
-
-        sorted_vehicles = sorted(vehicle_list, key=lambda x: x.distance)
+
+        sorted_vehicles = rank_by_eta(
+            vehicle_list, ride.start_latitude, ride.start_longitude,
+            drivers=[v.current_driver for v in vehicle_list]
+        )
 
         # Normalize ride_mode to a lowercase string so template checks work
         try:
@@ -348,10 +324,13 @@ def trip_detail(request, ride_id):
                     ride.vehicle = None
                     ride.updated_at = timezone.now()
                     ride.save()
+                    release_driver(ride.pk)
                     # mark pending requests as auto-cancelled
-                    RideRequest.objects.filter(ride=ride, status=RideRequest.Status.PENDING).update(
-                        status=RideRequest.Status.AUTO_CANCELLED, responded_at=timezone.now()
-                    )
+                    pending = RideRequest.objects.filter(ride=ride, status=RideRequest.Status.PENDING)
+                    cancelled = list(pending.values_list("pk", "ride_id", "driver_id"))
+                    pending.update(status=RideRequest.Status.AUTO_CANCELLED, responded_at=timezone.now())
+                    publish_requests_cancelled(cancelled, RideRequest.Status.AUTO_CANCELLED)
+                    publish_ride_status(ride)
                     messages.success(request, "Ride cancelled.")
                     return redirect('my_trips')
 
@@ -362,10 +341,13 @@ def trip_detail(request, ride_id):
                     ride.vehicle = None
                     ride.updated_at = timezone.now()
                     ride.save()
+                    release_driver(ride.pk)
                     # mark previously accepted request (if any) as auto_cancelled
-                    RideRequest.objects.filter(ride=ride, status=RideRequest.Status.ACCEPTED).update(
-                        status=RideRequest.Status.AUTO_CANCELLED, responded_at=timezone.now()
-                    )
+                    accepted = RideRequest.objects.filter(ride=ride, status=RideRequest.Status.ACCEPTED)
+                    cancelled = list(accepted.values_list("pk", "ride_id", "driver_id"))
+                    accepted.update(status=RideRequest.Status.AUTO_CANCELLED, responded_at=timezone.now())
+                    publish_requests_cancelled(cancelled, RideRequest.Status.AUTO_CANCELLED)
+                    publish_ride_status(ride)
                     messages.success(request, "Ride reopened. Please choose another driver.")
                     return redirect('select_driver', ride_id=ride.id)
 
@@ -377,6 +359,7 @@ def trip_detail(request, ride_id):
                         rr.status = RideRequest.Status.AUTO_CANCELLED
                         rr.responded_at = timezone.now()
                         rr.save()
+                        publish_requests_cancelled([(rr.pk, rr.ride_id, rr.driver_id)], rr.status)
                         messages.success(request, "Request closed.")
                     else:
                         messages.error(request, "Cannot close that request.")
@@ -425,6 +408,20 @@ def trip_detail(request, ride_id):
     return render(request, 'trip_detail.html', context)
 
 
+@login_required_role(['customer'])
+async def trip_events(request, ride_id):
+    """
+    Server-sent events for one of the customer's rides, so trip_detail can patch itself:
+      event: status          data: { "ride_id", "status", "status_display", "total_amount", "driver_name"? }
+      event: request_status  data: { "request_id", "ride_id", "status", "status_display" }
+      event: position        data: { "latitude", "longitude", "at" }   # driver position while ongoing
+    """
+    customer_id = await request.session.aget('user_id')
+    if not await Ride.objects.filter(id=ride_id, customer_id=customer_id).aexists():
+        return JsonResponse({'error': 'Ride not found.'}, status=404)
+    return event_stream_response(request, ride_channel(ride_id))
+
+
 class RatingForm(forms.ModelForm):
     score = forms.IntegerField(min_value=1, max_value=5, initial=5)
 
@@ -450,24 +447,27 @@ def rate_ride(request, ride_id):
             rating.customer_id = request.session.get('user_id')
             rating.driver = ride.driver
             rating.vehicle = ride.vehicle
-            rating.save()
-            
-            # Update driver's average rating
-            if ride.driver:
-                driver_ratings = Rating.objects.filter(driver=ride.driver)
-                if driver_ratings.exists():
-                    avg_driver_rating = driver_ratings.aggregate(Avg('score'))['score__avg']
-                    ride.driver.rating = avg_driver_rating
-                    ride.driver.save()
-            
-            # Update vehicle's average rating (assuming Vehicle has a 'rating' field)
-            if ride.vehicle:
-                vehicle_ratings = Rating.objects.filter(vehicle=ride.vehicle)
-                if vehicle_ratings.exists():
-                    avg_vehicle_rating = vehicle_ratings.aggregate(Avg('score'))['score__avg']
-                    ride.vehicle.rating = avg_vehicle_rating
-                    ride.vehicle.save()
-            
+            try:
+                with transaction.atomic():
+                    rating.save()
+                    # bump the stored totals in SQL, so concurrent ratings for the same driver both count
+                    if ride.driver_id:
+                        Driver.objects.filter(pk=ride.driver_id).update(
+                            rating_sum=F('rating_sum') + rating.score,
+                            rating_count=F('rating_count') + 1,
+                            rating=Cast(F('rating_sum') + rating.score, FloatField()) / (F('rating_count') + 1),
+                        )
+                    if ride.vehicle_id:
+                        Vehicle.objects.filter(pk=ride.vehicle_id).update(
+                            rating_sum=F('rating_sum') + rating.score,
+                            rating_count=F('rating_count') + 1,
+                        )
+                    # cached select_driver pools carry driver ratings
+                    transaction.on_commit(bump_availability_version)
+            except IntegrityError:
+                messages.error(request, "You have already rated this ride.")
+                return redirect('trip_detail', ride_id=ride_id)
+
             messages.success(request, "Rating submitted successfully.")
             return redirect('my_trips')  # Redirect after success
     else:
@@ -484,10 +484,9 @@ def rate_ride(request, ride_id):
 def view_driver_rating(request, driver_id):
     driver = get_object_or_404(Driver, pk=driver_id)
     ratings = Rating.objects.filter(driver=driver)
-    avg_rating = ratings.aggregate(Avg('score'))['score__avg'] if ratings.exists() else 0.0
     context = {
         'driver': driver,
-        'avg_rating': avg_rating,
+        'avg_rating': driver.average_rating or 0.0,
         'ratings': ratings.order_by('-created_at'),  # List individual ratings if needed
     }
     return render(request, 'view_driver_rating.html', context)
@@ -0,0 +1,84 @@
+"""
+Pluggable driving-distance backends.
+
+settings.ROUTING selects the backend by dotted path, e.g.
+
+    ROUTING = {
+        "BACKEND": "routing.backends.local.LocalGraphRouter",
+        "OPTIONS": {"OSM_FILE": "/data/kerala.osm"},
+    }
+
+and get_router() returns the configured instance (built once per process).
+route() answers through routing.cache, so repeated trips between the same
+neighbourhoods skip the backend. With fallback=True a failed lookup (no route,
+timeout, open circuit) is answered with a straight-line estimate instead.
+"""
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+DEFAULT_ROUTING = {
+    "BACKEND": "routing.backends.osrm.OSRMRouter",
+    "OPTIONS": {},
+}
+
+FALLBACK_SPEED_KMPH = 40  # average speed assumed by the straight-line estimate (very rough)
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router():
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                config = getattr(settings, "ROUTING", DEFAULT_ROUTING)
+                backend = import_string(config["BACKEND"])
+                _router = backend(**{k.lower(): v for k, v in config.get("OPTIONS", {}).items()})
+    return _router
+
+
+def haversine_estimate(lat1, lon1, lat2, lon2):
+    """Straight-line (distance_km, duration_min, "haversine") at FALLBACK_SPEED_KMPH."""
+    from rides.utils import haversine_distance
+
+    distance_km = haversine_distance(lat1, lon1, lat2, lon2)
+    return distance_km, distance_km / FALLBACK_SPEED_KMPH * 60, "haversine"
+
+
+def route(lat1, lon1, lat2, lon2, cached=True, fallback=False):
+    """Driving (distance_km, duration_min, source) via the configured backend, or (None, None, None)."""
+    points = float(lat1), float(lon1), float(lat2), float(lon2)
+    if cached:
+        from .cache import route_cache
+
+        result = route_cache.get_or_route(get_router(), *points)
+    else:
+        result = get_router().route(*points)
+    if result[0] is None and fallback:
+        return haversine_estimate(*points)
+    return result
+
+
+def table(sources, destinations, budget=None):
+    """Batched (durations_min, distances_km) matrices via the configured backend, or None; see BaseRouter.table."""
+    sources = [(float(lat), float(lon)) for lat, lon in sources]
+    destinations = [(float(lat), float(lon)) for lat, lon in destinations]
+    return get_router().table(sources, destinations, budget=budget)
+
+
+async def aroute(lat1, lon1, lat2, lon2, cached=True, fallback=False):
+    """route() for async views: awaits the backend's aroute() instead of blocking the event loop."""
+    points = float(lat1), float(lon1), float(lat2), float(lon2)
+    if cached:
+        from .cache import route_cache
+
+        result = await route_cache.aget_or_route(get_router(), *points)
+    else:
+        result = await get_router().aroute(*points)
+    if result[0] is None and fallback:
+        return haversine_estimate(*points)
+    return result
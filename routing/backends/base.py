@@ -0,0 +1,34 @@
+from asgiref.sync import sync_to_async
+
+
+class BaseRouter:
+    """Answers driving distance/duration queries between two coordinates."""
+
+    name = "base"
+
+    def route(self, lat1, lon1, lat2, lon2):
+        """Return (distance_km, duration_min, source), or (None, None, None) when no route is found."""
+        raise NotImplementedError
+
+    async def aroute(self, lat1, lon1, lat2, lon2):
+        """route() for async callers. This fallback runs route() in a worker thread."""
+        return await sync_to_async(self.route, thread_sensitive=False)(lat1, lon1, lat2, lon2)
+
+    def table(self, sources, destinations, budget=None):
+        """
+        Durations (min) and distances (km) from every source to every destination, as two
+        len(sources) x len(destinations) lists of lists with None where no route exists.
+        Points are (lat, lon). Returns None when the backend cannot answer at all.
+        `budget` caps the seconds a remote backend may wait; in-process backends ignore it.
+
+        This fallback routes each pair separately; backends override it with one batched query.
+        """
+        durations, distances = [], []
+        for lat1, lon1 in sources:
+            durations.append([])
+            distances.append([])
+            for lat2, lon2 in destinations:
+                distance_km, duration_min, _ = self.route(lat1, lon1, lat2, lon2)
+                durations[-1].append(duration_min)
+                distances[-1].append(distance_km)
+        return durations, distances
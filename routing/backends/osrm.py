@@ -0,0 +1,38 @@
+from ..client import OSRMClient, RoutingUnavailable
+from .base import BaseRouter
+
+
+class OSRMRouter(BaseRouter):
+    """
+    Routes through an OSRM server (the public demo server by default) with a pooled,
+    retrying client; see routing.client.OSRMClient for the options besides base_url.
+    """
+
+    name = "osrm"
+
+    def __init__(self, base_url="http://router.project-osrm.org", profile="driving", **client_options):
+        self.client = OSRMClient(base_url, profile=profile, **client_options)
+
+    def route(self, lat1, lon1, lat2, lon2):
+        try:
+            result = self.client.route(lat1, lon1, lat2, lon2)
+        except RoutingUnavailable:
+            return None, None, None
+        if result is None:
+            return None, None, None
+        return result[0], result[1], self.name
+
+    async def aroute(self, lat1, lon1, lat2, lon2):
+        try:
+            result = await self.client.aroute(lat1, lon1, lat2, lon2)
+        except RoutingUnavailable:
+            return None, None, None
+        if result is None:
+            return None, None, None
+        return result[0], result[1], self.name
+
+    def table(self, sources, destinations, budget=None):
+        try:
+            return self.client.table(sources, destinations, budget=budget)
+        except RoutingUnavailable:
+            return None
@@ -0,0 +1,187 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+
+from rides.utils import geohash_encode
+
+
+logger = logging.getLogger(__name__)
+
+STATS_LOG_EVERY = 1000  # lookups between hit-rate log lines
+
+
+class RouteCache:
+    """
+    Two-tier cache of routed (distance_km, duration_min) answers.
+
+    Keys snap origin and destination to geohash cells of ROUTE_CACHE_PRECISION
+    (7 = ~150m), so requests between the same neighbourhoods share one answer.
+    The first tier is a per-process LRU of ROUTE_CACHE_MAX_ENTRIES; misses fall
+    through to RouteCacheEntry rows, which survive restarts and are shared by
+    all workers. Both tiers expire entries after ROUTE_CACHE_TTL seconds.
+    Failed lookups are never cached.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (distance_km, duration_min, expires_at monotonic)
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    @property
+    def precision(self):
+        return getattr(settings, "ROUTE_CACHE_PRECISION", 7)
+
+    @property
+    def ttl(self):
+        return getattr(settings, "ROUTE_CACHE_TTL", 7 * 24 * 3600)
+
+    @property
+    def max_entries(self):
+        return getattr(settings, "ROUTE_CACHE_MAX_ENTRIES", 10000)
+
+    def key(self, backend, lat1, lon1, lat2, lon2):
+        return (
+            backend,
+            geohash_encode(lat1, lon1, self.precision),
+            geohash_encode(lat2, lon2, self.precision),
+        )
+
+    def get_or_route(self, router, lat1, lon1, lat2, lon2):
+        """(distance_km, duration_min, source) from the cache, routing with `router` on a miss."""
+        key = self.key(router.name, lat1, lon1, lat2, lon2)
+        self._maybe_log_stats()
+        cached = self._memory_get(key)
+        if cached is not None:
+            return cached[0], cached[1], router.name
+
+        cached = self._db_get(key)
+        if cached is not None:
+            self._memory_set(key, *cached, db_hit=True)
+            return cached[0], cached[1], router.name
+
+        with self._lock:
+            self.misses += 1
+        distance_km, duration_min, source = router.route(lat1, lon1, lat2, lon2)
+        if distance_km is not None:
+            self._memory_set(key, distance_km, duration_min)
+            self._db_set(key, distance_km, duration_min)
+        return distance_km, duration_min, source
+
+    async def aget_or_route(self, router, lat1, lon1, lat2, lon2):
+        """get_or_route() for async views: the DB tier runs via sync_to_async, routing awaits router.aroute()."""
+        key = self.key(router.name, lat1, lon1, lat2, lon2)
+        self._maybe_log_stats()
+        cached = self._memory_get(key)
+        if cached is not None:
+            return cached[0], cached[1], router.name
+
+        cached = await sync_to_async(self._db_get)(key)
+        if cached is not None:
+            self._memory_set(key, *cached, db_hit=True)
+            return cached[0], cached[1], router.name
+
+        with self._lock:
+            self.misses += 1
+        distance_km, duration_min, source = await router.aroute(lat1, lon1, lat2, lon2)
+        if distance_km is not None:
+            self._memory_set(key, distance_km, duration_min)
+            await sync_to_async(self._db_set)(key, distance_km, duration_min)
+        return distance_km, duration_min, source
+
+    def _maybe_log_stats(self):
+        if (self.memory_hits + self.db_hits + self.misses + 1) % STATS_LOG_EVERY == 0:
+            logger.info("Route cache stats: %s", self.stats())
+
+    # --- memory tier ------------------------------------------------------
+
+    def _memory_get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[2] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            self.memory_hits += 1
+            return entry[0], entry[1]
+
+    def _memory_set(self, key, distance_km, duration_min, db_hit=False):
+        with self._lock:
+            if db_hit:
+                self.db_hits += 1
+            self._entries[key] = (distance_km, duration_min, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    # --- persistent tier --------------------------------------------------
+
+    def _db_get(self, key):
+        from .models import RouteCacheEntry
+
+        backend, origin_cell, destination_cell = key
+        try:
+            # savepoint: a failing cache read must not break a caller's transaction
+            with transaction.atomic():
+                row = (
+                    RouteCacheEntry.objects.filter(
+                        backend=backend,
+                        origin_cell=origin_cell,
+                        destination_cell=destination_cell,
+                        created_at__gte=timezone.now() - timedelta(seconds=self.ttl),
+                    )
+                    .values_list("distance_km", "duration_min")
+                    .first()
+                )
+        except DatabaseError:
+            logger.exception("Route cache read failed")
+            return None
+        return row
+
+    def _db_set(self, key, distance_km, duration_min):
+        from .models import RouteCacheEntry
+
+        backend, origin_cell, destination_cell = key
+        try:
+            with transaction.atomic():
+                RouteCacheEntry.objects.update_or_create(
+                    backend=backend,
+                    origin_cell=origin_cell,
+                    destination_cell=destination_cell,
+                    defaults={"distance_km": distance_km, "duration_min": duration_min, "created_at": timezone.now()},
+                )
+        except DatabaseError:
+            # the route is still served from memory; the next worker to miss retries the write
+            logger.exception("Route cache write failed")
+
+    # --- maintenance ------------------------------------------------------
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.memory_hits = self.db_hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            entries, memory_hits, db_hits, misses = len(self._entries), self.memory_hits, self.db_hits, self.misses
+        lookups = memory_hits + db_hits + misses
+        return {
+            "entries": entries,
+            "memory_hits": memory_hits,
+            "db_hits": db_hits,
+            "misses": misses,
+            "hit_rate": (memory_hits + db_hits) / lookups if lookups else 0.0,
+        }
+
+
+route_cache = RouteCache()
@@ -0,0 +1,271 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+
+import requests
+from asgiref.sync import sync_to_async
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+except ImportError:  # async calls then run the sync client in a worker thread
+    httpx = None
+
+
+logger = logging.getLogger(__name__)
+
+
+class RoutingUnavailable(Exception):
+    """The routing service could not answer within the request's budget, or its circuit is open."""
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing service for a while.
+
+    After `failure_threshold` consecutive failures the circuit opens and every call
+    fails fast for `reset_timeout` seconds. Then a single trial call is let through
+    (half-open): success closes the circuit, failure opens it again, and a trial that
+    ends without a verdict (release()) lets the next call try instead.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self._opened_at < self.reset_timeout:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning("Routing circuit opened after %d failures", self._failures)
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+    def release(self):
+        """End a call that gave no verdict (cancelled, or an unexpected error) without counting it."""
+        with self._lock:
+            self._trial_running = False
+
+
+class OSRMClient:
+    """
+    Keep-alive HTTP client for an OSRM server.
+
+    One requests.Session with a pooled adapter is shared by all threads of the
+    process. Each call gets a deadline `budget` (seconds) that covers every attempt.
+    Connection errors, timeouts, 429 and 5xx answers are retried with full-jitter
+    exponential backoff while the budget lasts; a call that fails after all of its
+    attempts counts once towards the circuit breaker, and while the circuit is
+    half-open the whole call is the trial. A "no route" answer is a normal response
+    and counts as a success.
+
+    The async methods (arequest, aroute) follow the same rules on a non-blocking
+    httpx.AsyncClient, one per event loop (closed when that loop shuts down), with up to
+    `async_pool_size` connections.
+    Without httpx installed they fall back to the sync client in a worker thread.
+    """
+
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+    ROUTE_PARAMS = {"overview": "false", "alternatives": "false", "steps": "false"}
+
+    def __init__(self, base_url, profile="driving", budget=5.0, connect_timeout=1.0, retries=2,
+                 backoff=0.1, pool_size=10, breaker_threshold=5, breaker_reset=30.0, async_pool_size=100):
+        self.base_url = base_url.rstrip("/")
+        self.profile = profile
+        self.budget = budget
+        self.connect_timeout = connect_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.async_pool_size = async_pool_size
+        self._async_clients = {}  # event loop -> httpx.AsyncClient
+        self._closers = {}  # event loop -> its _close_with_loop task; loops only hold weak references to tasks
+        self._async_lock = threading.Lock()
+
+    def _url(self, service, coordinates):
+        path = ";".join(f"{lon},{lat}" for lat, lon in coordinates)
+        return f"{self.base_url}/{service}/v1/{self.profile}/{path}"
+
+    def _pause(self, attempt, deadline):
+        """Seconds to back off before the next attempt, or None when no attempt is left in the budget."""
+        if attempt >= self.retries:
+            return None
+        pause = random.uniform(0, self.backoff * 2 ** attempt)
+        return None if time.monotonic() + pause >= deadline else pause
+
+    def request(self, service, coordinates, params=None, budget=None):
+        """GET /{service}/v1/{profile}/{lon,lat;...} and return the decoded JSON body."""
+        if not self.breaker.allow():
+            raise RoutingUnavailable("circuit open")
+        deadline = time.monotonic() + (self.budget if budget is None else budget)
+        url = self._url(service, coordinates)
+
+        try:
+            for attempt in range(self.retries + 1):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    error = "deadline exceeded"
+                    break
+                try:
+                    response = self.session.get(
+                        url, params=params, timeout=(min(self.connect_timeout, remaining), remaining)
+                    )
+                    if response.status_code not in self.RETRY_STATUSES:
+                        data = response.json()
+                        self.breaker.record_success()
+                        return data
+                    error = f"HTTP {response.status_code}"
+                except (requests.RequestException, ValueError) as e:
+                    error = e
+
+                pause = self._pause(attempt, deadline)
+                if pause is None:
+                    break
+                time.sleep(pause)
+        except BaseException:
+            # anything else escaping here must not leave a half-open trial running forever
+            self.breaker.release()
+            raise
+        self.breaker.record_failure()
+        raise RoutingUnavailable(f"{service} failed: {error}")
+
+    def _async_client(self):
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            with self._async_lock:
+                # a loop closed without cancelling its tasks never ran _close_with_loop
+                for old_loop in [old for old in self._async_clients if old.is_closed()]:
+                    del self._async_clients[old_loop]
+                    self._closers.pop(old_loop, None)
+                client = self._async_clients.get(loop)
+                if client is None:
+                    client = httpx.AsyncClient(limits=httpx.Limits(
+                        max_connections=self.async_pool_size, max_keepalive_connections=self.async_pool_size
+                    ))
+                    self._async_clients[loop] = client
+                    self._closers[loop] = loop.create_task(self._close_with_loop(loop, client))
+        return client
+
+    async def _close_with_loop(self, loop, client):
+        # Under WSGI every async view runs on its own short-lived loop (asyncio.run via asgiref),
+        # which cancels leftover tasks before closing: this one then closes the loop's client
+        # and its connections while the loop can still run it. Long-lived ASGI loops keep theirs.
+        try:
+            await loop.create_future()
+        finally:
+            with self._async_lock:
+                if self._async_clients.get(loop) is client:
+                    del self._async_clients[loop]
+                    self._closers.pop(loop, None)
+            await client.aclose()
+
+    async def arequest(self, service, coordinates, params=None, budget=None):
+        """request() for async callers: awaits the HTTP exchange instead of holding a thread."""
+        if httpx is None:
+            return await sync_to_async(self.request, thread_sensitive=False)(service, coordinates, params, budget)
+        if not self.breaker.allow():
+            raise RoutingUnavailable("circuit open")
+        deadline = time.monotonic() + (self.budget if budget is None else budget)
+        url = self._url(service, coordinates)
+        client = self._async_client()
+
+        try:
+            for attempt in range(self.retries + 1):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    error = "deadline exceeded"
+                    break
+                try:
+                    response = await client.get(
+                        url, params=params,
+                        timeout=httpx.Timeout(remaining, connect=min(self.connect_timeout, remaining)),
+                    )
+                    if response.status_code not in self.RETRY_STATUSES:
+                        data = response.json()
+                        self.breaker.record_success()
+                        return data
+                    error = f"HTTP {response.status_code}"
+                except (httpx.HTTPError, ValueError) as e:
+                    error = e
+
+                pause = self._pause(attempt, deadline)
+                if pause is None:
+                    break
+                await asyncio.sleep(pause)
+        except BaseException:
+            # e.g. CancelledError when the client of an async view disconnects
+            self.breaker.release()
+            raise
+        self.breaker.record_failure()
+        raise RoutingUnavailable(f"{service} failed: {error}")
+
+    @staticmethod
+    def _first_route(data):
+        if data.get("code") == "Ok" and data.get("routes"):
+            route = data["routes"][0]
+            return float(route["distance"]) / 1000.0, float(route["duration"]) / 60.0  # seconds → minutes
+        return None
+
+    def route(self, lat1, lon1, lat2, lon2, budget=None):
+        """(distance_km, duration_min) of the fastest route, or None when OSRM finds none."""
+        data = self.request("route", [(lat1, lon1), (lat2, lon2)], self.ROUTE_PARAMS, budget)
+        return self._first_route(data)
+
+    def table(self, sources, destinations, budget=None):
+        """
+        (durations_min, distances_km) matrices from each source to each destination in one
+        /table call, with None where OSRM finds no route. Points are (lat, lon).
+        """
+        params = {
+            "sources": ";".join(str(i) for i in range(len(sources))),
+            "destinations": ";".join(str(len(sources) + i) for i in range(len(destinations))),
+            "annotations": "duration,distance",
+        }
+        data = self.request("table", list(sources) + list(destinations), params, budget)
+        if data.get("code") != "Ok":
+            raise RoutingUnavailable(f"table failed: {data.get('code')}")
+        durations = [[None if s is None else s / 60.0 for s in row] for row in data["durations"]]
+        distances = [[None if m is None else m / 1000.0 for m in row] for row in data["distances"]]
+        return durations, distances
+
+    async def aroute(self, lat1, lon1, lat2, lon2, budget=None):
+        data = await self.arequest("route", [(lat1, lon1), (lat2, lon2)], self.ROUTE_PARAMS, budget)
+        return self._first_route(data)
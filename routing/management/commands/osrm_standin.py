@@ -0,0 +1,124 @@
+import json
+import random
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from django.core.management.base import BaseCommand
+
+from rides.utils import haversine_distance
+
+
+class StandInOSRM(ThreadingHTTPServer):
+    """
+    Minimal OSRM look-alike for local testing: answers /route and /table with the
+    straight-line distance times `detour` at `speed_kmph`, after `delay` seconds,
+    and with HTTP 503 for the first `fail_first` requests and a `fail_rate` fraction
+    of the rest. `requests_served` counts every request answered.
+    """
+
+    daemon_threads = True
+    request_queue_size = 128  # accept bursts of concurrent clients
+
+    def __init__(self, address, delay=0.0, fail_rate=0.0, detour=1.3, speed_kmph=40.0, fail_first=0):
+        super().__init__(address, _Handler)
+        self.delay = delay
+        self.fail_rate = fail_rate
+        self.fail_first = fail_first
+        self.requests_served = 0
+        self.detour = detour
+        self.speed_kmph = speed_kmph
+
+    def handle_error(self, request, client_address):
+        # a client that gave up (timeout, cancelled call) closed the connection before the answer
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def leg(self, a, b):
+        meters = haversine_distance(a[1], a[0], b[1], b[0]) * 1000.0 * self.detour
+        return meters, meters / (self.speed_kmph / 3.6)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like a real OSRM server
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        server = self.server
+        server.requests_served += 1
+        if server.delay:
+            time.sleep(server.delay)
+        if server.requests_served <= server.fail_first or random.random() < server.fail_rate:
+            return self._send(503, {"code": "Unavailable"})
+
+        url = urlsplit(self.path)
+        parts = url.path.strip("/").split("/")
+        if len(parts) != 4:
+            return self._send(400, {"code": "InvalidUrl"})
+        service, coordinates = parts[0], parts[3]
+        try:
+            points = [tuple(map(float, p.split(","))) for p in coordinates.split(";")]
+        except ValueError:
+            return self._send(400, {"code": "InvalidQuery"})
+
+        if service == "route" and len(points) >= 2:
+            legs = [server.leg(a, b) for a, b in zip(points, points[1:])]
+            distance, duration = sum(m for m, _ in legs), sum(s for _, s in legs)
+            return self._send(200, {"code": "Ok", "routes": [{"distance": distance, "duration": duration}]})
+        if service == "table":
+            query = parse_qs(url.query)
+
+            def indices(name):
+                value = query.get(name, ["all"])[0]
+                return range(len(points)) if value == "all" else [int(i) for i in value.split(";")]
+
+            sources, destinations = indices("sources"), indices("destinations")
+            legs = [[server.leg(points[i], points[j]) for j in destinations] for i in sources]
+            return self._send(200, {
+                "code": "Ok",
+                "durations": [[s for _, s in row] for row in legs],
+                "distances": [[m for m, _ in row] for row in legs],
+            })
+        return self._send(400, {"code": "InvalidService"})
+
+    def _send(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = "Serve an OSRM-compatible stand-in (/route, /table) for testing the routing client offline."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--port", type=int, default=5005)
+        parser.add_argument("--delay", type=float, default=0.0, help="seconds to wait before answering")
+        parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+        parser.add_argument("--detour", type=float, default=1.3, help="road distance / straight-line distance")
+        parser.add_argument("--speed", type=float, default=40.0, help="average speed in km/h")
+
+    def handle(self, *args, **options):
+        server = StandInOSRM(
+            ("127.0.0.1", options["port"]),
+            delay=options["delay"],
+            fail_rate=options["fail_rate"],
+            detour=options["detour"],
+            speed_kmph=options["speed"],
+        )
+        self.stdout.write(
+            f"OSRM stand-in on http://127.0.0.1:{options['port']} "
+            f"(delay {options['delay']}s, fail rate {options['fail_rate']:.0%}); set OSRM_BASE_URL to use it"
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
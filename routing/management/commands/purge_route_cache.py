@@ -0,0 +1,23 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from routing.cache import route_cache
+from routing.models import RouteCacheEntry
+
+
+class Command(BaseCommand):
+    help = "Delete RouteCacheEntry rows older than ROUTE_CACHE_TTL (or --older-than seconds)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than", type=int, default=None, help="age in seconds (default: ROUTE_CACHE_TTL)")
+        parser.add_argument("--all", action="store_true", help="delete every entry, e.g. after a road graph update")
+
+    def handle(self, *args, **options):
+        entries = RouteCacheEntry.objects.all()
+        if not options["all"]:
+            age = options["older_than"] if options["older_than"] is not None else route_cache.ttl
+            entries = entries.filter(created_at__lt=timezone.now() - timedelta(seconds=age))
+        deleted, _ = entries.delete()
+        self.stdout.write(f"Deleted {deleted} cached routes, {RouteCacheEntry.objects.count()} remain")
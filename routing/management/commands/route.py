@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from routing import get_router, route
+from routing.cache import route_cache
+
+
+class Command(BaseCommand):
+    help = "Route between two coordinates with the configured backend and report query latency."
+
+    def add_arguments(self, parser):
+        parser.add_argument("lat1", type=float)
+        parser.add_argument("lon1", type=float)
+        parser.add_argument("lat2", type=float)
+        parser.add_argument("lon2", type=float)
+        parser.add_argument("--repeat", type=int, default=1, help="run the query this many times")
+        parser.add_argument("--cached", action="store_true", help="go through the route cache and report its stats")
+
+    def handle(self, *args, **options):
+        router = get_router()
+        if hasattr(type(router), "graph"):  # local backend: load the graph outside the timings
+            started = time.perf_counter()
+            self.stdout.write(f"graph: {len(router.graph):,} nodes loaded in {time.perf_counter() - started:.2f}s")
+
+        points = (options["lat1"], options["lon1"], options["lat2"], options["lon2"])
+        timings = []
+        for _ in range(max(1, options["repeat"])):
+            started = time.perf_counter()
+            if options["cached"]:
+                distance_km, duration_min, source = route(*points)
+            else:
+                distance_km, duration_min, source = router.route(*points)
+            timings.append(time.perf_counter() - started)
+
+        if distance_km is None:
+            self.stderr.write(f"{router.name}: no route found")
+        else:
+            self.stdout.write(f"{source}: {distance_km:.2f} km, {duration_min:.1f} min")
+        timings.sort()
+        self.stdout.write(
+            f"{len(timings)} queries: median {timings[len(timings) // 2] * 1000:.2f} ms, "
+            f"max {timings[-1] * 1000:.2f} ms"
+        )
+        if options["cached"]:
+            self.stdout.write(f"cache: {route_cache.stats()}")
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:43
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('backend', models.CharField(max_length=20)),
+                ('origin_cell', models.CharField(max_length=12)),
+                ('destination_cell', models.CharField(max_length=12)),
+                ('distance_km', models.FloatField()),
+                ('duration_min', models.FloatField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['created_at'], name='routing_rou_created_e918ee_idx')],
+                'constraints': [models.UniqueConstraint(fields=('backend', 'origin_cell', 'destination_cell'), name='route_cache_entry_cells')],
+            },
+        ),
+    ]
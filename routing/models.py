@@ -0,0 +1,25 @@
+from django.db import models
+from django.utils import timezone
+
+
+class RouteCacheEntry(models.Model):
+    """Persistent tier of routing.cache: one routed answer per backend and origin/destination cell pair."""
+
+    backend = models.CharField(max_length=20)
+    origin_cell = models.CharField(max_length=12)
+    destination_cell = models.CharField(max_length=12)
+    distance_km = models.FloatField()
+    duration_min = models.FloatField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["backend", "origin_cell", "destination_cell"],
+                name="route_cache_entry_cells",
+            )
+        ]
+        indexes = [models.Index(fields=["created_at"])]
+
+    def __str__(self):
+        return f"{self.backend} {self.origin_cell} -> {self.destination_cell}: {self.distance_km:.2f} km"
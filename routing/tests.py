@@ -0,0 +1,312 @@
+import asyncio
+import heapq
+import io
+import math
+import random
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone as django_timezone
+
+import routing
+from rides.utils import haversine_distance
+from routing.backends.local import HIGHWAY_SPEEDS, RoadGraph
+from routing.backends.osrm import OSRMRouter
+from routing.cache import RouteCache
+from routing.client import CircuitBreaker, OSRMClient, RoutingUnavailable
+from routing.management.commands.osrm_standin import StandInOSRM
+from routing.models import RouteCacheEntry
+
+
+KOCHI, ALUVA = (9.9816, 76.2999), (10.1004, 76.3570)
+NEAR_KOCHI = (9.98161, 76.29991)  # ~1.5m away, same precision-7 cell
+EDAPPALLY = (10.0261, 76.3083)
+
+
+class StandInTestCase(SimpleTestCase):
+    """Runs a StandInOSRM on an ephemeral local port for each test."""
+
+    def start_server(self, **options):
+        server = StandInOSRM(("127.0.0.1", 0), **options)
+        thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def client_for(self, server, **options):
+        options.setdefault("backoff", 0.0)
+        client = OSRMClient(f"http://127.0.0.1:{server.server_address[1]}", **options)
+        self.addCleanup(client.session.close)
+        return client
+
+
+class OSRMClientTests(StandInTestCase):
+    def test_route_and_table(self):
+        client = self.client_for(self.start_server())
+        distance_km, duration_min = client.route(*KOCHI, *ALUVA)
+        self.assertGreater(distance_km, 10)
+        self.assertAlmostEqual(duration_min, distance_km / 40 * 60)
+
+        durations, distances = client.table([KOCHI], [ALUVA, KOCHI])
+        self.assertAlmostEqual(distances[0][0], distance_km)
+        self.assertEqual(distances[0][1], 0.0)
+
+    def test_retries_recover_from_server_errors(self):
+        server = self.start_server(fail_first=2)
+        client = self.client_for(server, retries=2)
+        self.assertIsNotNone(client.route(*KOCHI, *ALUVA))
+        self.assertEqual(server.requests_served, 3)
+        self.assertEqual(client.breaker.state, CircuitBreaker.CLOSED)
+
+    async def test_async_route_retries_and_counts_once(self):
+        server = self.start_server(fail_first=1)
+        client = self.client_for(server, retries=1)
+        self.assertIsNotNone(await client.aroute(*KOCHI, *ALUVA))
+        server.fail_rate = 1.0
+        with self.assertRaises(RoutingUnavailable):
+            await client.aroute(*KOCHI, *ALUVA)
+        self.assertEqual(server.requests_served, 4)
+        self.assertEqual(client.breaker._failures, 1)
+
+    def test_async_client_is_closed_with_its_loop(self):
+        client = self.client_for(self.start_server())
+
+        async def call():
+            await client.aroute(*KOCHI, *ALUVA)
+            return client._async_client()
+
+        # each async view under WSGI runs on a fresh loop like this one
+        clients = [asyncio.run(call()) for _ in range(3)]
+        self.assertEqual(len(set(map(id, clients))), 3)
+        self.assertTrue(all(http.is_closed for http in clients))
+        self.assertEqual((client._async_clients, client._closers), ({}, {}))
+
+    def test_failed_call_counts_once_towards_the_breaker(self):
+        server = self.start_server(fail_rate=1.0)
+        client = self.client_for(server, retries=2, breaker_threshold=2)
+        with self.assertRaises(RoutingUnavailable):
+            client.route(*KOCHI, *ALUVA)
+        self.assertEqual(server.requests_served, 3)
+        self.assertEqual(client.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_deadline_budget_covers_every_attempt(self):
+        server = self.start_server(delay=0.5)
+        client = self.client_for(server, retries=5)
+        started = time.monotonic()
+        with self.assertRaises(RoutingUnavailable):
+            client.route(*KOCHI, *ALUVA, budget=0.2)
+        self.assertLess(time.monotonic() - started, 0.45)
+        self.assertEqual(server.requests_served, 1)
+
+    def test_breaker_opens_then_half_opens(self):
+        server = self.start_server(fail_rate=1.0)
+        client = self.client_for(server, retries=0, breaker_threshold=2, breaker_reset=0.2)
+        for _ in range(2):
+            with self.assertRaises(RoutingUnavailable):
+                client.route(*KOCHI, *ALUVA)
+        self.assertEqual(client.breaker.state, CircuitBreaker.OPEN)
+
+        # open: fails fast without reaching the server
+        with self.assertRaisesMessage(RoutingUnavailable, "circuit open"):
+            client.route(*KOCHI, *ALUVA)
+        self.assertEqual(server.requests_served, 2)
+
+        # half-open: a failed trial opens it again
+        time.sleep(0.25)
+        self.assertEqual(client.breaker.state, CircuitBreaker.HALF_OPEN)
+        with self.assertRaises(RoutingUnavailable):
+            client.route(*KOCHI, *ALUVA)
+        self.assertEqual(client.breaker.state, CircuitBreaker.OPEN)
+
+        # half-open: a successful trial closes it
+        server.fail_rate = 0.0
+        time.sleep(0.25)
+        self.assertIsNotNone(client.route(*KOCHI, *ALUVA))
+        self.assertEqual(client.breaker.state, CircuitBreaker.CLOSED)
+
+    async def test_cancelled_trial_does_not_wedge_the_breaker(self):
+        server = self.start_server(fail_rate=1.0)
+        client = self.client_for(server, retries=0, breaker_threshold=1, breaker_reset=0.2)
+        with self.assertRaises(RoutingUnavailable):
+            await client.aroute(*KOCHI, *ALUVA)
+        await asyncio.sleep(0.25)
+        self.assertEqual(client.breaker.state, CircuitBreaker.HALF_OPEN)
+
+        # the half-open trial is cancelled mid-request, as when a client disconnects
+        server.fail_rate, server.delay = 0.0, 0.5
+        trial = asyncio.ensure_future(client.aroute(*KOCHI, *ALUVA))
+        await asyncio.sleep(0.1)
+        trial.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await trial
+
+        server.delay = 0.0
+        self.assertEqual(client.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertIsNotNone(await client.aroute(*KOCHI, *ALUVA))
+        self.assertEqual(client.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_unavailable_server_falls_back_to_straight_line(self):
+        server = self.start_server(fail_rate=1.0)
+        router = OSRMRouter(f"http://127.0.0.1:{server.server_address[1]}", retries=1, backoff=0.0)
+        self.addCleanup(router.client.session.close)
+        with mock.patch("routing._router", router):
+            self.assertEqual(routing.route(*KOCHI, *ALUVA, cached=False), (None, None, None))
+            distance_km, duration_min, source = routing.route(*KOCHI, *ALUVA, cached=False, fallback=True)
+        self.assertEqual(source, "haversine")
+        self.assertGreater(distance_km, 10)
+
+
+def random_city(seed, size=6, spacing_deg=0.002):
+    """OSM XML for a jittered `size` x `size` street grid with random road classes,
+    one-way streets and missing blocks, plus a two-node road far away."""
+    rnd = random.Random(seed)
+    nodes, ways = [], []
+    for i in range(size * size):
+        row, col = divmod(i, size)
+        nodes.append((i + 1, 9.98 + row * spacing_deg + rnd.uniform(-3e-4, 3e-4),
+                      76.28 + col * spacing_deg + rnd.uniform(-3e-4, 3e-4)))
+    classes = sorted(HIGHWAY_SPEEDS)
+    for i in range(size * size):
+        row, col = divmod(i, size)
+        for j in ([i + 1] if col + 1 < size else []) + ([i + size] if row + 1 < size else []):
+            if rnd.random() < 0.15:
+                continue
+            oneway = rnd.choice(["no", "no", "yes", "-1"])
+            ways.append(([i + 1, j + 1], rnd.choice(classes), oneway))
+    island = len(nodes) + 1
+    nodes += [(island, 10.5, 76.9), (island + 1, 10.501, 76.9)]
+    ways.append(([island, island + 1], "residential", "no"))
+
+    xml = ["<osm>"]
+    xml += [f'<node id="{n}" lat="{lat}" lon="{lon}"/>' for n, lat, lon in nodes]
+    for k, (refs, highway, oneway) in enumerate(ways):
+        xml.append(f'<way id="{k + 1}">' + "".join(f'<nd ref="{r}"/>' for r in refs)
+                   + f'<tag k="highway" v="{highway}"/><tag k="oneway" v="{oneway}"/></way>')
+    xml.append("</osm>")
+    return io.BytesIO("".join(xml).encode())
+
+
+def dijkstra(graph, source):
+    """{node: (seconds, meters)} of the fastest paths from `source`, by plain Dijkstra."""
+    best = {source: (0.0, 0.0)}
+    heap = [(0.0, 0.0, source)]
+    done = set()
+    while heap:
+        seconds, meters, u = heapq.heappop(heap)
+        if u in done:
+            continue
+        done.add(u)
+        for v, cost, length in graph.out_edges[u]:
+            if seconds + cost < best.get(v, (math.inf,))[0]:
+                best[v] = (seconds + cost, meters + length)
+                heapq.heappush(heap, (seconds + cost, meters + length, v))
+    return best
+
+
+class RoadGraphTests(SimpleTestCase):
+    def assertSamePath(self, got, expected):
+        if expected is None:
+            self.assertIsNone(got)
+        else:
+            self.assertIsNotNone(got)
+            self.assertAlmostEqual(got[0], expected[0], places=6)
+            self.assertAlmostEqual(got[1], expected[1], places=6)
+
+    def test_bidirectional_astar_matches_dijkstra(self):
+        for seed in range(5):
+            graph = RoadGraph.from_osm(random_city(seed))
+            reference = [dijkstra(graph, source) for source in range(len(graph))]
+            unreachable = 0
+            for source in range(len(graph)):
+                for target in range(len(graph)):
+                    expected = reference[source].get(target)
+                    unreachable += expected is None
+                    with self.subTest(seed=seed, source=source, target=target):
+                        self.assertSamePath(graph.shortest_path(source, target), expected)
+            self.assertGreater(unreachable, 0)  # the island, at least
+            self.assertEqual(graph.shortest_path(3, 3), (0.0, 0.0))
+
+    def test_times_to_matches_dijkstra(self):
+        for seed in range(5):
+            graph = RoadGraph.from_osm(random_city(seed))
+            reference = [dijkstra(graph, source) for source in range(len(graph))]
+            sources = list(range(len(graph)))
+            for target in sources:
+                found = graph.times_to(target, sources)
+                for source in sources:
+                    with self.subTest(seed=seed, source=source, target=target):
+                        self.assertSamePath(found.get(source), reference[source].get(target))
+
+
+class PairRouter:
+    """Answers with the straight-line distance of the exact pair asked, counting calls."""
+
+    name = "pairs"
+
+    def __init__(self):
+        self.calls = 0
+
+    def route(self, lat1, lon1, lat2, lon2):
+        self.calls += 1
+        distance_km = haversine_distance(lat1, lon1, lat2, lon2)
+        return distance_km, distance_km * 1.5, self.name
+
+
+@override_settings(ROUTE_CACHE_PRECISION=7, ROUTE_CACHE_MAX_ENTRIES=2, ROUTE_CACHE_TTL=60)
+class RouteCacheTests(TestCase):
+    def setUp(self):
+        self.router = PairRouter()
+        self.cache = RouteCache()
+
+    def lookup(self, origin, destination, cache=None):
+        return (cache or self.cache).get_or_route(self.router, *origin, *destination)
+
+    def test_lru_evicts_the_least_recently_used_entry(self):
+        self.lookup(KOCHI, ALUVA)
+        self.lookup(KOCHI, EDAPPALLY)
+        self.lookup(KOCHI, ALUVA)  # now the most recent
+        self.lookup(ALUVA, EDAPPALLY)
+        self.assertEqual(list(self.cache._entries), [
+            self.cache.key("pairs", *KOCHI, *ALUVA), self.cache.key("pairs", *ALUVA, *EDAPPALLY),
+        ])
+        self.assertEqual((self.router.calls, self.cache.memory_hits), (3, 1))
+
+    def test_lru_miss_falls_through_to_the_database(self):
+        expected = self.lookup(KOCHI, ALUVA)
+        self.assertEqual(RouteCacheEntry.objects.count(), 1)
+
+        other_worker = RouteCache()
+        self.assertEqual(self.lookup(KOCHI, ALUVA, other_worker), expected)
+        self.assertEqual((self.router.calls, other_worker.db_hits), (1, 1))
+        # the DB hit is promoted to that worker's LRU
+        self.assertEqual(self.lookup(KOCHI, ALUVA, other_worker), expected)
+        self.assertEqual(other_worker.memory_hits, 1)
+
+    def test_entries_expire_after_the_ttl_in_both_tiers(self):
+        self.lookup(KOCHI, ALUVA)
+        later_wall = django_timezone.now() + timedelta(seconds=61)
+        later_clock = time.monotonic() + 61
+        with mock.patch("routing.cache.time.monotonic", return_value=later_clock), \
+                mock.patch("routing.cache.timezone.now", return_value=later_wall):
+            self.lookup(KOCHI, ALUVA)
+        self.assertEqual((self.router.calls, self.cache.misses), (2, 2))
+
+    def test_keys_snap_to_cells_and_keep_direction(self):
+        kochi_aluva = self.lookup(KOCHI, ALUVA)
+        self.assertEqual(self.lookup(NEAR_KOCHI, ALUVA), kochi_aluva)
+        self.assertEqual(self.router.calls, 1)
+
+        aluva_kochi = self.lookup(ALUVA, KOCHI)
+        self.assertEqual(self.router.calls, 2)
+        self.assertAlmostEqual(aluva_kochi[0], kochi_aluva[0])
+        self.assertNotAlmostEqual(self.lookup(KOCHI, EDAPPALLY)[0], kochi_aluva[0])
+        self.assertEqual(self.router.calls, 3)
+
+    def test_failed_lookups_are_not_cached(self):
+        self.router.route = lambda *points: (None, None, None)
+        self.lookup(KOCHI, ALUVA)
+        self.assertEqual((len(self.cache._entries), RouteCacheEntry.objects.count()), (0, 0))
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-16 21:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicles', '0002_auto_20250829_2243'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vehicle',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='vehicle',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -56,6 +56,9 @@ class Vehicle(models.Model):
     
     verified = models.BooleanField(default=False)
     active = models.BooleanField(default=True)
+    # running totals of Rating scores for rides in this vehicle, bumped with F() as ratings arrive
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -65,6 +68,10 @@ class Vehicle(models.Model):
     def __str__(self):
         return f"{self.make} {self.model} ({self.registration_number})"
 
+    @property
+    def average_rating(self):
+        return self.rating_sum / self.rating_count if self.rating_count else None
+
 class VehicleImage(models.Model):
     vehicle = models.ForeignKey(Vehicle, on_delete=models.CASCADE, related_name="images")
     image = models.ImageField(upload_to="vehicle_images/")